@@ -1,32 +1,182 @@
-from nornir import InitNornir
-from nornir_utils.plugins.functions import print_result
-from nornir_netmiko import netmiko_send_config
 import os
 import logging
 import argparse
+import math
+import time
 from datetime import datetime
-import socks
-import socket
 import sys
 
+from metrics import HostMetrics, MetricsCollector
+from template_cache import TemplateCache
+from template_matcher import TemplateResolver
+
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
-def global_config(task, config):
+def global_config(task, config, metrics=None, template_resolver=None, verify_log=None):
+    """Push a missing config file to the current host
+
+    With a template_resolver the interfaces in the file are fetched again
+    over the same session and checked against their templates, the outcome
+    goes to verify_log[host], see verify_pushed_config().
+    """
+    from nornir_netmiko import netmiko_send_config
+    from nornir_utils.plugins.functions import print_result
+
+    host_metrics = HostMetrics(task.host.name)
     try:
-        r = task.run(
-            netmiko_send_config, 
-            name='Apply Missing Config', 
-            config_file=config, 
-            read_timeout=0
-        )
+        with host_metrics.phase('connect'):
+            task.host.get_connection("netmiko", task.nornir.config)
+        with host_metrics.phase('push'):
+            r = task.run(
+                netmiko_send_config, 
+                name='Apply Missing Config', 
+                config_file=config, 
+                read_timeout=0
+            )
         print_result(r)
+        if template_resolver is not None:
+            entry = verify_pushed_config(task, config, template_resolver, host_metrics.phase)
+            if verify_log is not None:
+                verify_log[task.host.name] = entry
         return "Success"
     except Exception as e:
+        host_metrics.failed = True
         logger.error("Error applying config to {}: {}".format(task.host, str(e)))
         return "Failed: {}".format(str(e))
+    finally:
+        if metrics is not None:
+            metrics.add(host_metrics)
+
+def verify_pushed_config(task, config, template_resolver, phase):
+    """Check the interfaces of a pushed config file again, returns {'interfaces', 'still_non_compliant', 'error'}
+
+    Only "show running-config interface <x>" of the interfaces in the file
+    is fetched. An interface that is still non-compliant, or whose template
+    no longer matches, is listed in still_non_compliant.
+    """
+    # interface_compliance_check imports this module
+    from interface_compliance_check import pushed_interfaces, still_non_compliant, verify_interfaces
+
+    with open(config, 'r') as f:
+        interfaces = pushed_interfaces(f.read().splitlines())
+    entry = {'interfaces': interfaces, 'still_non_compliant': [], 'error': None}
+    try:
+        verified = verify_interfaces(task, interfaces, template_resolver, phase)
+    except Exception as e:
+        logger.error("Error verifying config on {}: {}".format(task.host, str(e)))
+        entry['error'] = str(e)
+        return entry
+    entry['still_non_compliant'] = still_non_compliant(interfaces, verified)
+    if entry['still_non_compliant']:
+        logger.warning("{} still non-compliant after push: {}".format(
+            task.host, ", ".join(entry['still_non_compliant'])))
+    return entry
+
+def rollout_config(task, config_files, metrics=None, template_resolver=None, verify_log=None):
+    """Apply the missing config file of the current host"""
+    return global_config(task, config_files[task.host.name], metrics, template_resolver, verify_log)
+
+def unverified_hosts(verify_log):
+    """{host: still non-compliant interfaces or error} of the hosts whose verification failed"""
+    return {host: entry['error'] or entry['still_non_compliant'] for host, entry in verify_log.items()
+            if entry['error'] or entry['still_non_compliant']}
+
+def collect_config_files(nr, config_dir):
+    """Map inventory hosts to their missing config files, returns (config_files, skipped_hosts)"""
+    config_files = {}
+    skipped_hosts = []
+    for filename in sorted(os.listdir(config_dir)):
+        if filename.endswith("_missing_config.txt"):
+            hostname = filename.split("_missing_config.txt")[0]
+            if hostname not in nr.inventory.hosts:
+                logger.warning("Host {} not found in inventory. Skipping.".format(hostname))
+                skipped_hosts.append(hostname)
+                continue
+            config_files[hostname] = os.path.join(config_dir, filename)
+    return config_files, skipped_hosts
+
+def plan_waves(hosts, canary_size=1, growth=2.0):
+    """Split hosts into a canary wave followed by waves growing by the given factor"""
+    waves = []
+    size = max(1, canary_size)
+    start = 0
+    while start < len(hosts):
+        waves.append(hosts[start:start + size])
+        start += size
+        size = max(size, int(math.ceil(size * growth)))
+    return waves
+
+def apply_missing_configs_in_waves(nr, config_dir, dry_run=False, workers=10, canary_size=1, growth=2.0,
+                                   max_failure_rate=0.2, metrics=None, template_resolver=None, verify_log=None):
+    """Apply missing configs in parallel, staged in waves
+
+    The first wave is a small canary batch, every following wave is larger
+    by the growth factor. Hosts of a wave are configured concurrently with
+    the given number of workers. If more than max_failure_rate of a wave
+    fails, the rollout stops and the remaining hosts are not touched.
+    With a template_resolver every host is verified right after its push,
+    see global_config().
+
+    Returns (success_hosts, failed_hosts, skipped_hosts, not_attempted_hosts, waves)
+    """
+    from nornir.plugins.runners import ThreadedRunner
 
-def apply_missing_configs(nr, config_dir, dry_run=False):
+    success_hosts = []
+    failed_hosts = []
+    not_attempted_hosts = []
+    waves = []
+
+    config_files, skipped_hosts = collect_config_files(nr, config_dir)
+    planned_waves = plan_waves(list(config_files), canary_size, growth)
+    runner = ThreadedRunner(num_workers=workers)
+
+    for number, wave in enumerate(planned_waves, 1):
+        logger.info("Wave {}/{}: applying missing config to {} hosts".format(number, len(planned_waves), len(wave)))
+        started = time.monotonic()
+        wave_success = []
+        wave_failed = []
+
+        if dry_run:
+            for hostname in wave:
+                logger.info("DRY RUN: Would apply config from {} to {}".format(config_files[hostname], hostname))
+            wave_success = list(wave)
+        else:
+            wave_hosts = set(wave)
+            wave_nr = nr.filter(filter_func=lambda host: host.name in wave_hosts).with_runner(runner)
+            result = wave_nr.run(task=rollout_config, config_files=config_files, metrics=metrics,
+                                 template_resolver=template_resolver, verify_log=verify_log)
+            for hostname in wave:
+                if not result[hostname].failed and result[hostname][0].result == "Success":
+                    wave_success.append(hostname)
+                else:
+                    logger.error("Failed to apply config to {}: {}".format(hostname, result[hostname][0].result))
+                    wave_failed.append(hostname)
+
+        duration = time.monotonic() - started
+        failure_rate = len(wave_failed) / len(wave)
+        success_hosts.extend(wave_success)
+        failed_hosts.extend(wave_failed)
+        waves.append({
+            'number': number,
+            'hosts': len(wave),
+            'succeeded': len(wave_success),
+            'failed': len(wave_failed),
+            'failure_rate': failure_rate,
+            'duration': duration,
+        })
+        logger.info("Wave {} done in {:.1f}s: {} succeeded, {} failed".format(
+            number, duration, len(wave_success), len(wave_failed)))
+
+        if failure_rate > max_failure_rate:
+            not_attempted_hosts = [host for later in planned_waves[number:] for host in later]
+            logger.error("Failure rate {:.0%} of wave {} exceeds {:.0%}, stopping rollout. {} hosts not attempted.".format(
+                failure_rate, number, max_failure_rate, len(not_attempted_hosts)))
+            break
+
+    return success_hosts, failed_hosts, skipped_hosts, not_attempted_hosts, waves
+
+def apply_missing_configs(nr, config_dir, dry_run=False, metrics=None, template_resolver=None, verify_log=None):
     success_hosts = []
     failed_hosts = []
     skipped_hosts = []
@@ -51,7 +201,8 @@ def apply_missing_configs(nr, config_dir, dry_run=False):
                 continue
 
             logger.info("Applying missing config to {}".format(hostname))
-            result = host_nr.run(task=global_config, config=config_file)
+            result = host_nr.run(task=global_config, config=config_file, metrics=metrics,
+                                 template_resolver=template_resolver, verify_log=verify_log)
             
             if result[hostname][0].result == "Success":
                 logger.info("Successfully applied config to {}".format(hostname))
@@ -62,7 +213,8 @@ def apply_missing_configs(nr, config_dir, dry_run=False):
 
     return success_hosts, failed_hosts, skipped_hosts
 
-def generate_summary(success_hosts, failed_hosts, skipped_hosts, config_dir, dry_run):
+def generate_summary(success_hosts, failed_hosts, skipped_hosts, config_dir, dry_run, waves=None,
+                     not_attempted_hosts=None, metrics=None, unverified_hosts=None):
     now = datetime.now()
     summary_file = "config_application_summary_{}.txt".format(now.strftime('%Y%m%d_%H%M%S'))
     
@@ -83,12 +235,38 @@ def generate_summary(success_hosts, failed_hosts, skipped_hosts, config_dir, dry
         f.write("\nSkipped Hosts ({}):\n".format(len(skipped_hosts)))
         for host in skipped_hosts:
             f.write("- {}\n".format(host))
+
+        if unverified_hosts:
+            f.write("\nStill Non-Compliant After Push ({}):\n".format(len(unverified_hosts)))
+            for host, interfaces in unverified_hosts.items():
+                if isinstance(interfaces, str):
+                    f.write("- {}: verification failed: {}\n".format(host, interfaces))
+                else:
+                    f.write("- {}: {}\n".format(host, ", ".join(interfaces)))
+
+        if not_attempted_hosts:
+            f.write("\nNot Attempted, Rollout Stopped ({}):\n".format(len(not_attempted_hosts)))
+            for host in not_attempted_hosts:
+                f.write("- {}\n".format(host))
+
+        if waves:
+            f.write("\nRollout Waves ({}):\n".format(len(waves)))
+            for wave in waves:
+                f.write("- Wave {}: {} hosts, {} succeeded, {} failed ({:.0%}), {:.1f}s\n".format(
+                    wave['number'], wave['hosts'], wave['succeeded'], wave['failed'],
+                    wave['failure_rate'], wave['duration']))
+
+        if metrics is not None and metrics.hosts:
+            f.write("\n{}\n".format("\n".join(metrics.summary())))
     
     return summary_file
 
 def configure_proxy(host="127.0.0.1", port=1084, enabled=True):
     """Configure SOCKS5 proxy settings"""
     if enabled:
+        import socket
+        import socks
+
         try:
             socks.setdefaultproxy(socks.PROXY_TYPE_SOCKS5, host, port)
             socket.socket = socks.socksocket
@@ -99,18 +277,36 @@ def configure_proxy(host="127.0.0.1", port=1084, enabled=True):
     return True
 
 
-def main():
-    parser = argparse.ArgumentParser(description="Apply missing configurations to network devices")
+def main(argv=None, prog=None):
+    parser = argparse.ArgumentParser(prog=prog, description="Apply missing configurations to network devices")
     parser.add_argument("-c", "--config", default="config.yaml", help="Path to the Nornir config file (default: config.yaml)")
     parser.add_argument("-d", "--config-dir", default="missing_configs", help="Directory containing the missing config files (default: missing_configs)")
     parser.add_argument("--dry-run", action="store_true", help="Perform a dry run without applying configurations")
 
+    # Parallel rollout in waves
+    parser.add_argument("--parallel", action="store_true", help="Apply configs concurrently in waves (canary first, then growing batches)")
+    parser.add_argument("--workers", type=int, default=10, help="Concurrent hosts per wave with --parallel (default: 10)")
+    parser.add_argument("--canary-size", type=int, default=1, help="Number of hosts in the first wave (default: 1)")
+    parser.add_argument("--wave-growth", type=float, default=2.0, help="Growth factor of each following wave (default: 2.0)")
+    parser.add_argument("--max-failure-rate", type=float, default=0.2, help="Stop the rollout when more than this fraction of a wave fails (default: 0.2)")
+
+    # Verification after the push
+    parser.add_argument("--verify", action="store_true", help="After each push, fetch the touched interfaces again and check them against their templates")
+    parser.add_argument("-t", "--templates", default="interface_templates", help="Interface templates directory for --verify (default: interface_templates)")
+
+    # Phase timing
+    parser.add_argument("--metrics-file", help="JSON Lines file with the phase timing per host (default: apply_metrics_<timestamp>.jsonl)")
+    parser.add_argument("--prometheus-file", default="interface_compliance_apply.prom", help="Prometheus textfile collector file (default: interface_compliance_apply.prom)")
+
     # Optional SOCKS5 proxy settigs
     parser.add_argument("--proxy-enabled", action="store_true", help="Enable SOCKS5 proxy")
     parser.add_argument("--proxy-host", default="127.0.0.1", help="Proxy host (default: 127.0.0.1)")
     parser.add_argument("--proxy-port", type=int, default=1084, help="Proxy port (default: 1084)")
 
-    args = parser.parse_args()
+    args = parser.parse_args(argv)
+
+    # Imported here, so --help and the summary functions do not load nornir
+    from nornir import InitNornir
 
     nr = InitNornir(config_file=args.config)
 
@@ -124,14 +320,46 @@ def main():
 
     
     
-    success_hosts, failed_hosts, skipped_hosts = apply_missing_configs(nr, args.config_dir, args.dry_run)
+    template_resolver = None
+    verify_log = {}
+    if args.verify and not args.dry_run:
+        _, templates, errors = TemplateCache().templates(args.templates)
+        for error in errors:
+            logger.error(error)
+        template_resolver = TemplateResolver(templates)
+
+    waves = None
+    not_attempted_hosts = None
+    metrics = MetricsCollector("apply")
+    if args.parallel:
+        success_hosts, failed_hosts, skipped_hosts, not_attempted_hosts, waves = apply_missing_configs_in_waves(
+            nr, args.config_dir, args.dry_run, workers=args.workers, canary_size=args.canary_size,
+            growth=args.wave_growth, max_failure_rate=args.max_failure_rate, metrics=metrics,
+            template_resolver=template_resolver, verify_log=verify_log)
+    else:
+        success_hosts, failed_hosts, skipped_hosts = apply_missing_configs(nr, args.config_dir, args.dry_run,
+                                                                           metrics=metrics,
+                                                                           template_resolver=template_resolver,
+                                                                           verify_log=verify_log)
     
-    summary_file = generate_summary(success_hosts, failed_hosts, skipped_hosts, args.config_dir, args.dry_run)
+    unverified = unverified_hosts(verify_log)
+    summary_file = generate_summary(success_hosts, failed_hosts, skipped_hosts, args.config_dir, args.dry_run,
+                                    waves, not_attempted_hosts, metrics, unverified)
+
+    if metrics.hosts:
+        metrics_file = args.metrics_file or "apply_metrics_{}.jsonl".format(datetime.now().strftime('%Y%m%d_%H%M%S'))
+        metrics.write_jsonl(metrics_file)
+        metrics.write_prometheus(args.prometheus_file)
+        logger.info("Phase timing per host saved to: {} and {}".format(metrics_file, args.prometheus_file))
     
     logger.info("\nSummary report saved to: {}".format(summary_file))
     logger.info("Successful hosts: {}".format(len(success_hosts)))
     logger.info("Failed hosts: {}".format(len(failed_hosts)))
     logger.info("Skipped hosts: {}".format(len(skipped_hosts)))
+    if not_attempted_hosts:
+        logger.info("Hosts not attempted: {}".format(len(not_attempted_hosts)))
+    if template_resolver is not None:
+        logger.info("Verified hosts: {}, still non-compliant: {}".format(len(verify_log), len(unverified)))
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
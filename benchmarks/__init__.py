@@ -0,0 +1 @@
+"""Benchmarks and a synthetic fleet generator for the compliance checker"""
@@ -0,0 +1,123 @@
+"""Micro-benchmark: compiled TemplateMatcher vs. the old nested startswith loops
+
+Checks a 48-port access switch config (every port on a template, some
+drift) and prints the time per switch for both implementations.
+
+    python benchmarks/bench_template_matcher.py [-t interface_templates] [-n 200]
+"""
+import argparse
+import os
+import random
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+
+from interface_compliance_check import parse_intf_template_files_individually  # noqa: E402
+from template_matcher import compile_templates  # noqa: E402
+
+
+def legacy_check_interface_compliance(config, required_commands, additional_allowed_commands=None):
+    """The nested loop implementation the matcher replaced, kept as reference"""
+    if additional_allowed_commands is None:
+        additional_allowed_commands = []
+
+    standard_commands = [cmd for cmd in required_commands if not cmd.startswith('-')]
+    remove_commands = [cmd[1:].strip() for cmd in required_commands if cmd.startswith('-')]
+
+    found_commands = set()
+    unexpected_commands = []
+    commands_to_remove = []
+
+    for line in config.split('\n'):
+        line = line.strip()
+        if not line or line.startswith('interface'):
+            continue
+
+        matched_required = False
+        for cmd in standard_commands:
+            if line.startswith(cmd):
+                found_commands.add(cmd)
+                matched_required = True
+                break
+
+        matched_allowed = False
+        if not matched_required:
+            for cmd in additional_allowed_commands:
+                if line.startswith(cmd):
+                    matched_allowed = True
+                    break
+
+        matched_remove = False
+        for cmd in remove_commands:
+            if line.startswith(cmd):
+                commands_to_remove.append(cmd)
+                matched_remove = True
+                break
+
+        if not (matched_required or matched_allowed or matched_remove):
+            unexpected_commands.append(line)
+
+    missing_commands = set(standard_commands) - found_commands
+    return missing_commands, unexpected_commands, commands_to_remove
+
+
+def build_ports(parsed_templates, ports=48, drift=0.2, seed=1):
+    """48 ports as (template name, config lines), some with missing or extra lines"""
+    rng = random.Random(seed)
+    names = sorted(parsed_templates)
+    result = []
+    for _ in range(ports):
+        name = rng.choice(names)
+        template = parsed_templates[name]
+        lines = [" " + cmd for cmd in template['required'] if not cmd.startswith('-')]
+        lines += [" " + cmd for cmd in template['additional_allowed'] if rng.random() < 0.5]
+        if lines and rng.random() < drift:
+            lines.pop(rng.randrange(len(lines)))
+        if rng.random() < drift:
+            lines.append(" switchport nonegotiate")
+        result.append((name, lines))
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the compiled template matcher")
+    parser.add_argument("-t", "--templates", default="interface_templates", help="Interface templates directory")
+    parser.add_argument("-n", "--number", type=int, default=200, help="Switches per measurement (default: 200)")
+    args = parser.parse_args()
+
+    parsed_templates, errors = parse_intf_template_files_individually(args.templates)
+    if errors or not parsed_templates:
+        sys.exit("\n".join(errors) or "No templates found in {}".format(args.templates))
+
+    compiled = compile_templates(parsed_templates)
+    ports = build_ports(parsed_templates)
+    joined = [(name, "\n".join(lines)) for name, lines in ports]
+
+    # Both implementations must agree before timing them
+    for (name, lines), (_, config) in zip(ports, joined):
+        missing, unexpected, to_remove = compiled[name].evaluate(lines)
+        template = parsed_templates[name]
+        expected = legacy_check_interface_compliance(config, template['required'], template['additional_allowed'])
+        assert (set(missing), unexpected, to_remove) == expected, name
+
+    def run_legacy():
+        for name, config in joined:
+            template = parsed_templates[name]
+            legacy_check_interface_compliance(config, template['required'], template['additional_allowed'])
+
+    def run_matcher():
+        for name, lines in ports:
+            compiled[name].evaluate(lines)
+
+    legacy = min(timeit.repeat(run_legacy, number=args.number, repeat=5)) / args.number
+    matcher = min(timeit.repeat(run_matcher, number=args.number, repeat=5)) / args.number
+
+    print("48-port switch, {} templates".format(len(parsed_templates)))
+    print("nested loops:     {:8.1f} us/switch".format(legacy * 1e6))
+    print("TemplateMatcher:  {:8.1f} us/switch".format(matcher * 1e6))
+    print("speedup:          {:8.1f}x".format(legacy / matcher))
+
+
+if __name__ == "__main__":
+    main()
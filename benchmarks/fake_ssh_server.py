@@ -0,0 +1,273 @@
+"""Fake Cisco IOS SSH servers for live runs without devices
+
+Every host gets its own port on 127.0.0.1 and answers the commands the
+checker and apply_missing_configs.py send: show running-config (also
+"| section <regex>" and "interface <x>"), show interfaces description,
+configure terminal and the config lines, which are recorded but not
+applied. Any login is accepted.
+The servers count concurrent and total sessions, so the limits of the
+collection scheduler can be checked from the server side.
+
+    python -m benchmarks.fake_ssh_server saved_configs --port 30000 --hosts 12 --latency 0.2
+
+serves sw00..sw11 from saved_configs/<host>.cfg (cycling over the files
+if there are fewer) and writes a matching hosts.yaml with --inventory.
+"""
+import argparse
+import os
+import re
+import socket
+import threading
+import time
+
+import paramiko
+
+HOST_KEY = paramiko.RSAKey.generate(1024)
+
+# Short names in "show interfaces description", as on Catalyst 9300/9500
+SHORT_NAMES = [
+    ('TwentyFiveGigE', 'Twe'),
+    ('TwoGigabitEthernet', 'Tw'),
+    ('FiveGigabitEthernet', 'Fi'),
+    ('TenGigabitEthernet', 'Te'),
+    ('FortyGigabitEthernet', 'Fo'),
+    ('HundredGigE', 'Hu'),
+    ('AppGigabitEthernet', 'Ap'),
+    ('GigabitEthernet', 'Gi'),
+    ('FastEthernet', 'Fa'),
+    ('Port-channel', 'Po'),
+    ('Vlan', 'Vl'),
+    ('Loopback', 'Lo'),
+]
+
+INVALID_INPUT = "                    ^\n% Invalid input detected at '^' marker."
+
+
+class SessionStats:
+    """Concurrent and total sessions of one or more FakeDevices"""
+
+    def __init__(self):
+        self.active = 0
+        self.peak = 0
+        self.logins = 0
+        self._lock = threading.Lock()
+
+    def opened(self):
+        with self._lock:
+            self.active += 1
+            self.logins += 1
+            self.peak = max(self.peak, self.active)
+
+    def closed(self):
+        with self._lock:
+            self.active -= 1
+
+
+class _Server(paramiko.ServerInterface):
+    def check_channel_request(self, kind, chanid):
+        return paramiko.OPEN_SUCCEEDED
+
+    def check_auth_password(self, username, password):
+        return paramiko.AUTH_SUCCESSFUL
+
+    def get_allowed_auths(self, username):
+        return 'password'
+
+    def check_channel_shell_request(self, channel):
+        return True
+
+    def check_channel_pty_request(self, *args):
+        return True
+
+
+class FakeDevice:
+    """One fake switch listening on a local port
+
+    latency delays every new session before the SSH handshake, like a slow
+    device or proxy. Every session is counted in each of stats, which can be
+    shared with other devices, e.g. one per site and one for all devices.
+    """
+
+    def __init__(self, name, config, port=0, latency=0.0, stats=()):
+        self.name = name
+        self.config = config
+        self.latency = latency
+        self.stats = list(stats) or [SessionStats()]
+        self.config_lines = []
+        self._socket = socket.socket()
+        self._socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self._socket.bind(('127.0.0.1', port))
+        self.port = self._socket.getsockname()[1]
+
+    def start(self):
+        self._socket.listen(50)
+        threading.Thread(target=self._accept, daemon=True).start()
+        return self
+
+    def stop(self):
+        self._socket.close()
+
+    def _accept(self):
+        while True:
+            try:
+                client, _ = self._socket.accept()
+            except OSError:
+                return
+            threading.Thread(target=self._session, args=(client,), daemon=True).start()
+
+    def _sections(self):
+        """[(top-level line, [lines of its section])] of the config"""
+        sections = []
+        for line in self.config.splitlines():
+            if not line.strip():
+                continue
+            if line.startswith(' ') and sections:
+                sections[-1][1].append(line)
+            else:
+                sections.append((line, [line]))
+        return sections
+
+    def _section(self, pattern):
+        """Output of show running-config | section <pattern>"""
+        pattern = re.compile(pattern)
+        return "\n".join("\n".join(lines) for line, lines in self._sections() if pattern.search(line))
+
+    def _interfaces(self):
+        """[(name, lines of its section)] of the interfaces in config order"""
+        return [(line.split()[1], lines) for line, lines in self._sections()
+                if line.startswith('interface ') and len(line.split()) == 2]
+
+    def _interface(self, name):
+        """Output of "show running-config interface <name>", name may be abbreviated"""
+        match = re.match(r'^([A-Za-z-]+)(\d.*)$', name)
+        for interface, lines in self._interfaces():
+            kind, number = re.match(r'^([A-Za-z-]+)(.*)$', interface).groups()
+            if match and number == match.group(2) and kind.lower().startswith(match.group(1).lower()):
+                stanza = "\n".join(lines)
+                return "Building configuration...\n\nCurrent configuration : {} bytes\n!\n{}\nend".format(
+                    len(stanza) + 1, stanza)
+        return INVALID_INPUT
+
+    def _descriptions(self):
+        """Output of show interfaces description"""
+        rows = ["{:<30} {:<14} {:<8} {}".format("Interface", "Status", "Protocol", "Description")]
+        for name, lines in self._interfaces():
+            short = name
+            for long_name, short_name in SHORT_NAMES:
+                if name.startswith(long_name) and name[len(long_name):len(long_name) + 1].isdigit():
+                    short = short_name + name[len(long_name):]
+                    break
+            description = next((line.strip()[12:] for line in lines if line.startswith(' description ')), '')
+            down = ' shutdown' in lines
+            rows.append("{:<30} {:<14} {:<8} {}".format(short, "admin down" if down else "up",
+                                                        "down" if down else "up", description).rstrip())
+        return "\n".join(rows)
+
+    def _output(self, command, mode):
+        """(output, new mode) of a command, mode is '', 'config' or 'config-if'"""
+        if command == 'show running-config':
+            return self.config.rstrip('\n'), mode
+        if command.startswith('show running-config | section '):
+            return self._section(command[len('show running-config | section '):]), mode
+        if command.startswith('show running-config interface '):
+            return self._interface(command.split()[-1]), mode
+        if command == 'show interfaces description':
+            return self._descriptions(), mode
+        if command == 'configure terminal':
+            return 'Enter configuration commands, one per line.  End with CNTL/Z.', 'config'
+        if command == 'end':
+            return '', ''
+        if mode and command:
+            self.config_lines.append(command)
+            if command.startswith('interface'):
+                return '', 'config-if'
+            if command == 'exit':
+                return '', 'config'
+        return '', mode
+
+    def _session(self, client):
+        time.sleep(self.latency)
+        transport = paramiko.Transport(client)
+        transport.add_server_key(HOST_KEY)
+        try:
+            transport.start_server(server=_Server())
+            channel = transport.accept(20)
+        except (paramiko.SSHException, EOFError, OSError):
+            transport.close()
+            return
+        if channel is None:
+            transport.close()
+            return
+
+        for stats in self.stats:
+            stats.opened()
+        mode = ''
+
+        def prompt():
+            return self.name + ('({})#'.format(mode) if mode else '#')
+
+        buffer = b''
+        try:
+            channel.sendall(('\r\n' + prompt()).encode())
+            while True:
+                data = channel.recv(65535)
+                if not data:
+                    break
+                buffer += data
+                while b'\n' in buffer or b'\r' in buffer:
+                    end = min(index for index in (buffer.find(b'\n'), buffer.find(b'\r')) if index >= 0)
+                    line = buffer[:end].decode()
+                    buffer = buffer[end + 1:]
+                    if buffer.startswith(b'\n'):
+                        buffer = buffer[1:]
+                    output, mode = self._output(line.strip(), mode)
+                    if output:
+                        output = output.replace('\n', '\r\n') + '\r\n'
+                    channel.sendall((line + '\r\n' + output + prompt()).encode())
+        except (OSError, EOFError, paramiko.SSHException):
+            pass
+        finally:
+            for stats in self.stats:
+                stats.closed()
+            transport.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fake Cisco IOS SSH servers serving saved running-configs")
+    parser.add_argument("configs", help="Directory with saved running-configs (<host>.cfg)")
+    parser.add_argument("--port", type=int, default=30000, help="Port of the first host (default: 30000)")
+    parser.add_argument("--hosts", type=int, help="Number of hosts (default: one per config file)")
+    parser.add_argument("--latency", type=float, default=0.0, help="Delay of every new session in seconds (default: 0)")
+    parser.add_argument("--inventory", help="Write a Nornir hosts.yaml for the served hosts to this file")
+    args = parser.parse_args()
+
+    config_files = sorted(name for name in os.listdir(args.configs) if name.endswith('.cfg'))
+    if not config_files:
+        parser.error("no .cfg files in {}".format(args.configs))
+    stats = SessionStats()
+    devices = []
+    for index in range(args.hosts or len(config_files)):
+        with open(os.path.join(args.configs, config_files[index % len(config_files)])) as f:
+            config = f.read()
+        devices.append(FakeDevice("sw{:02d}".format(index), config, args.port + index, args.latency, [stats]).start())
+
+    if args.inventory:
+        with open(args.inventory, 'w') as f:
+            for device in devices:
+                f.write("{}:\n  hostname: 127.0.0.1\n  port: {}\n  platform: cisco_ios\n"
+                        "  username: admin\n  password: admin\n".format(device.name, device.port))
+
+    print("Serving {} fake devices on ports {}-{}".format(len(devices), devices[0].port, devices[-1].port),
+          flush=True)
+    try:
+        while True:
+            time.sleep(5)
+            print("sessions: {} active, peak {}, {} logins, {} config lines received".format(
+                stats.active, stats.peak, stats.logins, sum(len(device.config_lines) for device in devices)),
+                flush=True)
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+"""Synthetic IOS running-configs for benchmarks and offline tests
+
+Every switch gets a stack of 48-port members (24-480 GigabitEthernet
+ports). Port descriptions are drawn from the interface template names, a
+share of the ports get descriptions without template. drift_rate is the
+probability of a port deviating from its template (a missing required
+command, an unexpected command or both).
+
+    python -m benchmarks.fleet_generator -n 100 -o saved_configs
+    python interface_compliance_check.py --from-dir saved_configs
+"""
+import argparse
+import os
+import random
+import sys
+
+from interface_compliance_check import parse_intf_template_files_individually
+
+UNMATCHED_DESCRIPTIONS = ["unused", "spare", "printer 3rd floor", None]
+UNEXPECTED_COMMANDS = ["switchport nonegotiate", "shutdown", "cdp enable", "switchport port-security"]
+
+GLOBAL_CONFIG = """version 17.9
+service timestamps debug datetime msec
+service password-encryption
+hostname {host}
+!
+aaa new-model
+aaa authentication login default group tacacs+ local
+!
+ip access-list extended MGMT
+ permit tcp 10.0.0.0 0.255.255.255 any eq 22
+ deny   ip any any log
+!
+spanning-tree mode rapid-pvst
+!"""
+
+TRAILER = """interface Vlan1
+ no ip address
+ shutdown
+!
+line vty 0 15
+ transport input ssh
+!
+end"""
+
+
+def generate_port_config(rng, parsed_templates, template_names, drift_rate, unmatched_rate=0.1):
+    """Returns (description, config lines) of one access port"""
+    if rng.random() < unmatched_rate:
+        return rng.choice(UNMATCHED_DESCRIPTIONS), [" shutdown"]
+
+    name = rng.choice(template_names)
+    template = parsed_templates[name]
+    base = name.rsplit('.', 1)[0]
+    description = base if rng.random() < 0.5 else "{} {}".format(base, rng.randint(1, 999))
+    lines = [" " + cmd for cmd in template['required'] if not cmd.startswith('-')]
+    lines += [" " + cmd for cmd in template['additional_allowed'] if cmd and rng.random() < 0.5]
+
+    if rng.random() < drift_rate:
+        drift = rng.random()
+        if drift < 0.7 and lines:
+            lines.pop(rng.randrange(len(lines)))
+        if drift >= 0.4:
+            lines.append(" " + rng.choice(UNEXPECTED_COMMANDS))
+    return description, lines
+
+
+def generate_switch_config(host, rng, parsed_templates, ports, drift_rate=0.05):
+    """Running-config of one switch with the given number of GigabitEthernet ports"""
+    template_names = sorted(parsed_templates)
+    config = [GLOBAL_CONFIG.format(host=host)]
+    for port in range(ports):
+        member, number = divmod(port, 48)
+        description, lines = generate_port_config(rng, parsed_templates, template_names, drift_rate)
+        config.append("interface GigabitEthernet{}/0/{}".format(member + 1, number + 1))
+        if description:
+            config.append(" description {}".format(description))
+        config.extend(lines)
+        config.append("!")
+    config.append(TRAILER)
+    return "\n".join(config) + "\n"
+
+
+def generate_fleet(switches, parsed_templates, drift_rate=0.05, min_ports=24, max_ports=480, seed=1):
+    """Yields (host, running-config) for a fleet, deterministic for a seed"""
+    rng = random.Random(seed)
+    for index in range(switches):
+        ports = rng.randrange(min_ports, max_ports + 1, 24)
+        host = "sw{:05d}".format(index)
+        yield host, generate_switch_config(host, rng, parsed_templates, ports, drift_rate)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate a synthetic fleet of running-configs")
+    parser.add_argument("-n", "--switches", type=int, default=100, help="Number of switches (default: 100)")
+    parser.add_argument("-o", "--output", default="saved_configs", help="Directory for the <host>.cfg files (default: saved_configs)")
+    parser.add_argument("-t", "--templates", default="interface_templates", help="Interface templates directory")
+    parser.add_argument("--drift", type=float, default=0.05, help="Probability of a port deviating from its template (default: 0.05)")
+    parser.add_argument("--min-ports", type=int, default=24, help="Minimum ports per switch (default: 24)")
+    parser.add_argument("--max-ports", type=int, default=480, help="Maximum ports per switch (default: 480)")
+    parser.add_argument("--seed", type=int, default=1, help="Random seed (default: 1)")
+    args = parser.parse_args()
+
+    parsed_templates, errors = parse_intf_template_files_individually(args.templates)
+    if errors or not parsed_templates:
+        sys.exit("\n".join(errors) or "No templates found in {}".format(args.templates))
+
+    os.makedirs(args.output, exist_ok=True)
+    for host, config in generate_fleet(args.switches, parsed_templates, args.drift, args.min_ports,
+                                       args.max_ports, args.seed):
+        with open(os.path.join(args.output, host + ".cfg"), 'w') as f:
+            f.write(config)
+    print("Wrote {} configs to {}".format(args.switches, args.output))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,166 @@
+"""Time the hot paths of the compliance checker on synthetic fleets
+
+Phases are timed separately per fleet size: parse_interfaces, template
+resolution, the compliance check of every interface, the missing config
+generation and the HTML report. The fleet is generated and processed in
+batches, so 10k switches do not have to fit into memory at once.
+
+    python -m benchmarks.run_benchmarks --sizes 10 100 1000 10000 -o bench.json
+    python -m benchmarks.run_benchmarks --sizes 10 100 --compare bench.json
+"""
+import argparse
+import datetime
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+
+from benchmarks.fleet_generator import generate_fleet
+from compliance_results import COMPLIANT, NON_COMPLIANT, SKIPPED, HostResult, InterfaceResult
+from interface_compliance_check import (generate_missing_config_files, parse_interfaces,
+                                        parse_intf_template_files_individually)
+from report_writer import HtmlReportWriter
+from template_matcher import TemplateResolver, compile_templates
+
+PHASES = ('parse', 'resolve', 'check', 'missing_configs', 'report')
+
+
+def benchmark_fleet(switches, parsed_templates, drift_rate, seed, batch_size, work_dir):
+    """Run every phase over a fleet, returns the result record of this size"""
+    # A fresh resolver per size, its memo starts cold like in a real run
+    template_resolver = TemplateResolver(compile_templates(parsed_templates))
+    timings = dict.fromkeys(PHASES, 0.0)
+    counts = {'switches': 0, 'interfaces': 0, 'config_lines': 0, 'config_bytes': 0}
+
+    def timed(phase, func, *args):
+        started = time.perf_counter()
+        result = func(*args)
+        timings[phase] += time.perf_counter() - started
+        return result
+
+    report_file = os.path.join(work_dir, "report_{}.html".format(switches))
+    with HtmlReportWriter(report_file, parsed_templates, "missing_configs") as writer:
+        batch = {}
+        fleet = generate_fleet(switches, parsed_templates, drift_rate, seed=seed)
+        for index, (host, config) in enumerate(fleet, 1):
+            counts['switches'] += 1
+            counts['config_lines'] += config.count("\n")
+            counts['config_bytes'] += len(config)
+
+            interfaces = timed('parse', parse_interfaces, config)
+            physical = list(interfaces.items())
+            counts['interfaces'] += len(physical)
+
+            templates = timed('resolve', lambda: [template_resolver.resolve(details['description'])
+                                                  for _, details in physical])
+
+            def check():
+                results = []
+                for (name, details), matcher in zip(physical, templates):
+                    if matcher is None:
+                        results.append(InterfaceResult(name, details['description'], None, SKIPPED, [], [], []))
+                        continue
+                    missing, unexpected, to_remove = matcher.evaluate(details['config'])
+                    status = NON_COMPLIANT if (missing or unexpected or to_remove) else COMPLIANT
+                    results.append(InterfaceResult(name, details['description'], matcher.name, status,
+                                                   missing, unexpected, to_remove))
+                return HostResult(host, False, None, results)
+
+            batch[host] = timed('check', check)
+
+            if len(batch) >= batch_size or index == switches:
+                timed('missing_configs', generate_missing_config_files, batch, template_resolver)
+                for host_result in batch.values():
+                    timed('report', writer.add_host, host_result)
+                batch = {}
+        timed('report', writer.close)
+
+    total = sum(timings.values())
+    return {
+        'switches': switches,
+        **counts,
+        'seconds': {phase: round(seconds, 6) for phase, seconds in timings.items()},
+        'total_seconds': round(total, 6),
+        'switches_per_second': round(switches / total, 2) if total else None,
+    }
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], stderr=subprocess.DEVNULL,
+                                       cwd=os.path.dirname(os.path.abspath(__file__))).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results, baseline_file):
+    """Print the time ratio per phase against an earlier results file"""
+    with open(baseline_file, 'r') as f:
+        baseline = {run['switches']: run for run in json.load(f)['runs']}
+    print("\nCompared to {} (ratio current/baseline, < 1 is faster):".format(baseline_file))
+    for run in results['runs']:
+        old = baseline.get(run['switches'])
+        if not old:
+            continue
+        ratios = []
+        for phase in PHASES + ('total',):
+            new_seconds = run['total_seconds'] if phase == 'total' else run['seconds'][phase]
+            old_seconds = old['total_seconds'] if phase == 'total' else old['seconds'][phase]
+            ratios.append("{} {:.2f}".format(phase, new_seconds / old_seconds if old_seconds else float('nan')))
+        print("{:>6} switches: {}".format(run['switches'], ", ".join(ratios)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the compliance checker on synthetic fleets")
+    parser.add_argument("--sizes", type=int, nargs='+', default=[10, 100, 1000, 10000], help="Fleet sizes (default: 10 100 1000 10000)")
+    parser.add_argument("-t", "--templates", default="interface_templates", help="Interface templates directory")
+    parser.add_argument("--drift", type=float, default=0.05, help="Probability of a port deviating from its template (default: 0.05)")
+    parser.add_argument("--seed", type=int, default=1, help="Random seed (default: 1)")
+    parser.add_argument("--batch-size", type=int, default=200, help="Switches kept in memory at once (default: 200)")
+    parser.add_argument("-o", "--output", default="bench_results.json", help="JSON results file (default: bench_results.json)")
+    parser.add_argument("--compare", help="Earlier JSON results file to compare against")
+    args = parser.parse_args()
+
+    parsed_templates, errors = parse_intf_template_files_individually(args.templates)
+    if errors or not parsed_templates:
+        sys.exit("\n".join(errors) or "No templates found in {}".format(args.templates))
+
+    results = {
+        'generated_at': datetime.datetime.now().isoformat(timespec='seconds'),
+        'revision': git_revision(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'drift_rate': args.drift,
+        'seed': args.seed,
+        'runs': [],
+    }
+
+    cwd = os.getcwd()
+    output = os.path.abspath(args.output)
+    with tempfile.TemporaryDirectory() as work_dir:
+        # generate_missing_config_files writes relative to the working directory
+        os.chdir(work_dir)
+        try:
+            for switches in args.sizes:
+                run = benchmark_fleet(switches, parsed_templates, args.drift, args.seed, args.batch_size, work_dir)
+                results['runs'].append(run)
+                print("{:>6} switches, {:>8} interfaces: {}, total {:.2f}s".format(
+                    switches, run['interfaces'],
+                    ", ".join("{} {:.3f}s".format(phase, run['seconds'][phase]) for phase in PHASES),
+                    run['total_seconds']))
+        finally:
+            os.chdir(cwd)
+
+    with open(output, 'w') as f:
+        json.dump(results, f, indent=2)
+    print("Results saved to: {}".format(output))
+
+    if args.compare:
+        compare(results, args.compare)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,144 @@
+import threading
+import time
+from contextlib import contextmanager
+
+
+class AdaptiveLimiter:
+    """Counting semaphore whose limit adapts to the observed connect latency
+
+    Additive increase, multiplicative decrease: every `limit` fast, successful
+    connects raise the limit by one (up to max_limit), a failed or slow
+    connect halves it (down to min_limit). Slots already handed out are
+    never revoked, a lowered limit only delays new acquisitions.
+    """
+
+    def __init__(self, name, max_limit, min_limit=1, target_latency=None):
+        self.name = name
+        self.max_limit = max_limit
+        self.min_limit = min(min_limit, max_limit)
+        self.target_latency = target_latency
+        self.limit = max_limit if target_latency is None else max(self.min_limit, max_limit // 2)
+        self.active = 0
+        self.peak = 0
+        self._good = 0
+        self._cond = threading.Condition()
+
+    def acquire(self):
+        with self._cond:
+            while self.active >= self.limit:
+                self._cond.wait()
+            self.active += 1
+            self.peak = max(self.peak, self.active)
+
+    def release(self):
+        with self._cond:
+            self.active -= 1
+            self._cond.notify()
+
+    def feedback(self, latency, ok):
+        """Adjust the limit after a connect attempt"""
+        if self.target_latency is None:
+            return
+        with self._cond:
+            if ok and latency <= self.target_latency:
+                self._good += 1
+                if self._good >= self.limit and self.limit < self.max_limit:
+                    self.limit += 1
+                    self._good = 0
+                    self._cond.notify_all()
+            else:
+                self.limit = max(self.min_limit, self.limit // 2)
+                self._good = 0
+
+
+class CollectionScheduler:
+    """Bounds concurrent device sessions globally, per proxy endpoint and per site
+
+    Every fetch runs inside slot(host), which holds one slot of the host's
+    site limiter, its proxy limiter and the global limiter. Limiters are
+    always acquired in that order, so waiting hosts cannot deadlock each
+    other. With a target_latency the limits adapt to the observed connect
+    latency and failures, otherwise they are fixed.
+    """
+
+    def __init__(self, global_limit, per_proxy_limit=None, per_group_limit=None, target_latency=None,
+                 default_proxy="direct"):
+        self.per_proxy_limit = per_proxy_limit or global_limit
+        self.per_group_limit = per_group_limit or global_limit
+        self.target_latency = target_latency
+        self.default_proxy = default_proxy
+        self.global_limiter = AdaptiveLimiter("global", global_limit, target_latency=target_latency)
+        self.proxy_limiters = {}
+        self.group_limiters = {}
+        self.connects = 0
+        self.failures = 0
+        self._lock = threading.Lock()
+
+    def proxy_key(self, host):
+        """Proxy endpoint of a host, the socks_proxy inventory entry or the default proxy"""
+        return host.get('socks_proxy', None) or self.default_proxy
+
+    def group_key(self, host):
+        """Site of a host, the site inventory entry or its first group"""
+        site = host.get('site', None)
+        if site:
+            return site
+        return host.groups[0].name if host.groups else "ungrouped"
+
+    def _limiter(self, limiters, key, limit):
+        with self._lock:
+            if key not in limiters:
+                limiters[key] = AdaptiveLimiter(key, limit, target_latency=self.target_latency)
+            return limiters[key]
+
+    @contextmanager
+    def slot(self, host):
+        """Hold one session slot for host, yields a callback to report the connect latency"""
+        limiters = [
+            self._limiter(self.group_limiters, self.group_key(host), self.per_group_limit),
+            self._limiter(self.proxy_limiters, self.proxy_key(host), self.per_proxy_limit),
+            self.global_limiter,
+        ]
+        acquired = []
+        try:
+            for limiter in limiters:
+                limiter.acquire()
+                acquired.append(limiter)
+
+            started = time.monotonic()
+            reported = []
+
+            def connected(latency=None):
+                if latency is None:
+                    latency = time.monotonic() - started
+                reported.append(latency)
+                self._feedback(limiters, latency, True)
+
+            try:
+                yield connected
+            except Exception:
+                if not reported:
+                    self._feedback(limiters, time.monotonic() - started, False)
+                raise
+        finally:
+            for limiter in reversed(acquired):
+                limiter.release()
+
+    def _feedback(self, limiters, latency, ok):
+        with self._lock:
+            self.connects += 1
+            if not ok:
+                self.failures += 1
+        for limiter in limiters:
+            limiter.feedback(latency, ok)
+
+    def summary(self):
+        """Peak concurrency and final limit of every limiter"""
+        lines = ["Connects: {}, failed: {}".format(self.connects, self.failures)]
+        for title, limiters in (("global", {"global": self.global_limiter}),
+                                ("proxy", self.proxy_limiters),
+                                ("site", self.group_limiters)):
+            for key, limiter in sorted(limiters.items()):
+                lines.append("{} {}: peak {} sessions, limit {}/{}".format(
+                    title, key, limiter.peak, limiter.limit, limiter.max_limit))
+        return "\n".join(lines)
@@ -0,0 +1,75 @@
+"""Single entry point for the interface compliance tools
+
+    python compliance.py check [options]              check the inventory over SSH
+    python compliance.py offline CONFIG_DIR [options] check saved running-configs, no device logins
+    python compliance.py apply [options]              push the missing configs
+    python compliance.py report <command> [options]   query the result store: runs, report, delta, export, merge
+    python compliance.py lint-templates [-t DIR]      parse and check the interface templates
+
+Every command imports only what it needs: nornir, netmiko and socks are
+loaded by check and apply when they connect, report and lint-templates
+never load them. The old scripts (interface_compliance_check.py,
+apply_missing_configs.py, result_store.py) keep working.
+"""
+import argparse
+import sys
+
+COMMANDS = {
+    'check': "Check the interfaces of the inventory against the templates",
+    'offline': "Check saved running-configs (<host>.cfg) without logging into the devices",
+    'apply': "Push the missing configs to the devices",
+    'report': "Query the result store, render reports and merge shard runs",
+    'lint-templates': "Parse the interface templates and report errors",
+}
+
+
+def lint_templates(argv=None, prog=None):
+    """The lint-templates command, exits with 1 if a template has errors (or warnings with --strict)"""
+    from template_cache import lint_templates as lint
+
+    parser = argparse.ArgumentParser(prog=prog, description=COMMANDS['lint-templates'])
+    parser.add_argument("-t", "--templates", default="interface_templates", help="Path to the interface templates directory (default: interface_templates)")
+    parser.add_argument("--strict", action="store_true", help="Also fail on warnings")
+    args = parser.parse_args(argv)
+
+    count, errors, warnings = lint(args.templates)
+    for error in errors:
+        print("Fehler: {}".format(error))
+    for warning in warnings:
+        print("Warnung: {}".format(warning))
+    print("{} templates checked: {} errors, {} warnings".format(count, len(errors), len(warnings)))
+    return 1 if errors or (args.strict and warnings) else 0
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    parser = argparse.ArgumentParser(
+        prog="compliance.py", description="Network interface compliance tools",
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="commands:\n" + "\n".join("  {:<16}{}".format(name, text) for name, text in COMMANDS.items()) +
+               "\n\nRun 'compliance.py <command> --help' for the options of a command.")
+    parser.add_argument("command", choices=COMMANDS, metavar="command", help="One of the commands below")
+    if not argv or argv[0] not in COMMANDS:
+        parser.parse_args(argv[:1])
+        parser.error("no command given")
+    command, argv = argv[0], argv[1:]
+    prog = "compliance.py {}".format(command)
+
+    # Imported per command, so each one only loads its own dependencies
+    if command == 'check':
+        from interface_compliance_check import main as check
+        return check(argv, prog)
+    if command == 'offline':
+        from interface_compliance_check import main as check
+        return check(argv, prog, offline=True)
+    if command == 'apply':
+        from apply_missing_configs import main as apply
+        return apply(argv, prog)
+    if command == 'report':
+        from result_store import main as report
+        return report(argv, prog)
+    return lint_templates(argv, prog)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
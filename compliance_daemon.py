@@ -0,0 +1,395 @@
+"""Service mode: keep checking the switches and serve the results over HTTP
+
+Nornir, the compiled templates and the last result of every host stay in
+memory. Every host is re-checked once per interval; the first checks are
+spread evenly over the first interval, and every following check is
+moved by a random jitter, so the hosts never run in lockstep. The
+current results are served as JSON on a local HTTP port:
+
+    GET /health                  uptime, hosts, checks, template state
+    GET /hosts                   compliance summary of every host
+    GET /hosts/<host>            full result of one host, with the per-interface details
+    GET /interfaces              every checked interface, filter with ?status=Non-Compliant,
+                                 ?template=<name> and ?host=<substring>
+
+    python compliance_daemon.py -c config.yaml --interval 900 --port 8080
+"""
+import argparse
+import functools
+import heapq
+import json
+import logging
+import random
+import signal
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, unquote, urlparse
+
+from nornir import InitNornir
+from nornir.core import Nornir
+from nornir.core.inventory import Hosts, Inventory
+from nornir.plugins.runners import SerialRunner
+
+from collection_scheduler import CollectionScheduler
+from compliance_results import COMPLIANT, NON_COMPLIANT, SKIPPED, HostResult
+from config_tree import DEFAULT_INTERFACE_PATTERN, compile_interface_pattern
+from interface_compliance_check import FETCH_STRATEGIES, check_switch_compliance, collect_host_results, configure_proxy
+from template_cache import TemplateCache
+from template_matcher import EvaluationCache, TemplateResolver
+
+logger = logging.getLogger(__name__)
+
+
+def initial_schedule(hosts, interval, now=None, rng=random):
+    """[(due, host)] spreading the first check of every host evenly over one interval"""
+    now = time.time() if now is None else now
+    hosts = list(hosts)
+    rng.shuffle(hosts)
+    slot = interval / len(hosts) if hosts else interval
+    return [(now + slot * (index + rng.random()), host) for index, host in enumerate(hosts)]
+
+
+def next_due(due, interval, jitter, now=None, rng=random):
+    """Due time of the next check, one interval after the last due time +- jitter * interval"""
+    now = time.time() if now is None else now
+    following = due + interval * (1 + rng.uniform(-jitter, jitter))
+    if following <= now:
+        # The check took longer than the interval, do not queue up missed checks
+        following = now + interval * jitter * rng.random()
+    return following
+
+
+def single_host_nornir(nr, host):
+    """Copy of nr with only the given host and a serial runner
+
+    Built directly instead of with nr.filter(), which scans the whole
+    inventory for every host.
+    """
+    inventory = Inventory(hosts=Hosts({host: nr.inventory.hosts[host]}), groups=nr.inventory.groups,
+                          defaults=nr.inventory.defaults)
+    return Nornir(inventory=inventory, config=nr.config, data=nr.data, processors=nr.processors,
+                  runner=SerialRunner())
+
+
+class ComplianceState:
+    """Latest result of every host, shared by the check threads and the HTTP API
+
+    add() takes the HostMetrics of a check, so the state can be passed as
+    the metrics collector of check_switch_compliance.
+    """
+
+    def __init__(self, hosts):
+        self.started = time.time()
+        self.checks = 0
+        self.failures = 0
+        self.templates = {}
+        self._lock = threading.Lock()
+        self._hosts = {host: {
+            'result': None,
+            'last_success': None,
+            'checked_at': None,
+            'last_success_at': None,
+            'next_check_at': None,
+            'duration': None,
+            'phases': None,
+            'checks': 0,
+            'failures': 0,
+        } for host in hosts}
+
+    def add(self, host_metrics):
+        with self._lock:
+            if host_metrics.host in self._hosts:
+                self._hosts[host_metrics.host]['phases'] = host_metrics.to_dict()['phases']
+
+    def scheduled(self, host, due):
+        with self._lock:
+            self._hosts[host]['next_check_at'] = due
+
+    def update(self, host_result, checked_at, duration):
+        with self._lock:
+            entry = self._hosts[host_result.host]
+            entry['result'] = host_result
+            entry['checked_at'] = checked_at
+            entry['duration'] = duration
+            entry['checks'] += 1
+            self.checks += 1
+            if host_result.failed:
+                entry['failures'] += 1
+                self.failures += 1
+            else:
+                entry['last_success'] = host_result
+                entry['last_success_at'] = checked_at
+
+    @staticmethod
+    def _status(entry):
+        result = entry['result']
+        if result is None:
+            return "pending"
+        if result.failed:
+            return "failed"
+        return "compliant" if result.is_compliant else "non-compliant"
+
+    def _summary(self, host, entry):
+        # Counts come from the last successful check, a failed check only changes the status
+        interfaces = entry['last_success'].interfaces if entry['last_success'] else []
+        return {
+            'host': host,
+            'status': self._status(entry),
+            'error': entry['result'].error if entry['result'] is not None else None,
+            'checked_at': entry['checked_at'],
+            'last_success_at': entry['last_success_at'],
+            'next_check_at': entry['next_check_at'],
+            'duration': entry['duration'],
+            'interfaces': len(interfaces),
+            'compliant_interfaces': sum(1 for intf in interfaces if intf.status == COMPLIANT),
+            'non_compliant_interfaces': sum(1 for intf in interfaces if intf.status == NON_COMPLIANT),
+            'skipped_interfaces': sum(1 for intf in interfaces if intf.status == SKIPPED),
+        }
+
+    def hosts(self):
+        with self._lock:
+            return [self._summary(host, entry) for host, entry in sorted(self._hosts.items())]
+
+    def host(self, host):
+        with self._lock:
+            entry = self._hosts.get(host)
+            if entry is None:
+                return None
+            data = self._summary(host, entry)
+            data['checks'] = entry['checks']
+            data['failures'] = entry['failures']
+            data['phases'] = entry['phases']
+            data['result'] = entry['last_success'].to_dict() if entry['last_success'] else None
+            return data
+
+    def interfaces(self, status=None, template=None, host_filter=None):
+        rows = []
+        with self._lock:
+            for host, entry in sorted(self._hosts.items()):
+                if entry['last_success'] is None or (host_filter and host_filter not in host):
+                    continue
+                for intf in entry['last_success'].interfaces:
+                    if (status and intf.status != status) or (template and intf.template != template):
+                        continue
+                    rows.append(dict(intf.to_dict(), host=host, checked_at=entry['last_success_at']))
+        return rows
+
+    def health(self):
+        with self._lock:
+            pending = sum(1 for entry in self._hosts.values() if entry['result'] is None)
+            return {
+                'started_at': self.started,
+                'uptime': time.time() - self.started,
+                'hosts': len(self._hosts),
+                'pending': pending,
+                'checks': self.checks,
+                'failures': self.failures,
+                'templates': sorted(self.templates),
+            }
+
+
+class ApiHandler(BaseHTTPRequestHandler):
+    """Read-only JSON API over the ComplianceState of the server"""
+
+    def do_GET(self):
+        state = self.server.state
+        url = urlparse(self.path)
+        query = {key: values[0] for key, values in parse_qs(url.query).items()}
+        path = url.path.rstrip('/')
+
+        if path == '/health':
+            self._send(200, state.health())
+        elif path == '/hosts':
+            self._send(200, state.hosts())
+        elif path.startswith('/hosts/'):
+            data = state.host(unquote(path[len('/hosts/'):]))
+            if data is None:
+                self._send(404, {'error': 'unknown host'})
+            else:
+                self._send(200, data)
+        elif path == '/interfaces':
+            self._send(200, state.interfaces(query.get('status'), query.get('template'), query.get('host')))
+        else:
+            self._send(404, {'error': 'not found'})
+
+    def _send(self, code, data):
+        body = json.dumps(data).encode('utf-8')
+        self.send_response(code)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        logger.debug("%s - %s", self.address_string(), format % args)
+
+
+class ComplianceDaemon:
+    """Re-checks every host of a Nornir inventory on a jittered interval
+
+    A dispatcher thread keeps a heap of due times and hands due hosts to a
+    thread pool. Device sessions are bounded by the CollectionScheduler.
+    The templates are re-read when their files change, unchanged ones come
+    from the template cache.
+    """
+
+    def __init__(self, nr, templates_dir, template_cache, scheduler, interval=900, jitter=0.1, workers=10,
+                 fetch_strategy='full', interface_pattern=None, template_check_interval=60, stream=False,
+                 evaluation_cache_size=100000):
+        self.nr = nr
+        self.templates_dir = templates_dir
+        self.template_cache = template_cache
+        self.scheduler = scheduler
+        self.interval = interval
+        self.jitter = jitter
+        self.fetch_strategy = fetch_strategy
+        self.stream = stream
+        self.evaluation_cache_size = evaluation_cache_size
+        self.interface_pattern = interface_pattern or compile_interface_pattern()
+        self.template_check_interval = template_check_interval
+        self.state = ComplianceState(nr.inventory.hosts)
+        self._host_nr = {host: single_host_nornir(nr, host) for host in nr.inventory.hosts}
+        self.template_resolver = None
+        self._template_checked = 0
+        self._template_errors = []
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=workers)
+        self._stop = threading.Event()
+        self._queue = initial_schedule(nr.inventory.hosts, interval)
+        heapq.heapify(self._queue)
+        for due, host in self._queue:
+            self.state.scheduled(host, due)
+        self.load_templates()
+
+    def load_templates(self):
+        """(Re)build the resolver if a template file was added, changed or removed"""
+        compiled = self.template_cache.compiled
+        parsed, templates, errors = self.template_cache.templates(self.templates_dir)
+        if errors != self._template_errors:
+            for error in errors:
+                logger.error(error)
+            self._template_errors = errors
+        if self.template_resolver is None or self.template_cache.compiled != compiled or \
+                set(templates) != set(self.template_resolver.templates):
+            self.template_cache.save()
+            # New templates, new evaluation cache
+            evaluation_cache = EvaluationCache(self.evaluation_cache_size) if self.evaluation_cache_size > 0 else None
+            self.template_resolver = TemplateResolver(templates, evaluation_cache=evaluation_cache)
+            self.state.templates = parsed
+            logger.info("Loaded {} templates".format(len(templates)))
+        self._template_checked = time.monotonic()
+
+    def check_host(self, host):
+        started = time.time()
+        result = self._host_nr[host].run(task=check_switch_compliance, template_resolver=self.template_resolver,
+                                         fetch_strategy=self.fetch_strategy, scheduler=self.scheduler,
+                                         metrics=self.state, interface_pattern=self.interface_pattern,
+                                         stream=self.stream)
+        host_result = collect_host_results(result)[host]
+        self.state.update(host_result, started, time.time() - started)
+        if host_result.failed:
+            logger.warning("Check of {} failed: {}".format(host, host_result.error))
+
+    def _requeue(self, host, due, future):
+        """Schedule the next check of host, also after a crashed check"""
+        error = future.exception()
+        if error is not None:
+            logger.error("Check task of {} crashed: {}".format(host, error))
+            self.state.update(HostResult.failure(host, "Check crashed: {}".format(error)), time.time(), None)
+        following = next_due(due, self.interval, self.jitter)
+        self.state.scheduled(host, following)
+        with self._lock:
+            heapq.heappush(self._queue, (following, host))
+
+    def run(self):
+        """Dispatch due hosts until stop() is called"""
+        while not self._stop.is_set():
+            if time.monotonic() - self._template_checked >= self.template_check_interval:
+                self.load_templates()
+            now = time.time()
+            with self._lock:
+                due_hosts = []
+                while self._queue and self._queue[0][0] <= now:
+                    due_hosts.append(heapq.heappop(self._queue))
+                wait = self._queue[0][0] - now if self._queue else 1.0
+            for due, host in due_hosts:
+                self._executor.submit(self.check_host, host).add_done_callback(
+                    functools.partial(self._requeue, host, due))
+            self._stop.wait(min(max(wait, 0.05), 1.0))
+        self._executor.shutdown(wait=True)
+
+    def stop(self):
+        self._stop.set()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Interface compliance checker as a service with a local HTTP API")
+    parser.add_argument("-c", "--config", default="config.yaml", help="Path to the Nornir config file (default: config.yaml)")
+    parser.add_argument("-t", "--templates", default="interface_templates", help="Path to the interface templates directory (default: interface_templates)")
+    parser.add_argument("-f", "--filter", help="Optional filter string for hostname prefix")
+    parser.add_argument("--interval", type=float, default=900, help="Seconds between two checks of a host (default: 900)")
+    parser.add_argument("--jitter", type=float, default=0.1, help="Random shift of every check as a fraction of the interval (default: 0.1)")
+    parser.add_argument("--listen", default="127.0.0.1", help="Address of the HTTP API (default: 127.0.0.1)")
+    parser.add_argument("--port", type=int, default=8080, help="Port of the HTTP API (default: 8080)")
+    parser.add_argument("--fetch-strategy", choices=FETCH_STRATEGIES, default="full", help="How to fetch the running-config (default: full)")
+    parser.add_argument("--stream", action="store_true", help="Check the running-config line by line while it is read from the SSH channel")
+    parser.add_argument("--interface-pattern", default=DEFAULT_INTERFACE_PATTERN, help="Regular expression for the names of the interfaces to check")
+    parser.add_argument("--evaluation-cache-size", type=int, default=100000, help="Distinct interface bodies whose result is kept for identical ports, 0 disables the evaluation cache (default: 100000)")
+    parser.add_argument("--template-cache", default=".template_cache.json", help="Compiled template cache file (default: .template_cache.json)")
+
+    # Collection scheduler
+    parser.add_argument("--max-connections", type=int, default=10, help="Maximum concurrent device sessions (default: 10)")
+    parser.add_argument("--per-proxy-limit", type=int, help="Maximum concurrent sessions through one proxy endpoint (default: --max-connections)")
+    parser.add_argument("--per-group-limit", type=int, help="Maximum concurrent sessions per site (default: --max-connections)")
+    parser.add_argument("--target-latency", type=float, help="Adapt the limits: back off when a connect takes longer than this many seconds or fails")
+
+    # Optional SOCKS5 proxy settigs
+    parser.add_argument("--proxy-enabled", action="store_true", help="Enable SOCKS5 proxy")
+    parser.add_argument("--proxy-host", default="127.0.0.1", help="Proxy host (default: 127.0.0.1)")
+    parser.add_argument("--proxy-port", type=int, default=1084, help="Proxy port (default: 1084)")
+    args = parser.parse_args()
+
+    if args.interval <= 0 or not 0 <= args.jitter < 1:
+        parser.error("--interval must be positive and --jitter between 0 and 1")
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    nr = InitNornir(config_file=args.config)
+    if args.proxy_enabled:
+        if not configure_proxy(args.proxy_host, args.proxy_port):
+            print("Failed to configure proxy")
+            sys.exit(1)
+    if args.filter:
+        nr = nr.filter(lambda host: args.filter in host.name)
+
+    default_proxy = "{}:{}".format(args.proxy_host, args.proxy_port) if args.proxy_enabled else "direct"
+    scheduler = CollectionScheduler(args.max_connections, args.per_proxy_limit, args.per_group_limit,
+                                    args.target_latency, default_proxy)
+    daemon = ComplianceDaemon(nr, args.templates, TemplateCache(args.template_cache).load(), scheduler,
+                              interval=args.interval, jitter=args.jitter, workers=args.max_connections * 2,
+                              fetch_strategy=args.fetch_strategy,
+                              interface_pattern=compile_interface_pattern(args.interface_pattern),
+                              stream=args.stream, evaluation_cache_size=args.evaluation_cache_size)
+
+    server = ThreadingHTTPServer((args.listen, args.port), ApiHandler)
+    server.daemon_threads = True
+    server.state = daemon.state
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    logger.info("Checking {} hosts every {:.0f}s, API on http://{}:{}/".format(
+        len(nr.inventory.hosts), args.interval, args.listen, args.port))
+
+    signal.signal(signal.SIGTERM, lambda signum, frame: daemon.stop())
+    try:
+        daemon.run()
+    except KeyboardInterrupt:
+        daemon.stop()
+    finally:
+        server.shutdown()
+        logger.info("Stopped after {} checks".format(daemon.state.checks))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+from dataclasses import dataclass
+
+COMPLIANT = "Compliant"
+NON_COMPLIANT = "Non-Compliant"
+SKIPPED = "Skipped"
+
+
+@dataclass
+class InterfaceResult:
+    """Compliance result of one interface, template is None for skipped interfaces"""
+    __slots__ = ('name', 'description', 'template', 'status', 'missing', 'unexpected', 'to_remove')
+    name: str
+    description: str
+    template: str
+    status: str
+    missing: list
+    unexpected: list
+    to_remove: list
+
+    def to_dict(self):
+        return {slot: getattr(self, slot) for slot in self.__slots__}
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(**data)
+
+
+@dataclass
+class HostResult:
+    """Compliance result of one switch, interfaces in running-config order"""
+    __slots__ = ('host', 'failed', 'error', 'interfaces')
+    host: str
+    failed: bool
+    error: str
+    interfaces: list
+
+    @classmethod
+    def failure(cls, host, error):
+        return cls(host, True, error, [])
+
+    @property
+    def compliant_interfaces(self):
+        return [intf for intf in self.interfaces if intf.status == COMPLIANT]
+
+    @property
+    def non_compliant_interfaces(self):
+        return [intf for intf in self.interfaces if intf.status == NON_COMPLIANT]
+
+    @property
+    def skipped_interfaces(self):
+        return [intf for intf in self.interfaces if intf.status == SKIPPED]
+
+    @property
+    def is_compliant(self):
+        return not self.failed and not any(intf.status == NON_COMPLIANT for intf in self.interfaces)
+
+    def to_dict(self):
+        return {
+            'host': self.host,
+            'failed': self.failed,
+            'error': self.error,
+            'interfaces': [intf.to_dict() for intf in self.interfaces],
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data['host'], data['failed'], data['error'],
+                   [InterfaceResult.from_dict(intf) for intf in data['interfaces']])
+
+
+def render_host_result(host_result):
+    """Render a host result as text for the console"""
+    if host_result.failed:
+        return "Task failed: {}".format(host_result.error)
+
+    result = ""
+    compliant = host_result.compliant_interfaces
+    if compliant:
+        result += "Compliant Interfaces:\n"
+        for intf in compliant:
+            result += "{}:\n".format(intf.name)
+            if intf.description:
+                result += "Description: {}\n".format(intf.description)
+            result += "{}\n\n".format(COMPLIANT)
+
+    non_compliant = host_result.non_compliant_interfaces
+    if non_compliant:
+        result += "Non-Compliant Interfaces:\n"
+        for intf in non_compliant:
+            result += "{}:\n".format(intf.name)
+            if intf.description:
+                result += "Description: {}\n".format(intf.description)
+            result += "{}\n".format(NON_COMPLIANT)
+            if intf.missing:
+                result += "Missing commands: {}\n".format(", ".join(intf.missing))
+            if intf.unexpected:
+                result += "Unexpected commands: {}\n".format(", ".join(intf.unexpected))
+            if intf.to_remove:
+                result += "Commands to remove: {}\n".format(", ".join(intf.to_remove))
+            result += "\n"
+
+    skipped = host_result.skipped_interfaces
+    if skipped:
+        result += "Skipped Interfaces (no matching template):\n"
+        for intf in skipped:
+            result += "{}: {}\n".format(intf.name, intf.description or "No description")
+
+    return result.strip() if result else "No matching interfaces found"
@@ -0,0 +1,139 @@
+import re
+
+# Interface types and their short names in show commands. The port types
+# are the physical ports and port-channels of Catalyst 9300/9500 switches,
+# they are checked by default. SVIs, loopbacks and tunnels are not.
+PORT_TYPES = (
+    ('GigabitEthernet', 'Gi'),
+    ('TwoGigabitEthernet', 'Tw'),
+    ('FiveGigabitEthernet', 'Fi'),
+    ('TenGigabitEthernet', 'Te'),
+    ('TwentyFiveGigE', 'Twe'),
+    ('TwentyFiveGigabitEthernet', 'Twe'),
+    ('FortyGigabitEthernet', 'Fo'),
+    ('HundredGigE', 'Hu'),
+    ('HundredGigabitEthernet', 'Hu'),
+    ('AppGigabitEthernet', 'Ap'),
+    ('FastEthernet', 'Fa'),
+    ('Port-channel', 'Po'),
+)
+OTHER_INTERFACE_TYPES = (
+    ('Vlan', 'Vl'),
+    ('Loopback', 'Lo'),
+    ('Tunnel', 'Tu'),
+    ('Null', 'Nu'),
+)
+
+DEFAULT_INTERFACE_PATTERN = r'^(?:{})\d'.format('|'.join(re.escape(name) for name, _ in PORT_TYPES))
+
+
+def compile_interface_pattern(pattern=DEFAULT_INTERFACE_PATTERN):
+    """Compiled, case insensitive interface name pattern"""
+    return re.compile(pattern, re.IGNORECASE)
+
+
+INTERFACE_PATTERN = compile_interface_pattern()
+
+
+class ConfigNode:
+    """One line of a config and the lines indented below it
+
+    The lines of the subtree are kept as read and the child nodes are only
+    built on first access of children, so checking a block never builds
+    nodes it does not look at.
+    """
+
+    __slots__ = ('text', 'indent', '_lines', '_children')
+
+    def __init__(self, text, indent, lines):
+        self.text = text
+        self.indent = indent
+        self._lines = lines
+        self._children = None
+
+    def __repr__(self):
+        return "ConfigNode({!r})".format(self.text)
+
+    @property
+    def children(self):
+        if self._children is None:
+            self._children = _build_nodes(self._lines)
+        return self._children
+
+
+def _build_nodes(lines):
+    """Sibling nodes of config lines, every line indented deeper belongs to the node above it"""
+    nodes = []
+    level = None
+    for raw in lines:
+        body = raw.lstrip()
+        indent = len(raw) - len(body)
+        if level is None or indent <= level:
+            level = indent if level is None else level
+            nodes.append(ConfigNode(body.rstrip(), indent, []))
+        else:
+            nodes[-1]._lines.append(raw)
+    return nodes
+
+
+def _iter_blocks(lines, interface_pattern):
+    """(name, description, commands, ConfigNode) of the matching top-level interface blocks"""
+    top_level = None
+    name = None
+    node = description = commands = level = None
+    for raw in lines:
+        body = raw.lstrip()
+        if not body or body[0] == '!':
+            continue
+        indent = len(raw) - len(body)
+        if top_level is None:
+            top_level = indent
+
+        if indent <= top_level:
+            if name is not None:
+                yield name, description, commands, node
+                name = None
+            if body[:9].lower() == 'interface':
+                parts = body.split()
+                if len(parts) > 1 and interface_pattern.match(parts[1]):
+                    name, description, commands, level = parts[1], None, [], None
+                    node = ConfigNode(body.rstrip(), indent, [])
+            continue
+
+        if name is None:
+            continue
+        node._lines.append(raw)
+        if level is None:
+            level = indent
+        body = body.rstrip()
+        if indent <= level and body[:11].lower() == 'description':
+            description = body[11:].strip()
+        else:
+            commands.append(body)
+
+    if name is not None:
+        yield name, description, commands, node
+
+
+def iter_interface_nodes(lines, interface_pattern=INTERFACE_PATTERN):
+    """(name, ConfigNode) of every top-level interface block whose name matches the pattern
+
+    lines is any iterable of config lines, e.g. an open file or the output
+    of a command as it arrives. A block is yielded as soon as the next
+    top-level line closes it, only the lines of the current block are
+    held. Empty lines and "!" separators carry no hierarchy and are dropped.
+    """
+    for name, _, _, node in _iter_blocks(lines, interface_pattern):
+        yield name, node
+
+
+def iter_interface_blocks(lines, interface_pattern=INTERFACE_PATTERN):
+    """(name, description, commands) of every matching top-level interface block
+
+    Like iter_interface_nodes(). The commands are all lines of the block
+    at any depth, stripped and in config order, so nested commands (e.g.
+    below a service-policy) are checked as well. Only a description line
+    directly below the interface line is taken as its description.
+    """
+    for name, description, commands, _ in _iter_blocks(lines, interface_pattern):
+        yield name, description, commands
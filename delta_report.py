@@ -0,0 +1,138 @@
+import datetime
+import html
+import json
+
+from compliance_results import COMPLIANT, NON_COMPLIANT, SKIPPED
+from report_writer import REPORT_HEAD
+
+# Positions in the interface rows of ResultStore.interface_rows()
+STATUS, TEMPLATE, DESCRIPTION, MISSING, UNEXPECTED, TO_REMOVE = range(6)
+
+DELTA_SECTION = """
+        <h2>{0} ({1})</h2>
+        <table>
+            <tr>{2}</tr>
+{3}
+        </table>
+"""
+
+DELTA_FOOTER = """
+    </body>
+    </html>
+    """
+
+
+def _keys_with(rows, status):
+    return {key for key, row in rows.items() if row[STATUS] == status}
+
+
+def compute_delta(baseline, current, checked_hosts, baseline_templates=None, current_templates=None):
+    """Compare the interface rows of two runs, keyed by (host, interface)
+
+    Only hosts checked successfully in the current run are compared, so
+    hosts that failed or were filtered out do not show up as fixed. Every
+    category is a set operation over the keys, no pair of rows is compared
+    more than once.
+    """
+    failed_hosts = sorted(host for host, failed in checked_hosts.items() if failed)
+    baseline = {key: row for key, row in baseline.items() if checked_hosts.get(key[0]) is False}
+
+    current_non_compliant = _keys_with(current, NON_COMPLIANT)
+    baseline_non_compliant = _keys_with(baseline, NON_COMPLIANT)
+    common = current.keys() & baseline.keys()
+
+    baseline_templates = baseline_templates or {}
+    current_templates = current_templates or {}
+    common_templates = current_templates.keys() & baseline_templates.keys()
+
+    return {
+        'newly_non_compliant': sorted(current_non_compliant - baseline_non_compliant),
+        'newly_fixed': sorted((baseline_non_compliant - current_non_compliant) & _keys_with(current, COMPLIANT)),
+        'newly_skipped': sorted(_keys_with(current, SKIPPED) - _keys_with(baseline, SKIPPED)),
+        'template_changed': sorted(key for key in common
+                                   if current[key][TEMPLATE] != baseline[key][TEMPLATE]
+                                   and current[key][TEMPLATE] and baseline[key][TEMPLATE]),
+        'templates_added': sorted(current_templates.keys() - baseline_templates.keys()),
+        'templates_removed': sorted(baseline_templates.keys() - current_templates.keys()),
+        'templates_changed': sorted(name for name in common_templates
+                                    if current_templates[name] != baseline_templates[name]),
+        'failed_hosts': failed_hosts,
+    }
+
+
+def delta_summary(delta):
+    """Number of entries per category as text lines"""
+    titles = (
+        ('newly_non_compliant', "Newly non-compliant interfaces"),
+        ('newly_fixed', "Newly fixed interfaces"),
+        ('newly_skipped', "Newly skipped interfaces"),
+        ('template_changed', "Interfaces with a different template"),
+        ('templates_added', "Templates added"),
+        ('templates_removed', "Templates removed"),
+        ('templates_changed', "Templates changed"),
+        ('failed_hosts', "Failed hosts (not compared)"),
+    )
+    return ["{}: {}".format(title, len(delta[key])) for key, title in titles]
+
+
+def _commands(value):
+    return ", ".join(html.escape(cmd) for cmd in json.loads(value)) if value else ""
+
+
+def _section(title, headers, rows):
+    head = "".join("<th>{}</th>".format(header) for header in headers)
+    body = "\n".join("            <tr>{}</tr>".format("".join("<td>{}</td>".format(cell) for cell in row))
+                     for row in rows)
+    return DELTA_SECTION.format(title, len(rows), head, body)
+
+
+def write_delta_report(filename, delta, current, baseline, baseline_run, current_run):
+    """Write the delta between two runs as a compact HTML report"""
+    def started(run):
+        return datetime.datetime.fromtimestamp(run['started_at']).strftime('%Y-%m-%d %H:%M:%S')
+
+    escape = html.escape
+    sections = [
+        _section("Newly Non-Compliant Interfaces", ("Host", "Interface", "Description", "Template", "Missing commands",
+                                                    "Unexpected commands", "Commands to remove"),
+                 [(escape(host), escape(intf), escape(current[(host, intf)][DESCRIPTION] or ""),
+                   escape(current[(host, intf)][TEMPLATE] or ""), _commands(current[(host, intf)][MISSING]),
+                   _commands(current[(host, intf)][UNEXPECTED]), _commands(current[(host, intf)][TO_REMOVE]))
+                  for host, intf in delta['newly_non_compliant']]),
+        _section("Newly Fixed Interfaces", ("Host", "Interface", "Template"),
+                 [(escape(host), escape(intf), escape(current[(host, intf)][TEMPLATE] or ""))
+                  for host, intf in delta['newly_fixed']]),
+        _section("Newly Skipped Interfaces", ("Host", "Interface", "Description"),
+                 [(escape(host), escape(intf), escape(current[(host, intf)][DESCRIPTION] or "No description"))
+                  for host, intf in delta['newly_skipped']]),
+        _section("Interfaces With a Different Template", ("Host", "Interface", "Previous template", "Template"),
+                 [(escape(host), escape(intf), escape(baseline[(host, intf)][TEMPLATE]),
+                   escape(current[(host, intf)][TEMPLATE]))
+                  for host, intf in delta['template_changed']]),
+        _section("Template Files", ("Template", "Change"),
+                 [(escape(name), change) for key, change in (('templates_added', "added"),
+                                                             ('templates_removed', "removed"),
+                                                             ('templates_changed', "changed"))
+                  for name in delta[key]]),
+        _section("Failed Hosts, Not Compared", ("Host",), [(escape(host),) for host in delta['failed_hosts']]),
+    ]
+
+    with open(filename, 'w', encoding='utf-8') as f:
+        f.write(REPORT_HEAD.format(started(current_run)))
+        f.write("<p>Changes of run {} ({}) since run {} ({}).</p>".format(
+            current_run['id'], started(current_run), baseline_run['id'], started(baseline_run)))
+        f.write("<ul>{}</ul>".format("".join("<li>{}</li>".format(line) for line in delta_summary(delta))))
+        f.write("".join(sections))
+        f.write(DELTA_FOOTER)
+    return filename
+
+
+def delta_between_runs(store, baseline_run_id, run_id):
+    """Returns (delta, current rows, baseline rows, baseline run, current run) of two stored runs"""
+    baseline_run = store.run(baseline_run_id)
+    current_run = store.run(run_id)
+    baseline = store.interface_rows(baseline_run_id)
+    current = store.interface_rows(run_id)
+    delta = compute_delta(baseline, current, store.checked_hosts(run_id),
+                          baseline_run['templates'], current_run['templates'])
+    return delta, current, baseline, baseline_run, current_run
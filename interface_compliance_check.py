@@ -1,29 +1,39 @@
 import argparse
-from nornir import InitNornir
-from nornir_netmiko import netmiko_send_command
-from nornir_utils.plugins.functions import print_result
-import re
-import os
-import datetime
-from collections import defaultdict
-from nornir import InitNornir
-from nornir_netmiko import netmiko_send_command
-from nornir_utils.plugins.functions import print_result
-import re
-import os
 import datetime
-from collections import defaultdict
+import functools
+import itertools
+import json
 import logging
+import os
+import queue
+import re
 import sys
-import socks
-import socket
-import yaml
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+
+# nornir, netmiko, socks and yaml are imported by the functions that need
+# them, offline checks and the report commands start without loading them
+from collection_scheduler import CollectionScheduler
+from config_tree import (DEFAULT_INTERFACE_PATTERN, INTERFACE_PATTERN, OTHER_INTERFACE_TYPES, PORT_TYPES,
+                         compile_interface_pattern, iter_interface_blocks)
+from compliance_results import COMPLIANT, NON_COMPLIANT, SKIPPED, HostResult, InterfaceResult, render_host_result
+from metrics import HostMetrics, MetricsCollector, null_phase
+from report_writer import HtmlReportWriter
+from result_cache import LineHasher, ResultCache, config_file_hash, config_hash, template_fingerprint
+from delta_report import delta_between_runs, delta_summary, write_delta_report
+from result_export import EXPORT_FORMATS, ResultExporter
+from result_store import ResultStore, write_report
+from sharding import load_weights, parse_shard, shard_hosts, shard_label
+from template_cache import TemplateCache, file_error, list_template_files, parse_template_file
+from template_matcher import EvaluationCache, TemplateMatcher, TemplateResolver
+
 
 def initialize_nornir(config):
     """Initialize Nornir with configuration from config.yaml"""
-    from nornir.core.inventory import Defaults, Inventory
-    
-    
+    from nornir import InitNornir
+
     return InitNornir(
         runner={
             "plugin": "threaded",
@@ -47,6 +57,8 @@ def initialize_nornir(config):
 
 def load_config(config_file='config.yaml'):
     """Load configuration from YAML file with CLI override support"""
+    import yaml
+
     with open(config_file, 'r') as f:
         config = yaml.safe_load(f)
     
@@ -79,477 +91,224 @@ def validate_config(config):
     return True
 
 def find_matching_template(description, parsed_templates):
-    if not description:
-        return None
-    
-    # Exakte Übereinstimmung
-    if description + '.txt' in parsed_templates:
-        return parsed_templates[description + '.txt']
-    
-    # Teilübereinstimmung
-    for template_name, template_content in parsed_templates.items():
-        template_base = template_name.rsplit('.', 1)[0]  # Entfernt die .txt Endung
-        if template_base in description:
-            return template_content
-    
-    return None
+    """Template for a single description
+
+    Builds a new resolver on every call, use one TemplateResolver per run
+    when resolving many descriptions.
+    """
+    return TemplateResolver(parsed_templates).resolve(description)
+
+
+MISSING_CONFIG_DIR = "missing_configs"
+
+
+def report_filename(now=None):
+    now = now or datetime.datetime.now()
+    return "compliance_report_{0}.html".format(now.strftime('%Y%m%d_%H%M%S'))
 
 
 def generate_report(results, parsed_files, config_dir):
-    """Generate HTML report with compliance statistics and template details"""
+    """Generate HTML report with compliance statistics and template details
+
+    results maps host names to HostResult. main() stores the results of a
+    run in the ResultStore and renders the report from there, see
+    result_store.write_report().
+    """
     now = datetime.datetime.now()
-    report_filename = "compliance_report_{0}.html".format(now.strftime('%Y%m%d_%H%M%S'))
+    with HtmlReportWriter(report_filename(now), parsed_files, config_dir, now) as writer:
+        for host_result in results.values():
+            writer.add_host(host_result)
     
-    # Initialize statistics
-    total_switches = len(results)
-    compliant_switches = 0
-    non_compliant_switches = 0
-    failed_switches = 0
-    total_interfaces = 0
-    compliant_interfaces = 0
-    non_compliant_interfaces = 0
-    skipped_interfaces = 0
+    return writer.filename
+
+# Catalyst IOS accepts at most five comma separated ranges per "interface range"
+MAX_INTERFACE_RANGES = 5
+
+INTERFACE_NUMBER = re.compile(r'^(.*?)(\d+)$')
+INTERFACE_RANGE = re.compile(r'^(.*?)(\d+)\s*-\s*(\d+)$')
+
+
+def remediation_blocks(host_result, template_resolver):
+    """[(InterfaceResult, config lines)] of the interfaces that need changes, lines in template order"""
+    blocks = []
     
-    # Collect statistics
-    for host, multi_result in results.items():
-        if multi_result.failed:
-            failed_switches += 1
+    # Generate missing config for each interface
+    for intf in host_result.non_compliant_interfaces:
+        # Skip if no changes needed
+        if not (intf.missing or intf.to_remove):
             continue
-            
-        # Get result from first task
-        result = multi_result[0].result
-        lines = result.split('\n')
-
-        # Hosts status tracking
-        has_non_compliant = False
-        current_port = None
-        host_interfaces = set()
-        host_non_compliant = set()
-        host_skipped = set()
         
-        # Parse output line by line
-        for line in lines:
-            if line.startswith("GigabitEthernet"):
-                current_port = line.strip(':')
-                host_interfaces.add(current_port)
-                total_interfaces += 1
-            elif line == "Non-Compliant":
-                if current_port:
-                    has_non_compliant = True
-                    host_non_compliant.add(current_port)
-            elif "Missing commands:" in line or "Unexpected commands:" in line or "Commands to remove:" in line:
-                has_non_compliant = True
-            elif "Skipped Interfaces" in line:
-                skipped_section = result.strip().split("Skipped Interfaces")[1].split('\n')
-                for skip_line in skipped_section:
-                    if ":" in skip_line:
-                        port = skip_line.split(':')[0].strip()
-                        if port.startswith("GigabitEthernet"):
-                            host_skipped.add(port)
-                            if port in host_interfaces:
-                                host_interfaces.remove(port)
-
-        # Update counters
-        if has_non_compliant:
-            non_compliant_switches += 1
-        else:
-            compliant_switches += 1
-        skipped_interfaces += len(host_skipped)
-        non_compliant_interfaces += len(host_non_compliant)
-        compliant_interfaces += (len(host_interfaces) - len(host_non_compliant) - len(host_skipped))
-
-    # Generate HTML report
-    html_content = """
-    <html>
-    <head>
-        <title>Compliance Report</title>
-        <style>
-            body {{ font-family: Arial, sans-serif; padding: 20px; }}
-            table {{ border-collapse: collapse; width: 100%; margin-bottom: 20px; }}
-            th, td {{ border: 1px solid #ddd; padding: 8px; }}
-            th {{ background-color: #f2f2f2; }}
-            .compliant {{ color: green; }}
-            .non-compliant {{ color: red; }}
-            .failed {{ color: orange; }}
-            .stats-container {{ 
-                display: grid;
-                grid-template-columns: 1fr 1fr;
-                gap: 20px;
-                margin-bottom: 20px;
-            }}
-            .stats-box {{
-                border: 1px solid #ddd;
-                padding: 15px;
-                border-radius: 5px;
-            }}
-            .template-table {{
-                margin-top: 20px;
-            }}
-            .template-table ul {{
-                margin: 0;
-                padding-left: 20px;
-            }}
-            .template-name {{
-                font-weight: bold;
-            }}
-        </style>
-    </head>
-    <body>
-        <h1>Compliance Report - Generated on {0}</h1>
+        template_content = template_resolver.templates[intf.template]
+        commands = []
         
-        <div class="stats-container">
-            <div class="stats-box">
-                <h2>Switch Statistics</h2>
-                <table>
-                    <tr><td>Total Switches:</td><td>{1}</td></tr>
-                    <tr><td>Compliant Switches:</td><td class="compliant">{2}</td></tr>
-                    <tr><td>Non-Compliant Switches:</td><td class="non-compliant">{3}</td></tr>
-                    <tr><td>Failed Switches:</td><td class="failed">{4}</td></tr>
-                </table>
-            </div>
+        # First handle all commands in the original template order
+        for cmd in template_content.required:
+            cmd_text = cmd.strip()
             
-            <div class="stats-box">
-                <h2>Interface Statistics</h2>
-                <table>
-                    <tr><td>Total Interfaces:</td><td>{5}</td></tr>
-                    <tr><td>Compliant Interfaces:</td><td class="compliant">{6}</td></tr>
-                    <tr><td>Non-Compliant Interfaces:</td><td class="non-compliant">{7}</td></tr>
-                    <tr><td>Skipped Interfaces:</td><td>{8}</td></tr>
-                </table>
-            </div>
-        </div>
-
-        <h2>Template Details:</h2>
-        <table class="template-table">
-            <tr>
-                <th>Template Name</th>
-                <th>Required Commands</th>
-                <th>Additional Allowed Commands</th>
-            </tr>
-    """.format(
-        now.strftime('%Y-%m-%d %H:%M:%S'),
-        total_switches,
-        compliant_switches,
-        non_compliant_switches,
-        failed_switches,
-        total_interfaces,
-        compliant_interfaces,
-        non_compliant_interfaces,
-        skipped_interfaces
-    )
+            if cmd_text.startswith('-'):  # Command to be removed
+                remove_cmd = cmd_text[1:].strip()
+                # Check if this command needs to be removed
+                if remove_cmd in intf.to_remove:
+                    commands.append(f" no {remove_cmd}")
+            else:  # Regular command
+                # Check if this command is missing
+                if cmd_text in intf.missing:
+                    commands.append(f" {cmd_text}")
+        
+        blocks.append((intf, commands))
+    
+    return blocks
 
-    # Add template details
-    for template_name, template_content in parsed_files.items():
-        html_content += """
-            <tr>
-                <td class="template-name">{0}</td>
-                <td><ul>{1}</ul></td>
-                <td><ul>{2}</ul></td>
-            </tr>
-        """.format(
-            template_name,
-            "".join("<li>{}</li>".format(cmd) for cmd in template_content['required']),
-            "".join("<li>{}</li>".format(cmd) for cmd in template_content['additional_allowed'])
-        )
-
-    html_content += """
-        </table>
-
-        <h2>Parsed Template Files:</h2>
-        <ul>
-    """
 
-    for filename in parsed_files.keys():
-        html_content += "<li>{0}</li>".format(filename)
-
-    html_content += """
-        </ul>
-        <p>Missing configuration files are stored in: {0}</p>
-        <h2>Host Results:</h2>
-        <table>
-            <tr>
-                <th>Host</th>
-                <th>Compliance Status</th>
-                <th>Details</th>
-            </tr>
-    """.format(config_dir)
-
-    # Add host results
-    for host, multi_result in results.items():
-        if multi_result.failed:
-            status = "FAILED"
-            details = "Task failed: {0}".format(multi_result)
-            status_class = "failed"
+def format_interface_ranges(names, max_ranges=MAX_INTERFACE_RANGES):
+    """Arguments of "interface range" commands covering the given interfaces
+
+    Consecutive port numbers with the same prefix (type and module) become
+    one range, every argument holds at most max_ranges ranges.
+    """
+    ranges = []
+    for name in names:
+        match = INTERFACE_NUMBER.match(name)
+        if match is None:
+            ranges.append([name, None, None])
+            continue
+        prefix, number = match.group(1), int(match.group(2))
+        if ranges and ranges[-1][0] == prefix and ranges[-1][2] == number - 1:
+            ranges[-1][2] = number
         else:
-            result = multi_result[0].result
-            port_compliance = {}
-            port_description = {}
-            port_missing_commands = {}
-            port_unexpected_commands = {}
-            port_remove_commands = {}
-            skipped_ports = {}
-            non_compliant_ports = []
-            current_port = None
-            
-            for line in result.split('\n'):
-                if line.startswith("GigabitEthernet"):
-                    current_port = line.strip(':')
-                    port_compliance[current_port] = "Compliant"  # Default to compliant
-                elif line.startswith("Description:"):
-                    if current_port:
-                        port_description[current_port] = line.split(":", 1)[1].strip()
-                elif line == "Non-Compliant":
-                    if current_port:
-                        port_compliance[current_port] = "Non-Compliant"
-                        non_compliant_ports.append(current_port)
-                elif line.startswith("Missing commands:"):
-                    if current_port:
-                        missing_cmds = line.split(":", 1)[1].strip()
-                        port_missing_commands[current_port] = missing_cmds
-                        port_compliance[current_port] = "Non-Compliant"
-                        non_compliant_ports.append(current_port)
-                elif line.startswith("Unexpected commands:"):
-                    if current_port:
-                        unexpected_cmds = line.split(":", 1)[1].strip()
-                        port_unexpected_commands[current_port] = unexpected_cmds
-                        port_compliance[current_port] = "Non-Compliant"
-                        non_compliant_ports.append(current_port)
-                elif line.startswith("Commands to remove:"):
-                    if current_port:
-                        remove_cmds = line.split(":", 1)[1].strip()
-                        port_remove_commands[current_port] = remove_cmds
-                        port_compliance[current_port] = "Non-Compliant"
-                        non_compliant_ports.append(current_port)
-                elif "Skipped Interfaces" in line:
-                    skipped_section = result.split("Skipped Interfaces")[1].strip().split('\n')
-                    for skipped_line in skipped_section:
-                        if ': ' in skipped_line:
-                            port, desc = skipped_line.split(': ', 1)
-                            skipped_ports[port.strip()] = desc.strip()
-            
-            if non_compliant_ports:
-                status = "NON-COMPLIANT"
-                status_class = "non-compliant"
-            else:
-                status = "COMPLIANT"
-                status_class = "compliant"
-
-            details = "<h3>Non-Compliant Interfaces:</h3>"
-            if non_compliant_ports:
-                details += "<ul>"
-                for port in non_compliant_ports:
-                    port_details = []
-                    description = port_description.get(port, "No description")
-                    details += f"<li><strong>{port}</strong> ({description})<ul>"
-                    
-                    if port in port_missing_commands:
-                        details += f"<li>Missing commands: {port_missing_commands[port]}</li>"
-                    
-                    if port in port_unexpected_commands:
-                        details += f"<li>Unexpected commands: {port_unexpected_commands[port]}</li>"
-                    
-                    if port in port_remove_commands:
-                        details += f"<li>Commands to remove: {port_remove_commands[port]}</li>"
-                    
-                    details += "</ul></li>"
-                details += "</ul>"
-            else:
-                details += "<p>All interfaces are compliant.</p>"
-
-            if skipped_ports:
-                details += "<h3>Skipped Interfaces:</h3><ul>"
-                for port, description in skipped_ports.items():
-                    details += "<li>{0}: {1}</li>".format(port, description)
-                details += "</ul>"
-
-        html_content += """
-            <tr>
-                <td>{0}</td>
-                <td class="{1}">{2}</td>
-                <td>{3}</td>
-            </tr>
-        """.format(host, status_class, status, details)
-
-    html_content += """
-        </table>
-    </body>
-    </html>
+            ranges.append([prefix, number, number])
+
+    parts = []
+    for prefix, first, last in ranges:
+        if first is None:
+            parts.append(prefix)
+        elif first == last:
+            parts.append(f"{prefix}{first}")
+        else:
+            parts.append(f"{prefix}{first} - {last}")
+    return [" , ".join(parts[index:index + max_ranges]) for index in range(0, len(parts), max_ranges)]
+
+
+def expand_interface_ranges(argument):
+    """Interface names of an "interface range" argument, the reverse of format_interface_ranges()"""
+    names = []
+    for part in argument.split(','):
+        part = part.strip()
+        match = INTERFACE_RANGE.match(part)
+        if match:
+            prefix, first, last = match.group(1), int(match.group(2)), int(match.group(3))
+            names.extend(f"{prefix}{number}" for number in range(first, last + 1))
+        elif part:
+            names.append(part)
+    return names
+
+
+def pushed_interfaces(config_lines):
+    """Names of the interfaces configured by the lines of a missing config file"""
+    names = []
+    for line in config_lines:
+        if line.startswith("interface range "):
+            names.extend(expand_interface_ranges(line[len("interface range "):]))
+        elif line.startswith("interface "):
+            names.append(line.split(None, 1)[1].strip())
+    return names
+
+
+def render_remediation(blocks, interface_ranges=False, max_ranges=MAX_INTERFACE_RANGES):
+    """Config lines of remediation_blocks()
+
+    With interface_ranges, interfaces that need exactly the same lines are
+    configured together with "interface range". Their description lines
+    are left out, the description is unchanged and differs per port.
     """
+    missing_config = []
+    if not interface_ranges:
+        for intf, commands in blocks:
+            # Start interface config block
+            missing_config.append(f"interface {intf.name}")
+            if intf.description:
+                missing_config.append(f" description {intf.description}")
+            missing_config.extend(commands)
+            missing_config.append("!")
+        return missing_config
+
+    groups = {}
+    for intf, commands in blocks:
+        groups.setdefault(tuple(commands), []).append(intf)
+
+    for commands, interfaces in groups.items():
+        if len(interfaces) == 1:
+            missing_config.extend(render_remediation([(interfaces[0], commands)]))
+            continue
+        for argument in format_interface_ranges([intf.name for intf in interfaces], max_ranges):
+            missing_config.append(f"interface range {argument}")
+            missing_config.extend(commands)
+            missing_config.append("!")
+    return missing_config
+
+
+def per_interface_line_count(blocks):
+    """Number of lines render_remediation() writes without interface ranges"""
+    return sum(len(commands) + (3 if intf.description else 2) for intf, commands in blocks)
 
-    with open(report_filename, 'w') as report_file:
-        report_file.write(html_content)
-    
-    return report_filename
 
-def generate_missing_config_files(results, parsed_files):
-    """Generate missing config files while preserving template command order"""
-    config_dir = "missing_configs"
+def generate_missing_config_files(results, template_resolver, interface_ranges=True,
+                                  max_ranges=MAX_INTERFACE_RANGES, line_counts=None):
+    """Generate missing config files while preserving template command order
+
+    results maps host names to HostResult. Interfaces that need the same
+    lines are grouped into "interface range" blocks unless interface_ranges
+    is False. line_counts receives {host: (lines per interface, lines written)}.
+    """
+    config_dir = MISSING_CONFIG_DIR
     if not os.path.exists(config_dir):
         os.makedirs(config_dir)
     
-    for host, multi_result in results.items():
-        if not multi_result.failed:
-            result = multi_result[0].result
-            missing_config = []
-            interfaces_data = {}
-            current_interface = None
-            skip_mode = False
-            
-            # First parse all interfaces and their data from results
-            for line in result.split('\n'):
-                if "Skipped Interfaces" in line:
-                    skip_mode = True
-                    continue
-                
-                if not skip_mode:
-                    if line.startswith("GigabitEthernet"):
-                        current_interface = line.strip(':')
-                        interfaces_data[current_interface] = {
-                            'description': None,
-                            'missing_commands': [],
-                            'remove_commands': [],
-                            'unexpected_commands': []
-                        }
-                    elif line.startswith("Description:") and current_interface:
-                        interfaces_data[current_interface]['description'] = line.split(":", 1)[1].strip()
-                    elif line.startswith("Missing commands:") and current_interface:
-                        commands = [cmd.strip() for cmd in line.split(":", 1)[1].strip().split(",")]
-                        interfaces_data[current_interface]['missing_commands'] = commands
-                    elif line.startswith("Commands to remove:") and current_interface:
-                        commands = [cmd.strip() for cmd in line.split(":", 1)[1].strip().split(",")]
-                        interfaces_data[current_interface]['remove_commands'] = commands
-                    elif line.startswith("Unexpected commands:") and current_interface:
-                        commands = [cmd.strip() for cmd in line.split(":", 1)[1].strip().split(",")]
-                        interfaces_data[current_interface]['unexpected_commands'] = commands
-            
-            # Generate missing config for each interface
-            for interface, data in interfaces_data.items():
-                if not data['description']:
-                    continue
-                
-                # Find matching template based on description
-                matching_template = None
-                template_content = None
-                
-                for template_name, content in parsed_files.items():
-                    template_base = template_name.split('.')[0]
-                    if template_base in data['description']:
-                        matching_template = template_name
-                        template_content = content
-                        break
-                
-                # Skip if no matching template or no changes needed
-                if not matching_template or not (data['missing_commands'] or data['remove_commands']):
-                    continue
-                
-                # Start interface config block
-                interface_config = [f"interface {interface}"]
-                if data['description']:
-                    interface_config.append(f" description {data['description']}")
-                
-                # Track which commands have been added/removed
-                processed_missing = []
-                processed_remove = []
-                
-                # Process commands in template order
-                if template_content:
-                    # First handle all commands in the original template order
-                    for cmd in template_content['required']:
-                        cmd_text = cmd.strip()
-                        
-                        if cmd_text.startswith('-'):  # Command to be removed
-                            remove_cmd = cmd_text[1:].strip()
-                            # Check if this command needs to be removed
-                            for to_remove in data['remove_commands']:
-                                if to_remove.strip() == remove_cmd:
-                                    interface_config.append(f" no {remove_cmd}")
-                                    processed_remove.append(to_remove)
-                                    break
-                        else:  # Regular command
-                            # Check if this command is missing
-                            for missing in data['missing_commands']:
-                                if missing.strip() == cmd_text:
-                                    interface_config.append(f" {cmd_text}")
-                                    processed_missing.append(missing)
-                                    break
-                
-                interface_config.append("!")
-                missing_config.extend(interface_config)
-            
+    for host, host_result in results.items():
+        if not host_result.failed:
+            blocks = remediation_blocks(host_result, template_resolver)
+            missing_config = render_remediation(blocks, interface_ranges, max_ranges)
             if missing_config:
                 filename = os.path.join(config_dir, "{}_missing_config.txt".format(host))
                 with open(filename, 'w') as f:
                     f.write("\n".join(missing_config))
+                if line_counts is not None:
+                    line_counts[host] = (per_interface_line_count(blocks), len(missing_config))
     
     return config_dir
 
-def check_interface_compliance(config, required_commands, additional_allowed_commands=None):
-    """Check interface compliance with template requirements"""
-    if additional_allowed_commands is None:
-        additional_allowed_commands = []
-    
-    # Split the config into lines and clean
-    config_lines = [line.strip() for line in config.split('\n') if line.strip()]
-    
-    # Process required commands
-    standard_commands = []
-    remove_commands = []
-    
-    for cmd in required_commands:
-        cmd = cmd.strip()
-        if cmd.startswith('-'):
-            remove_commands.append(cmd[1:].strip())
-        else:
-            standard_commands.append(cmd)
-    
-    # Track compliance
-    found_commands = set()
-    unexpected_commands = []
-    commands_to_remove = []
-    
-    # Check each config line against requirements
-    for line in config_lines:
-        if not line or line.startswith('interface'):
-            continue
-        
-        # Check against standard commands
-        matched_standard = False
-        for cmd in standard_commands:
-            if line == cmd:
-                found_commands.add(cmd)
-                matched_standard = True
-                break
-        
-        # Check against additional allowed commands
-        matched_allowed = False
-        if not matched_standard:
-            for cmd in additional_allowed_commands:
-                if line == cmd:
-                    matched_allowed = True
-                    break
-        
-        # Check against commands to remove
-        matched_remove = False
-        for cmd in remove_commands:
-            if line == cmd:
-                commands_to_remove.append(cmd)
-                matched_remove = True
-                break
-        
-        # If not matched anywhere, it's unexpected
-        if not (matched_standard or matched_allowed or matched_remove):
-            unexpected_commands.append(line)
-    
-    # Identify missing commands
-    missing_commands = set(standard_commands) - found_commands
-    
-    # Determine overall compliance
+def parse_interfaces(config, interface_pattern=INTERFACE_PATTERN):
+    """Parse the interfaces matching interface_pattern from a running config
+
+    Returns {name: {'config': [...], 'description': ...}} with every command
+    of each interface block, nested ones included.
+    """
+    interfaces = {}
+    for name, description, commands in iter_interface_blocks(config.splitlines(), interface_pattern):
+        interfaces[name] = {'config': commands, 'description': description}
+    return interfaces
+
+
+def parse_intf_template_files_individually(directory_path):
+    """Parse the interface template files without the template cache, returns ({filename: template}, errors)"""
+    result = {}
+    template_files, errors = list_template_files(directory_path)
+    for filename, file_path in template_files:
+        try:
+            result[filename] = parse_template_file(file_path)
+        except (OSError, ValueError) as e:
+            errors.append(file_error(filename, e))
+    return result, errors
+
+
+def format_compliance(missing_commands, unexpected_commands, commands_to_remove):
+    """Format the result of a compliance check as text"""
     is_compliant = not (missing_commands or commands_to_remove or unexpected_commands)
     
     if is_compliant:
         return "Compliant"
     else:
-        result = ["Non-Compliant"]
+        result = ["Non-Compliant"]  # Start with Non-Compliant in first line
         if missing_commands:
             result.append("Missing commands: {}".format(", ".join(missing_commands)))
         if unexpected_commands:
@@ -558,255 +317,720 @@ def check_interface_compliance(config, required_commands, additional_allowed_com
             result.append("Commands to remove: {}".format(", ".join(commands_to_remove)))
         return "\n".join(result)
 
-def parse_intf_template_files_individually(directory_path):
-    """Parse interface template files with improved handling of command formats"""
-    result = {}
-    errors = []
 
-    try:
-        for filename in os.listdir(directory_path):
-            if filename.endswith('.txt'):
-                file_path = os.path.join(directory_path, filename)
-                try:
-                    with open(file_path, 'r') as file:
-                        required = []
-                        additional_allowed = []
-                        for line in file:
-                            line = line.strip()
-                            if not line or line.startswith('#'):
-                                continue  # Skip empty lines and comments
-                            elif line.startswith('+'):
-                                additional_allowed.append(line[1:].strip())
-                            else:
-                                # Store the full line exactly as it appears
-                                required.append(line)
-                        
-                        result[filename] = {
-                            "required": required,
-                            "additional_allowed": additional_allowed
-                        }
-                except IOError:
-                    errors.append(f"Error reading file {filename}")
-
-    except FileNotFoundError:
-        errors.append(f"Directory {directory_path} not found.")
-    except PermissionError:
-        errors.append(f"Permission denied for directory {directory_path}.")
+def check_interface_compliance(config, required_commands, additional_allowed_commands=None):
+    """Check interface compliance with template requirements
 
-    return result, errors
+    Compiles the template on every call, use a TemplateMatcher from
+    compile_templates() when checking many interfaces.
+    """
+    matcher = TemplateMatcher(required_commands, additional_allowed_commands)
+    return format_compliance(*matcher.evaluate(config.split('\n')))
 
 
-def parse_interfaces(config):
-    """Parse interface configurations from running config"""
-    interfaces = {}
-    current_interface = None
-    
-    for line in config.splitlines():
-        line = line.strip()
-        if line.lower().startswith('interface'):
-            current_interface = line.split()[1]
-            interfaces[current_interface] = {
-                'config': [],
-                'description': None
-            }
-        elif current_interface and line and not line.startswith('!'):
-            if line.lower().startswith('description'):
-                interfaces[current_interface]['description'] = line[11:].strip()
-            else:
-                interfaces[current_interface]['config'].append(line)
-        elif line.startswith('!'):
-            current_interface = None
-    
-    return interfaces
+def evaluate_switch_config(host, config, template_resolver, phase=null_phase, interface_pattern=INTERFACE_PATTERN,
+                           host_metrics=None):
+    """Evaluate a complete running-config against the compiled interface templates, returns a HostResult
 
+    Only interfaces whose name matches interface_pattern are checked. phase
+    is HostMetrics.phase of the host if parse and check are timed. With
+    host_metrics the checked and reused interface evaluations are counted.
+    """
+    return evaluate_config_lines(host, config.splitlines(), template_resolver, phase, interface_pattern,
+                                 host_metrics=host_metrics)
 
-def parse_intf_template_files_individually(directory_path):
-    result = {}
-    errors = []
 
-    try:
-        for filename in os.listdir(directory_path):
-            if filename.endswith('.txt'):
-                file_path = os.path.join(directory_path, filename)
-                try:
-                    with open(file_path, 'r') as file:
-                        required = []
-                        additional_allowed = []
-                        for line in file:
-                            line = line.strip()
-                            if line.startswith('#'):
-                                continue  # Ignoriere Kommentarzeilen
-                            elif line.startswith('+'):
-                                additional_allowed.append(line[1:].strip())
-                            elif line:
-                                required.append(line)
-                        
-                        result[filename] = {
-                            "required": required,
-                            "additional_allowed": additional_allowed
-                        }
-                except IOError:
-                    errors.append(f"Fehler beim Lesen der Datei {filename}")
-
-    except FileNotFoundError:
-        errors.append(f"Das Verzeichnis {directory_path} wurde nicht gefunden.")
-    except PermissionError:
-        errors.append(f"Keine Berechtigung, auf das Verzeichnis {directory_path} zuzugreifen.")
+def evaluate_config_lines(host, lines, template_resolver, phase=null_phase, interface_pattern=INTERFACE_PATTERN,
+                          read_phase='parse', host_metrics=None):
+    """evaluate_switch_config for a running-config given as lines, e.g. an open file
 
-    return result, errors
+    Every interface block is checked as soon as it is complete, the config
+    is never held as a whole. Reading the next block is timed as
+    read_phase, use 'fetch' when the lines come from the device. With the
+    EvaluationCache of the resolver, identical interface bodies are only
+    evaluated once.
+    """
+    interface_results = []
+    blocks = iter_interface_blocks(lines, interface_pattern)
+    evaluation_cache = template_resolver.evaluation_cache
 
+    while True:
+        with phase(read_phase):
+            block = next(blocks, None)
+        if block is None:
+            break
+        interface, description, commands = block
 
+        with phase('check'):
+            matching_template = template_resolver.resolve(description)
 
-    interfaces = {}
-    current_interface = None
-    
-    for line in config.splitlines():
-        line = line.strip()
-        if line.lower().startswith('interface'):
-            current_interface = line.split()[1]
-            interfaces[current_interface] = {
-                'config': [],
-                'description': None
-            }
-        elif current_interface and line and not line.startswith('!'):
-            if line.lower().startswith('description'):
-                interfaces[current_interface]['description'] = line[11:].strip()
+            if matching_template:
+                if evaluation_cache is not None:
+                    (missing, unexpected, to_remove), reused = evaluation_cache.evaluate(matching_template, commands)
+                else:
+                    missing, unexpected, to_remove = matching_template.evaluate(commands)
+                    reused = False
+                if host_metrics is not None:
+                    host_metrics.evaluations += 1
+                    host_metrics.evaluations_reused += reused
+                status = NON_COMPLIANT if (missing or unexpected or to_remove) else COMPLIANT
+                interface_results.append(InterfaceResult(interface, description, matching_template.name, status,
+                                                         missing, unexpected, to_remove))
             else:
-                interfaces[current_interface]['config'].append(line)
-        elif line.startswith('!'):
-            current_interface = None
-    
-    return interfaces
+                interface_results.append(InterfaceResult(interface, description, None, SKIPPED, [], [], []))
 
-def check_interface_compliance(config, required_commands, additional_allowed_commands=None):
-    if additional_allowed_commands is None:
-        additional_allowed_commands = []
-    
-    # Separating commands into standard commands and commands that should be removed
-    standard_commands = [cmd for cmd in required_commands if not cmd.startswith('-')]
-    remove_commands = [cmd[1:].strip() for cmd in required_commands if cmd.startswith('-')]
-    
-    config_lines = config.split('\n')
-    found_commands = set()
-    unexpected_commands = []
-    commands_to_remove = []
+    return HostResult(host, False, None, interface_results)
 
-    for line in config_lines:
-        line = line.strip()
-        if not line or line.startswith('interface'):
+
+# How the running-config is fetched from a device:
+#   full       - complete "show running-config"
+#   section    - only the interface stanzas, filtered on the device
+#   interfaces - "show running-config interface <x>" for interfaces whose
+#                description matches a template
+FETCH_STRATEGIES = ('full', 'section', 'interfaces')
+
+# Reversed, so the first type of a short name wins (Twe -> TwentyFiveGigE)
+INTERFACE_ABBREVIATIONS = {short: name for name, short in reversed(PORT_TYPES + OTHER_INTERFACE_TYPES)}
+INTERFACE_TYPES = {name for name, _ in PORT_TYPES + OTHER_INTERFACE_TYPES}
+
+
+def expand_interface_name(name):
+    """Expand an abbreviated interface name (Gi1/0/1 -> GigabitEthernet1/0/1)
+
+    A full name or a name with an unknown short name is returned unchanged.
+    """
+    match = re.match(r'^([A-Za-z-]+)(\d.*)$', name)
+    if match and match.group(1) in INTERFACE_ABBREVIATIONS:
+        return INTERFACE_ABBREVIATIONS[match.group(1)] + match.group(2)
+    return name
+
+
+def unknown_interface_type(name):
+    """Type of an interface name that is neither a known short nor a known full name, otherwise None"""
+    match = re.match(r'^([A-Za-z-]+)\d', name)
+    if match is None or match.group(1) in INTERFACE_ABBREVIATIONS or match.group(1) in INTERFACE_TYPES:
+        return None
+    return match.group(1)
+
+
+def parse_interface_descriptions(output):
+    """Parse "show interfaces description" into {interface: description}
+
+    Returns None if the output has no "Interface ... Description" header or
+    no interfaces, e.g. an error message or an empty output.
+    """
+    descriptions = {}
+    desc_column = None
+    for line in output.splitlines():
+        if desc_column is None:
+            if line.startswith('Interface') and 'Description' in line:
+                desc_column = line.index('Description')
             continue
-        
-        # Check for match with required commands
-        matched_required = False
-        for cmd in standard_commands:
-            if line.startswith(cmd):
-                found_commands.add(cmd)
-                matched_required = True
-                break
-        
-        # Check for match with additional allowed commands
-        matched_allowed = False
-        if not matched_required:
-            for cmd in additional_allowed_commands:
-                if line.startswith(cmd):
-                    matched_allowed = True
-                    break
+        if not line.strip():
+            continue
+        interface = line.split()[0]
+        descriptions[expand_interface_name(interface)] = line[desc_column:].strip() or None
+    return descriptions or None
 
-        # Check for commands that should be removed
-        matched_remove = False
-        for cmd in remove_commands:
-            if line.startswith(cmd):
-                commands_to_remove.append(cmd)
-                matched_remove = True
-                break
-        
-        # If no match found, it's an unexpected command
-        if not (matched_required or matched_allowed or matched_remove):
-            unexpected_commands.append(line)
-    
-    # Find missing commands
-    missing_commands = set(standard_commands) - found_commands
 
-    is_compliant = not (missing_commands or commands_to_remove or unexpected_commands)
-    
-    if is_compliant:
-        return "Compliant"
-    else:
-        result = ["Non-Compliant"]  # Start with Non-Compliant in first line
-        if missing_commands:
-            result.append("Missing commands: {}".format(", ".join(missing_commands)))
-        if unexpected_commands:
-            result.append("Unexpected commands: {}".format(", ".join(unexpected_commands)))
-        if commands_to_remove:
-            result.append("Commands to remove: {}".format(", ".join(commands_to_remove)))
-        return "\n".join(result)
+def _interface_stanza(output):
+    """Strip the "Building configuration..." header and the "end" trailer
+    of "show running-config interface <x>" """
+    stanza = []
+    for line in output.splitlines():
+        if line.strip() == 'end':
+            break
+        if stanza or line.lower().startswith('interface'):
+            stanza.append(line)
+    stanza.append('!')
+    return "\n".join(stanza)
+
 
+def _command_failed(output):
+    return output.lstrip().startswith('% ') or '% Invalid input' in output
 
-def check_switch_compliance(task, parsed_templates):
-    """Check compliance for all interfaces on a switch"""
+
+def fetch_running_config(task, strategy, template_resolver, interface_pattern=INTERFACE_PATTERN):
+    """Fetch the running-config of a host, returns (config, strategy used)
+
+    Falls back to the full running-config if the device rejects the
+    filtered commands or "show interfaces description" lists no
+    interfaces. The interfaces strategy leaves out interfaces that do not
+    match interface_pattern.
+    """
+    from nornir_netmiko import netmiko_send_command
+
+    if strategy == 'section':
+        result = task.run(netmiko_send_command, command_string="show running-config | section ^interface")
+        config = result[0].result
+        if not _command_failed(config):
+            return config, 'section'
+
+    elif strategy == 'interfaces':
+        result = task.run(netmiko_send_command, command_string="show interfaces description")
+        descriptions = parse_interface_descriptions(result[0].result)
+        if descriptions:
+            stanzas = _iter_interface_stanzas(task, descriptions, template_resolver, interface_pattern)
+            return "\n".join(stanzas), 'interfaces'
+
+    result = task.run(netmiko_send_command, command_string="show running-config")
+    return result[0].result, 'full'
+
+
+def _iter_interface_stanzas(task, descriptions, template_resolver, interface_pattern=INTERFACE_PATTERN):
+    """Config stanzas of the interfaces of parse_interface_descriptions(), one command per interface"""
+    from nornir_netmiko import netmiko_send_command
+
+    unknown_types = set()
+    for interface, description in descriptions.items():
+        if not interface_pattern.match(interface):
+            interface_type = unknown_interface_type(interface)
+            if interface_type is None:
+                continue
+            # The device knows the short name, the fetched stanza has the full one
+            if interface_type not in unknown_types:
+                unknown_types.add(interface_type)
+                logging.warning("{}: unknown interface abbreviation '{}' in show interfaces description".format(
+                    task.host, interface_type))
+        if template_resolver.resolve(description):
+            result = task.run(netmiko_send_command,
+                              command_string="show running-config interface {}".format(interface))
+            yield _interface_stanza(result[0].result)
+        else:
+            # Not fetched, only listed so it shows up as skipped
+            stanza = "interface {}".format(interface)
+            if description:
+                stanza += "\n description {}".format(description)
+            yield stanza + "\n!"
+
+
+def iter_command_lines(connection, command_string, read_timeout=120):
+    """Output of a command on a Netmiko connection, line by line as it arrives
+
+    The echoed command is dropped and the output ends at the next prompt.
+    Raises ReadTimeout if nothing arrives for read_timeout seconds.
+    """
+    from netmiko.exceptions import ReadTimeout
+
+    prompt = connection.find_prompt()
+    connection.write_channel(command_string + connection.RETURN)
+    pending = ""
+    echo = True
+    deadline = time.monotonic() + read_timeout
+
+    while True:
+        data = connection.read_channel()
+        if not data:
+            # The prompt is only taken as the end once nothing else follows it
+            if pending.strip() == prompt:
+                return
+            if time.monotonic() > deadline:
+                raise ReadTimeout("No output from '{}' for {} seconds".format(command_string, read_timeout))
+            time.sleep(0.01)
+            continue
+
+        deadline = time.monotonic() + read_timeout
+        lines = (pending + data.replace('\r', '')).split('\n')
+        pending = lines.pop()
+        for line in lines:
+            if echo:
+                echo = False
+                if command_string in line:
+                    continue
+            yield line
+
+
+def _unless_failed(lines):
+    """(lines, False) with the first line put back, or (None, True) if the device rejected the command"""
+    lines = iter(lines)
+    for first in lines:
+        if not first.strip():
+            continue
+        if _command_failed(first):
+            for _ in lines:
+                pass
+            return None, True
+        return itertools.chain((first,), lines), False
+    return iter(()), False
+
+
+def stream_running_config(task, strategy, template_resolver, interface_pattern=INTERFACE_PATTERN):
+    """fetch_running_config, returns (lines as they arrive on the SSH channel, strategy used)
+
+    The lines have to be consumed before the next command is sent on the
+    session. The interfaces strategy fetches the stanzas one after the
+    other while the lines are consumed.
+    """
+    from nornir_netmiko import netmiko_send_command
+
+    connection = task.host.get_connection("netmiko", task.nornir.config)
+
+    if strategy == 'section':
+        lines, failed = _unless_failed(iter_command_lines(connection, "show running-config | section ^interface"))
+        if not failed:
+            return lines, 'section'
+
+    elif strategy == 'interfaces':
+        result = task.run(netmiko_send_command, command_string="show interfaces description")
+        descriptions = parse_interface_descriptions(result[0].result)
+        if descriptions:
+            stanzas = _iter_interface_stanzas(task, descriptions, template_resolver, interface_pattern)
+            return (line for stanza in stanzas for line in stanza.split('\n')), 'interfaces'
+
+    return iter_command_lines(connection, "show running-config"), 'full'
+
+
+@contextmanager
+def device_session(task, scheduler=None, phase=null_phase):
+    """Session slot for the current host
+
+    The connection is opened up front, so its duration is measured as the
+    connect phase and not as part of the first command. With a
+    CollectionScheduler the connection is opened inside one of its slots
+    and closed before the slot is released.
+    """
+    if scheduler is None:
+        with phase('connect'):
+            task.host.get_connection("netmiko", task.nornir.config)
+        yield
+        return
+    with scheduler.slot(task.host) as connected:
+        try:
+            with phase('connect'):
+                task.host.get_connection("netmiko", task.nornir.config)
+            connected()
+            yield
+        finally:
+            # The session counts against the limits until it is closed
+            if "netmiko" in task.host.connections:
+                task.host.close_connection("netmiko")
+
+
+def evaluate_cached(host, config, template_resolver, result_cache=None, host_metrics=None,
+                    interface_pattern=INTERFACE_PATTERN):
+    """evaluate_switch_config, reusing the cached result for an unchanged config"""
+    phase = host_metrics.phase if host_metrics is not None else null_phase
+    if result_cache is None:
+        return evaluate_switch_config(host, config, template_resolver, phase, interface_pattern, host_metrics)
+
+    # Unchanged config and templates: reuse the result of the last run
+    digest = config_hash(config)
+    cached = result_cache.lookup(host, digest)
+    if cached is not None:
+        if host_metrics is not None:
+            host_metrics.cache_hit = True
+        return HostResult.from_dict(cached)
+
+    host_result = evaluate_switch_config(host, config, template_resolver, phase, interface_pattern, host_metrics)
+    result_cache.store(host, digest, host_result.to_dict())
+    return host_result
+
+
+# Interfaces named explicitly, e.g. the ones a pushed config touched
+ALL_INTERFACES = re.compile(r'\S')
+
+
+def verify_interfaces(task, interfaces, template_resolver, phase=null_phase, interface_pattern=ALL_INTERFACES):
+    """Fetch "show running-config interface <x>" for the given interfaces and check them again
+
+    Returns {name: InterfaceResult}, an interface that is gone is missing.
+    """
+    from nornir_netmiko import netmiko_send_command
+
+    stanzas = []
+    with phase('fetch'):
+        for interface in interfaces:
+            result = task.run(netmiko_send_command,
+                              command_string="show running-config interface {}".format(interface))
+            stanzas.append(_interface_stanza(result[0].result))
+    host_result = evaluate_switch_config(str(task.host), "\n".join(stanzas), template_resolver, phase,
+                                         interface_pattern)
+    return {intf.name: intf for intf in host_result.interfaces}
+
+
+def still_non_compliant(interfaces, verified):
+    """The interfaces that are not compliant after a push, verified is the result of verify_interfaces()
+
+    An interface that is gone, or whose template no longer matches, counts too.
+    """
+    return [name for name in interfaces if name not in verified or verified[name].status != COMPLIANT]
+
+
+def line_count_summary(line_counts):
+    """Lines saved by interface ranges, per host and in total, as text lines"""
+    before = sum(counts[0] for counts in line_counts.values())
+    after = sum(counts[1] for counts in line_counts.values())
+    lines = ["Missing config with interface ranges: {} lines instead of {} ({:.0f}% less)".format(
+        after, before, 100.0 * (before - after) / before if before else 0)]
+    for host, (host_before, host_after) in sorted(line_counts.items()):
+        if host_after < host_before:
+            lines.append("  {}: {} -> {} lines".format(host, host_before, host_after))
+    return lines
+
+
+def remediate_host(task, host_result, template_resolver, verify=False, dry_run=False, phase=null_phase,
+                   interface_pattern=INTERFACE_PATTERN, interface_ranges=True, max_ranges=MAX_INTERFACE_RANGES):
+    """Push the missing config of a checked host over the open session
+
+    With verify only the touched interfaces are fetched again and their
+    results in host_result are replaced. Returns a summary dict, or None if
+    nothing had to be pushed.
+    """
+    from nornir_netmiko import netmiko_send_config
+
+    blocks = remediation_blocks(host_result, template_resolver)
+    if not blocks:
+        return None
+
+    missing_config = render_remediation(blocks, interface_ranges, max_ranges)
+    touched = [intf.name for intf, _ in blocks]
+    remediation = {'lines': len(missing_config), 'interfaces': touched, 'pushed': False, 'error': None,
+                   'still_non_compliant': None}
+
+    if dry_run:
+        logging.info("DRY RUN: Would apply to {}:\n{}".format(host_result.host, "\n".join(missing_config)))
+        return remediation
+
+    try:
+        with phase('push'):
+            task.run(netmiko_send_config, name="Apply Missing Config", config_commands=missing_config)
+        remediation['pushed'] = True
+    except Exception as e:
+        logging.error("Error applying config to {}: {}".format(host_result.host, e))
+        remediation['error'] = str(e)
+        return remediation
+
+    if verify:
+        verified = verify_interfaces(task, touched, template_resolver, phase, interface_pattern)
+        host_result.interfaces = [verified.get(intf.name, intf) for intf in host_result.interfaces]
+        remediation['still_non_compliant'] = still_non_compliant(touched, verified)
+
+    return remediation
+
+
+def check_switch_compliance(task, template_resolver, result_cache=None, fetch_strategy='full', fetch_log=None,
+                            on_result=None, scheduler=None, remediate=False, verify=False, dry_run=False,
+                            remediation_log=None, metrics=None, interface_pattern=INTERFACE_PATTERN,
+                            interface_ranges=True, max_ranges=MAX_INTERFACE_RANGES, stream=False):
+    """Check compliance for all interfaces on a switch
+
+    on_result is called with the HostResult as soon as the host is done.
+    With a CollectionScheduler the connect and fetch run inside one of its
+    session slots, the evaluation happens after the slot is released.
+    With remediate the missing config is pushed over the same session right
+    after the check, see remediate_host(). The phase timing of the host is
+    added to the MetricsCollector metrics, also if the host fails.
+    With stream the config is checked line by line while it arrives, see
+    stream_running_config(). The result cache is then only updated, the
+    check is done before the config hash is known.
+    """
     host = str(task.host)
     print("Processing: {}".format(host))
+    host_metrics = HostMetrics(host)
+    phase = host_metrics.phase
 
-    result = task.run(netmiko_send_command, command_string="show running-config")
-    config = result[0].result
+    try:
+        # The inventory can override the strategy per host or group
+        strategy = task.host.get('fetch_strategy', fetch_strategy)
+        with device_session(task, scheduler, phase):
+            if stream:
+                with phase('fetch'):
+                    lines, used_strategy = stream_running_config(task, strategy, template_resolver,
+                                                                 interface_pattern)
+                    lines = LineHasher(lines)
+                host_result = evaluate_config_lines(host, lines, template_resolver, phase, interface_pattern,
+                                                    read_phase='fetch', host_metrics=host_metrics)
+                host_metrics.bytes_received = lines.bytes
+                if result_cache is not None:
+                    result_cache.store(host, lines.hexdigest(), host_result.to_dict(), miss=True)
+            else:
+                with phase('fetch'):
+                    config, used_strategy = fetch_running_config(task, strategy, template_resolver,
+                                                                 interface_pattern)
+                host_metrics.bytes_received = len(config.encode('utf-8'))
+                if remediate:
+                    host_result = evaluate_cached(host, config, template_resolver, result_cache, host_metrics,
+                                                  interface_pattern)
+            if remediate:
+                remediation = remediate_host(task, host_result, template_resolver, verify, dry_run, phase,
+                                             interface_pattern, interface_ranges, max_ranges)
+                if remediation is not None and remediation_log is not None:
+                    remediation_log[host] = remediation
+
+        if fetch_log is not None:
+            fetch_log[host] = {
+                'strategy': used_strategy,
+                'requested_strategy': strategy,
+                'bytes': host_metrics.bytes_received,
+            }
 
-    interfaces = parse_interfaces(config)
-    compliant_interfaces = {}
-    non_compliant_interfaces = {}
-    skipped_interfaces = {}
+        if not (remediate or stream):
+            host_result = evaluate_cached(host, config, template_resolver, result_cache, host_metrics,
+                                          interface_pattern)
 
-    for interface, intf_details in interfaces.items():
-        if re.match(r'^GigabitEthernet', interface, re.IGNORECASE):
-            description = intf_details['description']
-            matching_template = find_matching_template(description, parsed_templates)
-            
-            if matching_template:
-                required = matching_template['required']
-                additional_allowed = matching_template['additional_allowed']
-
-                config_str = "\n".join(intf_details['config'])
-                compliance_result = check_interface_compliance(config_str, required, additional_allowed)
-                if compliance_result != "Compliant":
-                    non_compliant_interfaces[interface] = {
-                        'compliance': compliance_result,
-                        'description': description
-                    }
+        if on_result is not None:
+            with phase('render'):
+                on_result(host_result)
+        return host_result
+    except Exception:
+        host_metrics.failed = True
+        raise
+    finally:
+        if metrics is not None:
+            metrics.add(host_metrics)
+
+
+# Offline mode: saved running-configs are evaluated in worker processes.
+# The templates are handed over once per worker instead of once per host.
+_offline_resolver = None
+_offline_interface_pattern = INTERFACE_PATTERN
+
+
+def _init_offline_worker(template_resolver, interface_pattern=INTERFACE_PATTERN):
+    global _offline_resolver, _offline_interface_pattern
+    _offline_resolver = template_resolver
+    _offline_interface_pattern = interface_pattern
+
+
+def _check_saved_config(job):
+    """Worker: evaluate one saved config, returns (HostResult, config hash, HostMetrics)
+
+    The result is None if the config hash equals the cached one, the
+    caller then reuses its cached result. The file is read line by line and
+    never held as a whole: with a cached hash it is hashed first and only
+    read again if it changed, otherwise it is hashed while it is checked.
+    Reading the file is timed as the fetch phase.
+    """
+    host, config_file, cached_hash = job
+    host_metrics = HostMetrics(host)
+    try:
+        if cached_hash is not None:
+            with host_metrics.phase('fetch'):
+                digest, host_metrics.bytes_received = config_file_hash(config_file)
+            if digest == cached_hash:
+                host_metrics.cache_hit = True
+                return None, digest, host_metrics
+
+        with open(config_file, 'r') as f:
+            lines = LineHasher(f)
+            host_result = evaluate_config_lines(host, lines, _offline_resolver, host_metrics.phase,
+                                                _offline_interface_pattern, read_phase='fetch',
+                                                host_metrics=host_metrics)
+        host_metrics.bytes_received = lines.bytes
+        return host_result, lines.hexdigest(), host_metrics
+    except Exception as e:
+        host_metrics.failed = True
+        return HostResult.failure(host, "{}: {}".format(type(e).__name__, e)), None, host_metrics
+
+
+def saved_config_files(config_dir, host_filter=None):
+    """{host: path} of the saved running-configs (<host>.cfg) in config_dir"""
+    config_files = {}
+    for filename in sorted(os.listdir(config_dir)):
+        if not filename.endswith('.cfg'):
+            continue
+        host = filename[:-len('.cfg')]
+        if host_filter and host_filter not in host:
+            continue
+        config_files[host] = os.path.join(config_dir, filename)
+    return config_files
+
+
+def check_saved_configs(config_dir, template_resolver, host_filter=None, workers=None, result_cache=None,
+                        on_result=None, metrics=None, interface_pattern=INTERFACE_PATTERN, hosts=None):
+    """Check saved running-configs (<host>.cfg) from disk without logging into any device.
+
+    Returns {host: HostResult} like a live run, on_result is called with
+    every HostResult as soon as it is available. hosts limits the check to
+    these host names, e.g. the hosts of a shard.
+    """
+    config_files = saved_config_files(config_dir, host_filter)
+    if hosts is not None:
+        config_files = {host: path for host, path in config_files.items() if host in hosts}
+
+    results = {}
+    if not config_files:
+        return results
+
+    workers = workers or os.cpu_count() or 1
+    chunksize = max(1, len(config_files) // (workers * 4))
+
+    with ProcessPoolExecutor(max_workers=workers,
+                             initializer=_init_offline_worker,
+                             initargs=(template_resolver, interface_pattern)) as executor:
+        jobs = [(host, path, result_cache.cached_hash(host) if result_cache else None)
+                for host, path in config_files.items()]
+        outcomes = executor.map(_check_saved_config, jobs, chunksize=chunksize)
+        for host, (host_result, digest, host_metrics) in zip(config_files, outcomes):
+            if result_cache is not None and digest is not None:
+                if host_result is None:
+                    host_result = HostResult.from_dict(result_cache.lookup(host, digest))
                 else:
-                    compliant_interfaces[interface] = {
-                        'compliance': "Compliant",
-                        'description': description
-                    }
-            else:
-                skipped_interfaces[interface] = description
-
-    result = ""
-    if compliant_interfaces:
-        result += "Compliant Interfaces:\n"
-        for interface, details in compliant_interfaces.items():
-            result += "{}:\n".format(interface)
-            if details['description']:
-                result += "Description: {}\n".format(details['description'])
-            result += "{}\n\n".format(details['compliance'])
-
-    if non_compliant_interfaces:
-        result += "Non-Compliant Interfaces:\n"
-        for interface, details in non_compliant_interfaces.items():
-            result += "{}:\n".format(interface)
-            if details['description']:
-                result += "Description: {}\n".format(details['description'])
-            result += "{}\n\n".format(details['compliance'])
-    
-    if skipped_interfaces:
-        result += "Skipped Interfaces (no matching template):\n"
-        for interface, description in skipped_interfaces.items():
-            result += "{}: {}\n".format(interface, description or "No description")
-    
-    return result.strip() if result else "No GigabitEthernet interfaces found"
+                    result_cache.store(host, digest, host_result.to_dict(), miss=True)
+            results[host] = host_result
+            if on_result is not None:
+                with host_metrics.phase('render'):
+                    on_result(host_result)
+            if metrics is not None:
+                metrics.add(host_metrics)
+
+    return results
+
+
+# Pipeline mode: the Nornir threads only fetch, the configs are evaluated in
+# worker processes and one writer thread hands out the results.
+def _evaluate_fetched_config(host, config, host_metrics):
+    """Worker: evaluate a fetched config, returns (HostResult, HostMetrics)"""
+    host_result = evaluate_switch_config(host, config, _offline_resolver, host_metrics.phase,
+                                         _offline_interface_pattern, host_metrics)
+    return host_result, host_metrics
+
+
+def fetch_switch_config(task, pipeline, template_resolver, fetch_strategy='full', fetch_log=None, scheduler=None,
+                        interface_pattern=INTERFACE_PATTERN):
+    """Pipeline I/O stage: fetch the running-config of a host and queue it for evaluation
+
+    The session is closed before the config is queued, a full queue blocks
+    the thread until the evaluation caught up.
+    """
+    host = str(task.host)
+    host_metrics = HostMetrics(host)
+    phase = host_metrics.phase
+
+    try:
+        strategy = task.host.get('fetch_strategy', fetch_strategy)
+        with device_session(task, scheduler, phase):
+            with phase('fetch'):
+                config, used_strategy = fetch_running_config(task, strategy, template_resolver, interface_pattern)
+    except Exception:
+        host_metrics.failed = True
+        if pipeline.metrics is not None:
+            pipeline.metrics.add(host_metrics)
+        raise
+
+    host_metrics.bytes_received = len(config.encode('utf-8'))
+    if fetch_log is not None:
+        fetch_log[host] = {
+            'strategy': used_strategy,
+            'requested_strategy': strategy,
+            'bytes': host_metrics.bytes_received,
+        }
+    pipeline.configs.put((host, config, host_metrics))
+
+
+class CheckPipeline:
+    """Live check in three stages connected by bounded queues
+
+    The Nornir runner threads fetch the configs (fetch_switch_config) and
+    put them on a queue of queue_size entries. A dispatcher thread looks
+    them up in the result cache and hands the others to eval_workers
+    processes, with at most two configs per process in flight. One writer
+    thread calls on_result and adds the metrics. A full queue blocks the
+    stage before it, so no stage runs ahead of a slower one.
+    """
+
+    def __init__(self, template_resolver, eval_workers=None, queue_size=None, result_cache=None, on_result=None,
+                 metrics=None, interface_pattern=INTERFACE_PATTERN):
+        self.template_resolver = template_resolver
+        self.eval_workers = eval_workers or os.cpu_count() or 1
+        self.queue_size = queue_size or self.eval_workers * 4
+        self.result_cache = result_cache
+        self.on_result = on_result
+        self.metrics = metrics
+        self.interface_pattern = interface_pattern
+        self.configs = queue.Queue(maxsize=self.queue_size)
+        self.results = {}
+        self._written = queue.Queue(maxsize=self.queue_size)
+        self._in_flight = threading.BoundedSemaphore(self.eval_workers * 2)
+
+    def _dispatch(self):
+        with ProcessPoolExecutor(max_workers=self.eval_workers,
+                                 initializer=_init_offline_worker,
+                                 initargs=(self.template_resolver, self.interface_pattern)) as executor:
+            while True:
+                job = self.configs.get()
+                if job is None:
+                    break
+                host, config, host_metrics = job
+
+                digest = None
+                if self.result_cache is not None:
+                    digest = config_hash(config)
+                    cached = self.result_cache.lookup(host, digest)
+                    if cached is not None:
+                        host_metrics.cache_hit = True
+                        self._written.put((HostResult.from_dict(cached), host_metrics))
+                        continue
+
+                self._in_flight.acquire()
+                try:
+                    future = executor.submit(_evaluate_fetched_config, host, config, host_metrics)
+                except Exception as e:
+                    # Broken pool: keep draining the queue so the fetch threads do not block
+                    self._in_flight.release()
+                    host_metrics.failed = True
+                    self._written.put((HostResult.failure(host, "{}: {}".format(type(e).__name__, e)),
+                                       host_metrics))
+                    continue
+                future.add_done_callback(functools.partial(self._evaluated, host, digest, host_metrics))
+
+    def _evaluated(self, host, digest, host_metrics, future):
+        self._in_flight.release()
+        try:
+            host_result, host_metrics = future.result()
+        except Exception as e:
+            host_metrics.failed = True
+            host_result = HostResult.failure(host, "{}: {}".format(type(e).__name__, e))
+        else:
+            if digest is not None:
+                self.result_cache.store(host, digest, host_result.to_dict())
+        self._written.put((host_result, host_metrics))
+
+    def _write(self):
+        while True:
+            item = self._written.get()
+            if item is None:
+                break
+            host_result, host_metrics = item
+            self.results[host_result.host] = host_result
+            # Failed hosts are handed out by the caller, like in a normal run
+            if self.on_result is not None and not host_result.failed:
+                with host_metrics.phase('render'):
+                    self.on_result(host_result)
+            if self.metrics is not None:
+                self.metrics.add(host_metrics)
+
+    def run(self, nr, **fetch_args):
+        """Run fetch_switch_config on nr through the pipeline, returns {host: HostResult} in inventory order"""
+        dispatcher = threading.Thread(target=self._dispatch, name="pipeline-dispatch")
+        writer = threading.Thread(target=self._write, name="pipeline-writer")
+        dispatcher.start()
+        writer.start()
+        try:
+            nornir_results = nr.run(task=fetch_switch_config, pipeline=self,
+                                    template_resolver=self.template_resolver,
+                                    interface_pattern=self.interface_pattern, **fetch_args)
+        finally:
+            self.configs.put(None)
+            dispatcher.join()
+            self._written.put(None)
+            writer.join()
+
+        results = {}
+        for host, multi_result in nornir_results.items():
+            if multi_result.failed:
+                results.update(collect_host_results({host: multi_result}))
+            elif host in self.results:
+                results[host] = self.results[host]
+        return results
 
 
 def configure_proxy(host="127.0.0.1", port=1084, enabled=True):
     """Configure SOCKS5 proxy settings"""
     if enabled:
+        import socket
+        import socks
+
         try:
             socks.setdefaultproxy(socks.PROXY_TYPE_SOCKS5, host, port)
             socket.socket = socks.socksocket
@@ -817,9 +1041,54 @@ def configure_proxy(host="127.0.0.1", port=1084, enabled=True):
     return True
 
 
-# Main
-if __name__ == "__main__":
-    parser = argparse.ArgumentParser(description="Network Interface Compliance Checker")
+def collect_host_results(nornir_results):
+    """Turn the AggregatedResult of check_switch_compliance into {host: HostResult}"""
+    results = {}
+    for host, multi_result in nornir_results.items():
+        if multi_result.failed:
+            failed = next(result for result in multi_result if result.failed)
+            error = failed.exception if failed.exception is not None else failed.result
+            results[host] = HostResult.failure(host, str(error))
+        else:
+            results[host] = multi_result[0].result
+    return results
+
+
+def write_remediation_summary(remediation_log, dry_run=False):
+    """Write the single-session remediation results in the format of apply_missing_configs.py"""
+    # Imported here, apply_missing_configs loads nornir
+    from apply_missing_configs import generate_summary
+
+    success_hosts = [host for host, entry in remediation_log.items() if entry['pushed'] or dry_run]
+    failed_hosts = [host for host, entry in remediation_log.items() if entry['error']]
+    unverified = {host: entry['still_non_compliant'] for host, entry in remediation_log.items()
+                  if entry['still_non_compliant']}
+    return generate_summary(success_hosts, failed_hosts, [], "(in memory, single session)", dry_run,
+                            unverified_hosts=unverified)
+
+
+def write_fetch_stats(fetch_log, output_dir):
+    """Write the fetch strategy and transferred bytes per host to a JSON file"""
+    now = datetime.datetime.now()
+    filename = os.path.join(output_dir, "fetch_stats_{0}.json".format(now.strftime('%Y%m%d_%H%M%S')))
+    with open(filename, 'w') as f:
+        json.dump(fetch_log, f, indent=2, sort_keys=True)
+    return filename
+
+
+def write_metrics(metrics, output_dir, metrics_file=None, prometheus_file=None):
+    """Write the per-host phase timing as JSON Lines and as Prometheus textfile, returns both filenames"""
+    now = datetime.datetime.now()
+    metrics_file = metrics_file or os.path.join(
+        output_dir, "host_metrics_{0}.jsonl".format(now.strftime('%Y%m%d_%H%M%S')))
+    prometheus_file = prometheus_file or os.path.join(output_dir, "interface_compliance_check.prom")
+    return metrics.write_jsonl(metrics_file), metrics.write_prometheus(prometheus_file)
+
+
+def main(argv=None, prog=None, offline=False):
+    """The check command, offline takes the directory of saved configs as the only positional argument"""
+    parser = argparse.ArgumentParser(prog=prog, description="Network Interface Compliance Checker" + (
+        ", offline on saved running-configs" if offline else ""))
 
     # Required arguments
     parser.add_argument("-c", "--config", default="config.yaml", help="Path to the configuration file (default: config.yaml)")
@@ -830,63 +1099,276 @@ if __name__ == "__main__":
 
     parser.add_argument("-f", "--filter", help="Optional filter string for hostname prefix")  
 
+    # Offline mode
+    if offline:
+        parser.add_argument("from_dir", metavar="CONFIG_DIR", help="Directory with the saved running-configs (<host>.cfg)")
+    else:
+        parser.add_argument("--from-dir", help="Check saved running-configs (<host>.cfg) from this directory instead of connecting to the devices")
+    parser.add_argument("--workers", type=int, help="Number of worker processes for --from-dir (default: number of CPUs)")
+
+    # Several check nodes
+    parser.add_argument("--shard", metavar="I/N", help="Only check the hosts of shard I of N, every node computes the same partition of the inventory; combine the shard stores with 'result_store.py merge'")
+    parser.add_argument("--shard-weights", metavar="FILE", help="host_metrics JSONL of a previous run, balances the shards by run time per host instead of by host count")
+
+    # Fetch strategy
+    parser.add_argument("--interface-pattern", default=DEFAULT_INTERFACE_PATTERN,
+                        help="Regular expression for the names of the interfaces to check, case insensitive "
+                             "(default: physical ports and port-channels, {})".format(DEFAULT_INTERFACE_PATTERN))
+    parser.add_argument("--fetch-strategy", choices=FETCH_STRATEGIES, default="full",
+                        help="How to fetch the running-config: full, section (device-side filter on interface stanzas) "
+                             "or interfaces (only interfaces with a matching template) (default: full)")
+    parser.add_argument("--pipeline", action="store_true", help="Only fetch on the Nornir threads, evaluate the configs in worker processes and write the results from one thread")
+    parser.add_argument("--eval-workers", type=int, help="Number of evaluation processes with --pipeline (default: number of CPUs)")
+    parser.add_argument("--queue-size", type=int, help="Fetched configs waiting for evaluation with --pipeline before the fetch threads block (default: 4 per evaluation process)")
+    parser.add_argument("--stream", action="store_true", help="Check the running-config line by line while it is read from the SSH channel instead of after the whole output was received. Streamed runs never read the result cache, they only store their results for later runs")
+
+    # Collection scheduler
+    parser.add_argument("--max-connections", type=int, help="Run the checks concurrently with at most this many device sessions at a time (default: use the runner from the Nornir config)")
+    parser.add_argument("--per-proxy-limit", type=int, help="Maximum concurrent sessions through one proxy endpoint (default: --max-connections)")
+    parser.add_argument("--per-group-limit", type=int, help="Maximum concurrent sessions per site (site inventory entry or first group) (default: --max-connections)")
+    parser.add_argument("--target-latency", type=float, help="Adapt the limits: back off when a connect takes longer than this many seconds or fails")
+
+    # Check and remediate in one session
+    parser.add_argument("--remediate", action="store_true", help="Push the missing config over the same SSH session right after the check")
+    parser.add_argument("--verify", action="store_true", help="With --remediate, re-fetch and re-check the touched interfaces after the push")
+    parser.add_argument("--dry-run", action="store_true", help="With --remediate, only log the config that would be pushed")
+
+    # Missing config
+    parser.add_argument("--no-interface-ranges", action="store_true", help="Write one block per interface instead of grouping interfaces with the same missing config into 'interface range' blocks")
+    parser.add_argument("--max-interface-ranges", type=int, default=MAX_INTERFACE_RANGES, help="Maximum number of ranges per 'interface range' command (default: {})".format(MAX_INTERFACE_RANGES))
+
+    # Result cache
+    parser.add_argument("--cache-file", help="Result cache file (default: <output>/.compliance_cache.json)")
+    parser.add_argument("--no-cache", action="store_true", help="Re-evaluate every host, ignore and do not update the result cache")
+    parser.add_argument("--cache-max-entries", type=int, default=10000, help="Maximum number of cached hosts (default: 10000)")
+    parser.add_argument("--cache-max-age", type=float, default=7, help="Maximum age of cached results in days (default: 7)")
+    parser.add_argument("--store", help="SQLite result store (default: <output>/compliance_results.db)")
+    parser.add_argument("--export", metavar="FILE", help="Also write one record per interface to this file while the hosts are checked, '-' for stdout")
+    parser.add_argument("--export-format", choices=EXPORT_FORMATS, help="Format of --export (default: csv for *.csv and *.csv.gz, otherwise jsonl)")
+    parser.add_argument("--export-gzip", action="store_true", help="Compress --export with gzip (default for *.gz)")
+    parser.add_argument("--store-keep-days", type=float, default=90, help="Delete stored runs older than this many days (default: 90)")
+    delta = parser.add_mutually_exclusive_group()
+    delta.add_argument("--since-last", action="store_true", help="Also write a delta report against the previous run in the result store")
+    delta.add_argument("--baseline", type=int, metavar="RUN", help="Also write a delta report against this run of the result store")
+    parser.add_argument("--evaluation-cache-size", type=int, default=100000, help="Distinct interface bodies per template whose result is kept for identical ports, 0 disables the evaluation cache (default: 100000)")
+    parser.add_argument("--template-cache", help="Compiled template cache file (default: <output>/.template_cache.json)")
+    parser.add_argument("--no-template-cache", action="store_true", help="Parse and compile every template, ignore and do not update the template cache")
+
+    # Phase timing
+    parser.add_argument("--metrics-file", help="JSON Lines file with the phase timing per host (default: <output>/host_metrics_<timestamp>.jsonl)")
+    parser.add_argument("--prometheus-file", help="Prometheus textfile collector file (default: <output>/interface_compliance_check.prom)")
+
     # Optional SOCKS5 proxy settigs
     parser.add_argument("--proxy-enabled", action="store_true", help="Enable SOCKS5 proxy")
     parser.add_argument("--proxy-host", default="127.0.0.1", help="Proxy host (default: 127.0.0.1)")
     parser.add_argument("--proxy-port", type=int, default=1084, help="Proxy port (default: 1084)")
     
     # Parse arguments
-    args = parser.parse_args()
-
-
-    # Initialize nornir
-    nr = InitNornir(config_file=args.config) 
+    args = parser.parse_args(argv)
+
+    if args.remediate and args.from_dir:
+        parser.error("--remediate needs a live run, it cannot be combined with --from-dir")
+    if args.pipeline and (args.remediate or args.stream or args.from_dir):
+        parser.error("--pipeline cannot be combined with --remediate, --stream or --from-dir")
+    if args.max_interface_ranges < 1:
+        parser.error("--max-interface-ranges must be at least 1")
+    shard = None
+    if args.shard:
+        try:
+            shard = parse_shard(args.shard)
+        except ValueError as e:
+            parser.error("invalid --shard: {}".format(e))
+    elif args.shard_weights:
+        parser.error("--shard-weights needs --shard")
+
+    # With "--export -" stdout carries the records, everything else is printed to stderr
+    exporter = None
+    if args.export:
+        exporter = ResultExporter(args.export, args.export_format, args.export_gzip)
+        if args.export == '-':
+            sys.stdout = sys.stderr
 
-    # Check proxy Settings
-    if args.proxy_enabled:
-        if not configure_proxy(args.proxy_host, args.proxy_port):
-            print("Failed to configure proxy")
-            sys.exit(1)
+    try:
+        interface_pattern = compile_interface_pattern(args.interface_pattern)
+    except re.error as e:
+        parser.error("invalid --interface-pattern: {}".format(e))
 
     logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
-    # Einlesen der Template-Dateien
-    parsed_files, errors = parse_intf_template_files_individually(args.templates)
+    # Einlesen der Template-Dateien, unveränderte Templates kommen kompiliert aus dem Cache
+    template_cache_file = None
+    if not args.no_template_cache:
+        template_cache_file = args.template_cache or os.path.join(args.output, ".template_cache.json")
+    template_cache = TemplateCache(template_cache_file).load()
+    parsed_files, templates, errors = template_cache.templates(args.templates)
+    template_cache.save()
+    print("Templates: {} compiled, {} reused from the template cache".format(template_cache.compiled,
+                                                                           template_cache.reused))
 
     if errors:
         print("\nAufgetretene Fehler beim Einlesen der Templates:")
         for error in errors:
             print(error)
 
-    # Initialize Nornir
-    #nr = InitNornir(config_file=args.config)
-    
-    # Apply host filter if specified
-    
-    if args.filter:
-        nr = nr.filter(lambda host: args.filter in host.name)
-        
-    
-    print("Hosts in inventory:")
-    for host in nr.inventory.hosts:
-        print(f"- {host}")
+    # One resolver per run, shared by the checks and the missing config generation
+    evaluation_cache = EvaluationCache(args.evaluation_cache_size) if args.evaluation_cache_size > 0 else None
+    template_resolver = TemplateResolver(templates, evaluation_cache=evaluation_cache)
+
+    result_cache = None
+    if not args.no_cache:
+        cache_file = args.cache_file or os.path.join(args.output, ".compliance_cache.json")
+        result_cache = ResultCache(cache_file, template_fingerprint(parsed_files, interface_pattern.pattern),
+                                   max_entries=args.cache_max_entries,
+                                   max_age=args.cache_max_age * 24 * 3600).load()
 
-    # Run the task
-    results = nr.run(task=check_switch_compliance, parsed_templates=parsed_files)
+    weights = None
+    if args.shard_weights:
+        try:
+            weights = load_weights(args.shard_weights)
+        except (OSError, ValueError, KeyError) as e:
+            print("Could not read --shard-weights {}, balancing by host count: {}".format(args.shard_weights, e))
+
+    own_hosts = None
+    if shard and args.from_dir:
+        own_hosts = shard_hosts(saved_config_files(args.from_dir, args.filter), shard, weights)
+        print("Shard {}/{}: {} saved configs".format(shard[0], shard[1], len(own_hosts)))
+
+    if not args.from_dir:
+        from nornir import InitNornir
+        from nornir.plugins.runners import ThreadedRunner
+
+        # Initialize nornir
+        nr = InitNornir(config_file=args.config) 
+
+        # Check proxy Settings
+        if args.proxy_enabled:
+            if not configure_proxy(args.proxy_host, args.proxy_port):
+                print("Failed to configure proxy")
+                sys.exit(1)
+
+        # Apply host filter if specified
+        if args.filter:
+            nr = nr.filter(lambda host: args.filter in host.name)
+
+        # The partition is computed over the filtered inventory, every shard must use the same one
+        if shard:
+            own_hosts = shard_hosts(nr.inventory.hosts, shard, weights)
+            nr = nr.filter(filter_func=lambda host: host.name in own_hosts)
+            print("Shard {}/{}: {} hosts".format(shard[0], shard[1], len(own_hosts)))
+
+        print("Hosts in inventory:")
+        for host in nr.inventory.hosts:
+            print(f"- {host}")
+
+        scheduler = None
+        if args.max_connections:
+            default_proxy = "{}:{}".format(args.proxy_host, args.proxy_port) if args.proxy_enabled else "direct"
+            scheduler = CollectionScheduler(args.max_connections, args.per_proxy_limit, args.per_group_limit,
+                                            args.target_latency, default_proxy)
+            # More threads than sessions, so hosts waiting for a busy site or
+            # proxy do not keep the other hosts from starting
+            nr = nr.with_runner(ThreadedRunner(num_workers=args.max_connections * 4))
+
+    metrics = MetricsCollector("check")
+
+    # Results go to the store while the hosts are checked, the report is rendered from it
+    now = datetime.datetime.now()
+    store = ResultStore(args.store or os.path.join(args.output, "compliance_results.db")).open()
+    store.prune(args.store_keep_days)
+    source = args.from_dir or args.config
+    if shard:
+        source = "{} {}".format(source, shard_label(shard))
+    run_id = store.start_run(parsed_files, MISSING_CONFIG_DIR, source=source, started_at=now.timestamp())
+
+    if exporter is not None:
+        exporter.run_id = run_id
+        exporter.open()
+
+    def store_result(host_result):
+        store.add_host(run_id, host_result)
+        if exporter is not None:
+            exporter.add_host(host_result)
+
+    try:
+        if args.from_dir:
+            # Offline: no Nornir, no proxy, no device logins
+            results = check_saved_configs(args.from_dir, template_resolver, args.filter, args.workers, result_cache,
+                                          on_result=store_result, metrics=metrics,
+                                          interface_pattern=interface_pattern, hosts=own_hosts)
+            print("Checked {} saved configs from {}".format(len(results), args.from_dir))
+        else:
+            # Run the task
+            fetch_log = {}
+            remediation_log = {}
+            if args.pipeline:
+                pipeline = CheckPipeline(template_resolver, args.eval_workers, args.queue_size, result_cache,
+                                         on_result=store_result, metrics=metrics,
+                                         interface_pattern=interface_pattern)
+                results = pipeline.run(nr, fetch_strategy=args.fetch_strategy, fetch_log=fetch_log,
+                                       scheduler=scheduler)
+            else:
+                nornir_results = nr.run(task=check_switch_compliance, template_resolver=template_resolver,
+                                        result_cache=result_cache, fetch_strategy=args.fetch_strategy,
+                                        fetch_log=fetch_log, on_result=store_result, scheduler=scheduler,
+                                        remediate=args.remediate, verify=args.verify, dry_run=args.dry_run,
+                                        remediation_log=remediation_log, metrics=metrics,
+                                        interface_pattern=interface_pattern,
+                                        interface_ranges=not args.no_interface_ranges,
+                                        max_ranges=args.max_interface_ranges, stream=args.stream)
+                results = collect_host_results(nornir_results)
+            # Hosts whose task raised never reached on_result
+            for host_result in results.values():
+                if host_result.failed:
+                    store_result(host_result)
+            if scheduler is not None:
+                print(scheduler.summary())
+            fetch_stats_file = write_fetch_stats(fetch_log, args.output)
+            print("Fetched {} bytes from {} hosts, per-host strategy and size saved to: {}".format(
+                sum(entry['bytes'] for entry in fetch_log.values()), len(fetch_log), fetch_stats_file))
+            if args.remediate:
+                summary_file = write_remediation_summary(remediation_log, args.dry_run)
+                print("Remediation summary saved to: {}".format(summary_file))
+    finally:
+        # Also after an aborted run, with the hosts checked so far
+        store.finish_run(run_id)
+        report_file = write_report(store, run_id, report_filename(now))
+        if exporter is not None:
+            exporter.close()
+
+    delta_file = None
+    if args.since_last or args.baseline:
+        baseline_run_id = args.baseline or store.previous_run(run_id)
+        if baseline_run_id is None or store.run(baseline_run_id) is None:
+            print("No baseline run found in {}, no delta report written".format(store.path))
+        else:
+            delta, current_rows, baseline_rows, baseline_run, current_run = delta_between_runs(
+                store, baseline_run_id, run_id)
+            delta_file = write_delta_report("compliance_delta_{0}.html".format(now.strftime('%Y%m%d_%H%M%S')),
+                                            delta, current_rows, baseline_rows, baseline_run, current_run)
+            print("\nChanges since run {}:".format(baseline_run_id))
+            print("\n".join(delta_summary(delta)))
+    store.close()
+
+    metrics_file, prometheus_file = write_metrics(metrics, args.output, args.metrics_file, args.prometheus_file)
+
+    if result_cache is not None:
+        result_cache.save()
+        print("Result cache: {} hosts reused, {} evaluated".format(result_cache.hits, result_cache.misses))
 
     # Generate missing config files
-    config_dir = os.path.join(args.output, "missing_configs")
-    config_dir = generate_missing_config_files(results, parsed_files)
+    line_counts = {}
+    config_dir = generate_missing_config_files(results, template_resolver, not args.no_interface_ranges,
+                                               args.max_interface_ranges, line_counts)
 
     # Print the results
     failed_hosts = []
-    for host, result in results.items():
-        if result.failed:
-            print(f"Task failed on host {host}: {result}")
+    for host, host_result in results.items():
+        if host_result.failed:
+            print(f"Task failed on host {host}: {host_result.error}")
             failed_hosts.append(host)
         else:
             print(f"\nResults for host {host}:")
-            print(result.result)
+            print(render_host_result(host_result))
 
     if failed_hosts:
         print("\nThe Task failed on the following Hosts:")
@@ -896,8 +1378,20 @@ if __name__ == "__main__":
     else:
         print("\nTask completed successfully on all hosts.")
 
-    # Generate and save the report
-    report_file = generate_report(results, parsed_files, config_dir)
-    report_path = os.path.join(args.output, report_file)
-    print(f"\nDetailed report saved to: {report_path}")
-    print(f"Missing configuration files are stored in: {config_dir}")
\ No newline at end of file
+    print()
+    print("\n".join(metrics.summary()))
+    print(f"Phase timing per host saved to: {metrics_file} and {prometheus_file}")
+
+    print(f"\nDetailed report saved to: {report_file} (run {run_id} in {store.path})")
+    if delta_file:
+        print(f"Delta report saved to: {delta_file}")
+    print(f"Missing configuration files are stored in: {config_dir}")
+    if exporter is not None and args.export != '-':
+        print(f"{exporter.records} interface records exported to: {args.export}")
+    if not args.no_interface_ranges:
+        print("\n".join(line_count_summary(line_counts)))
+
+
+# Main
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,176 @@
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+
+PHASES = ('connect', 'fetch', 'parse', 'check', 'render', 'push')
+QUANTILES = (0.5, 0.95, 0.99)
+
+
+def null_phase(name):
+    """Stand-in for HostMetrics.phase when nothing is measured"""
+    return nullcontext()
+
+
+def percentile(values, quantile):
+    """Nearest-rank percentile of a list of numbers"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(1, int(round(quantile * len(ordered) + 0.5)))
+    return ordered[min(rank, len(ordered)) - 1]
+
+
+class HostMetrics:
+    """Phase durations and transferred bytes of one host"""
+
+    def __init__(self, host):
+        self.host = host
+        self.phases = {}
+        self.bytes_received = 0
+        self.cache_hit = False
+        self.failed = False
+        # Interfaces checked against a template, and how many of those
+        # results came from the EvaluationCache
+        self.evaluations = 0
+        self.evaluations_reused = 0
+
+    @contextmanager
+    def phase(self, name):
+        """Time a phase, repeated phases of the same name add up"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases[name] = self.phases.get(name, 0.0) + time.perf_counter() - started
+
+    def to_dict(self):
+        return {
+            'host': self.host,
+            'phases': {name: round(seconds, 6) for name, seconds in self.phases.items()},
+            'bytes_received': self.bytes_received,
+            'cache_hit': self.cache_hit,
+            'failed': self.failed,
+            'evaluations': self.evaluations,
+            'evaluations_reused': self.evaluations_reused,
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        metrics = cls(data['host'])
+        metrics.phases = dict(data.get('phases', {}))
+        metrics.bytes_received = data.get('bytes_received', 0)
+        metrics.cache_hit = data.get('cache_hit', False)
+        metrics.failed = data.get('failed', False)
+        metrics.evaluations = data.get('evaluations', 0)
+        metrics.evaluations_reused = data.get('evaluations_reused', 0)
+        return metrics
+
+
+class MetricsCollector:
+    """Collects HostMetrics of a run and exports them
+
+    Per-host records go to a JSON Lines file and, together with the fleet
+    percentiles, to a file for the Prometheus node_exporter textfile
+    collector.
+    """
+
+    def __init__(self, job):
+        self.job = job
+        self.hosts = []
+        self.started = time.time()
+        self._lock = threading.Lock()
+
+    def add(self, host_metrics):
+        with self._lock:
+            self.hosts.append(host_metrics)
+
+    def fleet_percentiles(self):
+        """{phase: {quantile: seconds}} over all hosts that ran the phase"""
+        result = {}
+        for phase in PHASES:
+            values = [metrics.phases[phase] for metrics in self.hosts if phase in metrics.phases]
+            if values:
+                result[phase] = {quantile: percentile(values, quantile) for quantile in QUANTILES}
+        return result
+
+    def summary(self):
+        """Fleet percentiles as text lines"""
+        lines = ["Phase timing over {} hosts (p50 / p95 / p99):".format(len(self.hosts))]
+        for phase, quantiles in self.fleet_percentiles().items():
+            lines.append("- {}: {}".format(phase, " / ".join("{:.1f}ms".format(quantiles[q] * 1000) for q in QUANTILES)))
+        received = sum(metrics.bytes_received for metrics in self.hosts)
+        if received:
+            lines.append("- bytes received: {}".format(received))
+        evaluations = sum(metrics.evaluations for metrics in self.hosts)
+        if evaluations:
+            reused = sum(metrics.evaluations_reused for metrics in self.hosts)
+            lines.append("- interface evaluations: {}, {} reused from the evaluation cache ({:.1f}%)".format(
+                evaluations, reused, 100.0 * reused / evaluations))
+        return lines
+
+    def load_jsonl(self, filename):
+        """Add the hosts of a file written by write_jsonl(), e.g. of one shard of a run"""
+        with open(filename, 'r') as f:
+            for line in f:
+                if line.strip():
+                    self.add(HostMetrics.from_dict(json.loads(line)))
+        return self
+
+    def write_jsonl(self, filename):
+        with open(filename, 'w') as f:
+            for metrics in self.hosts:
+                f.write(json.dumps(dict(metrics.to_dict(), job=self.job)) + "\n")
+        return filename
+
+    def write_prometheus(self, filename):
+        """Write the textfile collector file atomically, node_exporter may read it at any time"""
+        def label(value):
+            return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+        prefix = "interface_compliance"
+        job = label(self.job)
+        lines = [
+            "# HELP {}_phase_seconds Duration of a phase per host in the last run".format(prefix),
+            "# TYPE {}_phase_seconds gauge".format(prefix),
+        ]
+        for metrics in self.hosts:
+            for phase, seconds in metrics.phases.items():
+                lines.append('{}_phase_seconds{{job="{}",host="{}",phase="{}"}} {:.6f}'.format(
+                    prefix, job, label(metrics.host), phase, seconds))
+        lines += [
+            "# HELP {}_bytes_received Bytes of configuration received per host in the last run".format(prefix),
+            "# TYPE {}_bytes_received gauge".format(prefix),
+        ]
+        for metrics in self.hosts:
+            lines.append('{}_bytes_received{{job="{}",host="{}"}} {}'.format(
+                prefix, job, label(metrics.host), metrics.bytes_received))
+        lines += [
+            "# HELP {}_fleet_phase_seconds Phase duration percentiles over all hosts in the last run".format(prefix),
+            "# TYPE {}_fleet_phase_seconds gauge".format(prefix),
+        ]
+        for phase, quantiles in self.fleet_percentiles().items():
+            for quantile, seconds in quantiles.items():
+                lines.append('{}_fleet_phase_seconds{{job="{}",phase="{}",quantile="{}"}} {:.6f}'.format(
+                    prefix, job, phase, quantile, seconds))
+        lines += [
+            "# HELP {}_interface_evaluations Interfaces checked against a template in the last run".format(prefix),
+            "# TYPE {}_interface_evaluations gauge".format(prefix),
+            '{}_interface_evaluations{{job="{}",source="evaluated"}} {}'.format(
+                prefix, job, sum(metrics.evaluations - metrics.evaluations_reused for metrics in self.hosts)),
+            '{}_interface_evaluations{{job="{}",source="cache"}} {}'.format(
+                prefix, job, sum(metrics.evaluations_reused for metrics in self.hosts)),
+            "# HELP {}_hosts Hosts processed in the last run".format(prefix),
+            "# TYPE {}_hosts gauge".format(prefix),
+            '{}_hosts{{job="{}"}} {}'.format(prefix, job, len(self.hosts)),
+            "# HELP {}_last_run_timestamp_seconds Start of the last run".format(prefix),
+            "# TYPE {}_last_run_timestamp_seconds gauge".format(prefix),
+            '{}_last_run_timestamp_seconds{{job="{}"}} {:.0f}'.format(prefix, job, self.started),
+        ]
+
+        tmp_path = filename + '.tmp'
+        with open(tmp_path, 'w') as f:
+            f.write("\n".join(lines) + "\n")
+        os.replace(tmp_path, filename)
+        return filename
@@ -0,0 +1,264 @@
+import datetime
+import threading
+
+from compliance_results import COMPLIANT, NON_COMPLIANT
+
+# Width reserved for every statistics value in the header. The header is
+# written before the first host and overwritten in place when the report is
+# closed, so the final values must not change its length.
+STATS_WIDTH = 12
+
+REPORT_HEAD = """
+    <html>
+    <head>
+        <title>Compliance Report</title>
+        <style>
+            body {{ font-family: Arial, sans-serif; padding: 20px; }}
+            table {{ border-collapse: collapse; width: 100%; margin-bottom: 20px; }}
+            th, td {{ border: 1px solid #ddd; padding: 8px; }}
+            th {{ background-color: #f2f2f2; }}
+            .compliant {{ color: green; }}
+            .non-compliant {{ color: red; }}
+            .failed {{ color: orange; }}
+            .stats-container {{
+                display: grid;
+                grid-template-columns: 1fr 1fr;
+                gap: 20px;
+                margin-bottom: 20px;
+            }}
+            .stats-box {{
+                border: 1px solid #ddd;
+                padding: 15px;
+                border-radius: 5px;
+            }}
+            .template-table {{
+                margin-top: 20px;
+            }}
+            .template-table ul {{
+                margin: 0;
+                padding-left: 20px;
+            }}
+            .template-name {{
+                font-weight: bold;
+            }}
+        </style>
+    </head>
+    <body>
+        <h1>Compliance Report - Generated on {0}</h1>
+        """
+
+REPORT_STATS = """
+        <div class="stats-container">
+            <div class="stats-box">
+                <h2>Switch Statistics</h2>
+                <table>
+                    <tr><td>Total Switches:</td><td>{total_switches}</td></tr>
+                    <tr><td>Compliant Switches:</td><td class="compliant">{compliant_switches}</td></tr>
+                    <tr><td>Non-Compliant Switches:</td><td class="non-compliant">{non_compliant_switches}</td></tr>
+                    <tr><td>Failed Switches:</td><td class="failed">{failed_switches}</td></tr>
+                </table>
+            </div>
+
+            <div class="stats-box">
+                <h2>Interface Statistics</h2>
+                <table>
+                    <tr><td>Total Interfaces:</td><td>{total_interfaces}</td></tr>
+                    <tr><td>Compliant Interfaces:</td><td class="compliant">{compliant_interfaces}</td></tr>
+                    <tr><td>Non-Compliant Interfaces:</td><td class="non-compliant">{non_compliant_interfaces}</td></tr>
+                    <tr><td>Skipped Interfaces:</td><td>{skipped_interfaces}</td></tr>
+                </table>
+            </div>
+        </div>
+"""
+
+REPORT_TEMPLATES_HEAD = """
+        <h2>Template Details:</h2>
+        <table class="template-table">
+            <tr>
+                <th>Template Name</th>
+                <th>Required Commands</th>
+                <th>Additional Allowed Commands</th>
+            </tr>
+    """
+
+REPORT_TEMPLATE_ROW = """
+            <tr>
+                <td class="template-name">{0}</td>
+                <td><ul>{1}</ul></td>
+                <td><ul>{2}</ul></td>
+            </tr>
+        """
+
+REPORT_HOSTS_HEAD = """
+        </ul>
+        <p>Missing configuration files are stored in: {0}</p>
+        <h2>Host Results:</h2>
+        <table>
+            <tr>
+                <th>Host</th>
+                <th>Compliance Status</th>
+                <th>Details</th>
+            </tr>
+    """
+
+REPORT_HOST_ROW = """
+            <tr>
+                <td>{0}</td>
+                <td class="{1}">{2}</td>
+                <td>{3}</td>
+            </tr>
+        """
+
+REPORT_FOOTER = """
+        </table>
+    </body>
+    </html>
+    """
+
+STATS_KEYS = (
+    'total_switches', 'compliant_switches', 'non_compliant_switches', 'failed_switches',
+    'total_interfaces', 'compliant_interfaces', 'non_compliant_interfaces', 'skipped_interfaces',
+)
+
+
+def render_host_details(host_result):
+    """Returns (status, status css class, details html) of a host row"""
+    if host_result.failed:
+        return "FAILED", "failed", "Task failed: {0}".format(host_result.error)
+
+    non_compliant_ports = host_result.non_compliant_interfaces
+    skipped_ports = host_result.skipped_interfaces
+
+    if non_compliant_ports:
+        status = "NON-COMPLIANT"
+        status_class = "non-compliant"
+    else:
+        status = "COMPLIANT"
+        status_class = "compliant"
+
+    details = "<h3>Non-Compliant Interfaces:</h3>"
+    if non_compliant_ports:
+        details += "<ul>"
+        for intf in non_compliant_ports:
+            description = intf.description or "No description"
+            details += f"<li><strong>{intf.name}</strong> ({description})<ul>"
+
+            if intf.missing:
+                details += "<li>Missing commands: {}</li>".format(", ".join(intf.missing))
+
+            if intf.unexpected:
+                details += "<li>Unexpected commands: {}</li>".format(", ".join(intf.unexpected))
+
+            if intf.to_remove:
+                details += "<li>Commands to remove: {}</li>".format(", ".join(intf.to_remove))
+
+            details += "</ul></li>"
+        details += "</ul>"
+    else:
+        details += "<p>All interfaces are compliant.</p>"
+
+    if skipped_ports:
+        details += "<h3>Skipped Interfaces:</h3><ul>"
+        for intf in skipped_ports:
+            details += "<li>{0}: {1}</li>".format(intf.name, intf.description or "No description")
+        details += "</ul>"
+
+    return status, status_class, details
+
+
+class HtmlReportWriter:
+    """Writes the HTML compliance report while the hosts are processed
+
+    Header, template details and the host table head are written on open(),
+    every add_host() appends one row and only the statistics counters are
+    kept in memory. The statistics boxes are written as blank placeholders
+    of fixed width and filled in by close(), so a report of an aborted run
+    still contains every host written so far.
+    """
+
+    def __init__(self, filename, parsed_files, config_dir, generated_at=None):
+        self.filename = filename
+        self.parsed_files = parsed_files
+        self.config_dir = config_dir
+        self.generated_at = generated_at or datetime.datetime.now()
+        self.stats = dict.fromkeys(STATS_KEYS, 0)
+        self._file = None
+        self._stats_offset = None
+        self._lock = threading.Lock()
+
+    def __enter__(self):
+        return self.open()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def _write(self, text):
+        self._file.write(text.encode('utf-8'))
+
+    def _stats_block(self, stats):
+        return REPORT_STATS.format(**{key: str(stats.get(key, '')).rjust(STATS_WIDTH) for key in STATS_KEYS})
+
+    def open(self):
+        self._file = open(self.filename, 'wb')
+        self._write(REPORT_HEAD.format(self.generated_at.strftime('%Y-%m-%d %H:%M:%S')))
+        self._stats_offset = self._file.tell()
+        self._write(self._stats_block({}))
+
+        self._write(REPORT_TEMPLATES_HEAD)
+        for template_name, template_content in self.parsed_files.items():
+            self._write(REPORT_TEMPLATE_ROW.format(
+                template_name,
+                "".join("<li>{}</li>".format(cmd) for cmd in template_content['required']),
+                "".join("<li>{}</li>".format(cmd) for cmd in template_content['additional_allowed'])
+            ))
+
+        self._write("""
+        </table>
+
+        <h2>Parsed Template Files:</h2>
+        <ul>
+    """)
+        for filename in self.parsed_files.keys():
+            self._write("<li>{0}</li>".format(filename))
+
+        self._write(REPORT_HOSTS_HEAD.format(self.config_dir))
+        self._file.flush()
+        return self
+
+    def add_host(self, host_result):
+        """Count a HostResult and append its row to the report"""
+        status, status_class, details = render_host_details(host_result)
+        row = REPORT_HOST_ROW.format(host_result.host, status_class, status, details)
+
+        with self._lock:
+            stats = self.stats
+            stats['total_switches'] += 1
+            if host_result.failed:
+                stats['failed_switches'] += 1
+            else:
+                if host_result.is_compliant:
+                    stats['compliant_switches'] += 1
+                else:
+                    stats['non_compliant_switches'] += 1
+                for intf in host_result.interfaces:
+                    stats['total_interfaces'] += 1
+                    if intf.status == COMPLIANT:
+                        stats['compliant_interfaces'] += 1
+                    elif intf.status == NON_COMPLIANT:
+                        stats['non_compliant_interfaces'] += 1
+                    else:
+                        stats['skipped_interfaces'] += 1
+
+            self._write(row)
+            self._file.flush()
+
+    def close(self):
+        """Write the footer and fill in the statistics"""
+        if self._file is None:
+            return
+        with self._lock:
+            self._write(REPORT_FOOTER)
+            self._file.seek(self._stats_offset)
+            self._write(self._stats_block(self.stats))
+            self._file.close()
+            self._file = None
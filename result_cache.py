@@ -0,0 +1,153 @@
+import hashlib
+import json
+import os
+import threading
+import time
+
+# Bumped whenever the format of the cached results changes
+CACHE_VERSION = 4
+
+
+def config_hash(config):
+    """SHA-256 of a running-config
+
+    Line endings are normalised to '\n', with one after the last line, and
+    trailing empty lines are dropped, so a config fetched at once, read from
+    a file or streamed line by line (LineHasher) gets the same hash.
+    """
+    config = config.replace('\r', '').rstrip('\n')
+    if config:
+        config += '\n'
+    return hashlib.sha256(config.encode('utf-8')).hexdigest()
+
+
+class LineHasher:
+    """Passes the lines of a config through and hashes them on the way
+
+    The lines may come with or without their line ending, the digest equals
+    config_hash() of the whole config without holding it in memory. Empty
+    lines are only hashed once a non-empty line follows them. bytes counts
+    the UTF-8 encoded size with one '\n' per line.
+    """
+
+    def __init__(self, lines):
+        self._lines = lines
+        self._digest = hashlib.sha256()
+        self.bytes = 0
+
+    def __iter__(self):
+        update = self._digest.update
+        empty = 0
+        for line in self._lines:
+            data = (line.replace('\r', '').rstrip('\n') + '\n').encode('utf-8')
+            self.bytes += len(data)
+            if data == b'\n':
+                empty += 1
+            else:
+                update(b'\n' * empty + data)
+                empty = 0
+            yield line
+
+    def hexdigest(self):
+        return self._digest.hexdigest()
+
+
+def config_file_hash(path):
+    """config_hash() and UTF-8 size of a saved config, read line by line"""
+    with open(path, 'r') as f:
+        hasher = LineHasher(f)
+        for _ in hasher:
+            pass
+    return hasher.hexdigest(), hasher.bytes
+
+
+def template_fingerprint(parsed_templates, interface_pattern=None):
+    """Hash over the parsed interface templates and the checked interface names
+
+    Any change to a template (added, removed or edited command) or to the
+    interface name pattern changes the fingerprint and therefore
+    invalidates every cached result.
+    """
+    data = json.dumps([parsed_templates, interface_pattern], sort_keys=True)
+    return hashlib.sha256(data.encode('utf-8')).hexdigest()
+
+
+class ResultCache:
+    """Per-host cache of compliance results keyed by config hash and template fingerprint
+
+    Entries older than max_age seconds are dropped, and when there are more
+    than max_entries the least recently used hosts are evicted.
+    """
+
+    def __init__(self, path, fingerprint, max_entries=10000, max_age=7 * 24 * 3600):
+        self.path = path
+        self.fingerprint = fingerprint
+        self.max_entries = max_entries
+        self.max_age = max_age
+        self.entries = {}
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def load(self):
+        """Load the cache file, a missing or broken file starts an empty cache"""
+        try:
+            with open(self.path, 'r') as f:
+                data = json.load(f)
+            self.entries = data.get('hosts', {}) if data.get('version') == CACHE_VERSION else {}
+        except (OSError, ValueError, AttributeError):
+            self.entries = {}
+        self._evict()
+        return self
+
+    def cached_hash(self, host):
+        """Config hash of a usable entry for host, or None"""
+        entry = self.entries.get(host)
+        if entry and entry['template_fingerprint'] == self.fingerprint:
+            return entry['config_hash']
+        return None
+
+    def lookup(self, host, config_hash):
+        """Cached result for host if config and templates are unchanged"""
+        with self._lock:
+            if self.cached_hash(host) == config_hash:
+                entry = self.entries[host]
+                entry['used_at'] = time.time()
+                self.hits += 1
+                return entry['result']
+            self.misses += 1
+            return None
+
+    def store(self, host, config_hash, result, miss=False):
+        """Cache the result for host, miss counts it as evaluated without a lookup()"""
+        now = time.time()
+        with self._lock:
+            if miss:
+                self.misses += 1
+            self.entries[host] = {
+                'config_hash': config_hash,
+                'template_fingerprint': self.fingerprint,
+                'result': result,
+                'stored_at': now,
+                'used_at': now,
+            }
+
+    def _evict(self):
+        now = time.time()
+        self.entries = {host: entry for host, entry in self.entries.items()
+                        if now - entry.get('stored_at', 0) <= self.max_age}
+        if len(self.entries) > self.max_entries:
+            keep = sorted(self.entries, key=lambda h: self.entries[h].get('used_at', 0), reverse=True)
+            self.entries = {host: self.entries[host] for host in keep[:self.max_entries]}
+
+    def save(self):
+        """Evict and write the cache file atomically"""
+        with self._lock:
+            self._evict()
+            directory = os.path.dirname(self.path)
+            if directory and not os.path.exists(directory):
+                os.makedirs(directory)
+            tmp_path = self.path + '.tmp'
+            with open(tmp_path, 'w') as f:
+                json.dump({'version': CACHE_VERSION, 'hosts': self.entries}, f)
+            os.replace(tmp_path, self.path)
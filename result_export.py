@@ -0,0 +1,110 @@
+import csv
+import gzip
+import io
+import json
+import sys
+import threading
+
+EXPORT_FORMATS = ('jsonl', 'csv')
+
+EXPORT_FIELDS = ('run_id', 'host', 'interface', 'description', 'template', 'status', 'missing', 'unexpected',
+                 'to_remove', 'error')
+
+# Status of the single record written for a host that could not be checked
+FAILED = "Failed"
+
+# Separator of the command lists in CSV cells
+CSV_LIST_SEPARATOR = "; "
+
+
+def export_format(filename, requested=None):
+    """Requested format, otherwise csv for *.csv and *.csv.gz, jsonl for everything else"""
+    if requested:
+        return requested
+    name = filename[:-3] if filename.endswith('.gz') else filename
+    return 'csv' if name.endswith('.csv') else 'jsonl'
+
+
+def host_records(host_result, run_id=None):
+    """One export record per interface of a HostResult, one record with the error for a failed host"""
+    if host_result.failed:
+        yield {'run_id': run_id, 'host': host_result.host, 'interface': None, 'description': None,
+               'template': None, 'status': FAILED, 'missing': [], 'unexpected': [], 'to_remove': [],
+               'error': host_result.error}
+        return
+    for intf in host_result.interfaces:
+        yield {'run_id': run_id, 'host': host_result.host, 'interface': intf.name, 'description': intf.description,
+               'template': intf.template, 'status': intf.status, 'missing': intf.missing,
+               'unexpected': intf.unexpected, 'to_remove': intf.to_remove, 'error': None}
+
+
+class ResultExporter:
+    """Writes per-interface records as JSON Lines or CSV while the hosts are processed
+
+    Every add_host() writes the records of one host and flushes them, only
+    the open file is kept, so the memory used does not depend on the size
+    of the run. A filename of '-' writes to stdout, compress (or a name
+    ending in .gz) writes gzip.
+    """
+
+    def __init__(self, filename, fmt=None, compress=False, run_id=None, stream=None):
+        self.filename = filename
+        self.format = export_format(filename, fmt)
+        self.compress = compress or filename.endswith('.gz')
+        self.run_id = run_id
+        self.records = 0
+        # The real stdout: sys.stdout may be wrapped by colorama, which
+        # nornir_utils sets up with autoreset, or redirected by the caller
+        self._stdout = stream or sys.__stdout__
+        self._file = None
+        self._raw = None
+        self._csv = None
+        self._lock = threading.Lock()
+
+    def __enter__(self):
+        return self.open()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def open(self):
+        if self.filename == '-':
+            if self.compress:
+                self._raw = gzip.GzipFile(fileobj=self._stdout.buffer, mode='wb')
+                self._file = io.TextIOWrapper(self._raw, encoding='utf-8', newline='')
+            else:
+                self._file = self._stdout
+        elif self.compress:
+            self._file = gzip.open(self.filename, 'wt', encoding='utf-8', newline='')
+        else:
+            self._file = open(self.filename, 'w', encoding='utf-8', newline='')
+
+        if self.format == 'csv':
+            self._csv = csv.writer(self._file)
+            self._csv.writerow(EXPORT_FIELDS)
+        return self
+
+    def add_host(self, host_result):
+        """Write the records of a HostResult"""
+        with self._lock:
+            for record in host_records(host_result, self.run_id):
+                if self._csv is not None:
+                    self._csv.writerow([CSV_LIST_SEPARATOR.join(value) if isinstance(value, list) else value
+                                        for value in (record[field] for field in EXPORT_FIELDS)])
+                else:
+                    self._file.write(json.dumps(record) + "\n")
+                self.records += 1
+            self._file.flush()
+
+    def close(self):
+        if self._file is None:
+            return
+        with self._lock:
+            if self._file is self._stdout:
+                self._file.flush()
+            else:
+                self._file.close()
+                if self._raw is not None:
+                    self._raw.close()
+                    self._stdout.buffer.flush()
+            self._file = None
@@ -0,0 +1,480 @@
+"""SQLite store of the compliance results of every run
+
+Every run gets a row in runs, every checked host one in host_results and
+every interface one in interface_results. The database runs in WAL mode,
+so the HTML report or ad-hoc queries can read while a run is writing.
+
+    python result_store.py runs
+    python result_store.py non-compliant --days 7
+    python result_store.py report --run 12
+    python result_store.py delta --baseline 11 --run 12
+    python result_store.py merge shard1.db shard2.db shard3.db
+"""
+import argparse
+import datetime
+import json
+import sqlite3
+import threading
+import time
+from collections import Counter
+from heapq import merge as merge_sorted
+from itertools import groupby
+
+from compliance_results import NON_COMPLIANT, HostResult, InterfaceResult
+from report_writer import HtmlReportWriter
+from sharding import SHARD_LABEL, missing_shards, shard_of_source
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY,
+    started_at REAL NOT NULL,
+    finished_at REAL,
+    source TEXT,
+    config_dir TEXT,
+    templates TEXT
+);
+CREATE TABLE IF NOT EXISTS host_results (
+    id INTEGER PRIMARY KEY,
+    run_id INTEGER NOT NULL REFERENCES runs(id) ON DELETE CASCADE,
+    host TEXT NOT NULL,
+    failed INTEGER NOT NULL,
+    error TEXT,
+    checked_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS interface_results (
+    id INTEGER PRIMARY KEY,
+    host_id INTEGER NOT NULL REFERENCES host_results(id) ON DELETE CASCADE,
+    run_id INTEGER NOT NULL,
+    host TEXT NOT NULL,
+    interface TEXT NOT NULL,
+    description TEXT,
+    template TEXT,
+    status TEXT NOT NULL,
+    missing TEXT,
+    unexpected TEXT,
+    to_remove TEXT,
+    checked_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS interface_state (
+    host TEXT NOT NULL,
+    interface TEXT NOT NULL,
+    template TEXT,
+    status TEXT NOT NULL,
+    since REAL NOT NULL,
+    last_checked REAL NOT NULL,
+    PRIMARY KEY (host, interface)
+);
+CREATE INDEX IF NOT EXISTS idx_interface_state_status ON interface_state(status, since);
+CREATE INDEX IF NOT EXISTS idx_host_results_run ON host_results(run_id, host);
+CREATE INDEX IF NOT EXISTS idx_host_results_host ON host_results(host, checked_at);
+CREATE INDEX IF NOT EXISTS idx_interface_results_host_id ON interface_results(host_id);
+CREATE INDEX IF NOT EXISTS idx_interface_results_run ON interface_results(run_id, status);
+CREATE INDEX IF NOT EXISTS idx_interface_results_interface ON interface_results(host, interface, checked_at);
+CREATE INDEX IF NOT EXISTS idx_interface_results_template ON interface_results(template, status);
+"""
+
+# interface_state holds the latest status of every port and since when it
+# has had this status, updated with every stored result
+UPDATE_STATE = """
+INSERT INTO interface_state (host, interface, template, status, since, last_checked) VALUES (?, ?, ?, ?, ?, ?)
+ON CONFLICT (host, interface) DO UPDATE SET
+    since = CASE WHEN status = excluded.status THEN since ELSE excluded.since END,
+    status = excluded.status,
+    template = excluded.template,
+    last_checked = excluded.last_checked
+WHERE excluded.last_checked >= last_checked
+"""
+
+# Ports with the given status since before the cutoff, that were still part
+# of the last successful check of their host
+STATUS_SINCE = """
+SELECT s.host, s.interface, s.template, s.since, s.last_checked
+FROM interface_state s
+WHERE s.status = :status AND s.since <= :cutoff
+  AND s.last_checked >= (SELECT MAX(h.checked_at) FROM host_results h WHERE h.host = s.host AND h.failed = 0)
+ORDER BY s.since, s.host, s.interface
+"""
+
+
+# State of ports without any result left, run after deleting runs
+PRUNE_STATE = """
+DELETE FROM interface_state
+WHERE NOT EXISTS (SELECT 1 FROM interface_results i
+                  WHERE i.host = interface_state.host AND i.interface = interface_state.interface)
+"""
+
+
+class ResultStore:
+    """Writes and reads compliance results in a SQLite database
+
+    add_host() is thread-safe and buffers the rows, they are written in
+    one transaction per batch_size hosts and on flush().
+    """
+
+    def __init__(self, path, batch_size=200):
+        self.path = path
+        self.batch_size = batch_size
+        self._db = None
+        self._pending = []
+        self._lock = threading.Lock()
+
+    def open(self):
+        self._db = sqlite3.connect(self.path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute("PRAGMA foreign_keys=ON")
+        self._db.executescript(SCHEMA)
+        return self
+
+    def close(self):
+        if self._db is None:
+            return
+        self.flush()
+        self._db.close()
+        self._db = None
+
+    def __enter__(self):
+        return self.open()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def start_run(self, parsed_templates, config_dir, source=None, started_at=None):
+        """Create a run, returns its id"""
+        with self._lock, self._db:
+            cursor = self._db.execute(
+                "INSERT INTO runs (started_at, source, config_dir, templates) VALUES (?, ?, ?, ?)",
+                (started_at or time.time(), source, config_dir, json.dumps(parsed_templates)))
+            return cursor.lastrowid
+
+    def finish_run(self, run_id, finished_at=None):
+        self.flush()
+        with self._lock, self._db:
+            self._db.execute("UPDATE runs SET finished_at = ? WHERE id = ?", (finished_at or time.time(), run_id))
+
+    def add_host(self, run_id, host_result, checked_at=None):
+        """Queue a HostResult of a run for the next bulk write"""
+        with self._lock:
+            self._pending.append((run_id, host_result, checked_at or time.time()))
+            if len(self._pending) >= self.batch_size:
+                self._write_pending()
+
+    def flush(self):
+        with self._lock:
+            self._write_pending()
+
+    def _write_pending(self):
+        if not self._pending:
+            return
+        with self._db:
+            for run_id, host_result, checked_at in self._pending:
+                cursor = self._db.execute(
+                    "INSERT INTO host_results (run_id, host, failed, error, checked_at) VALUES (?, ?, ?, ?, ?)",
+                    (run_id, host_result.host, int(host_result.failed), host_result.error, checked_at))
+                host_id = cursor.lastrowid
+                self._db.executemany(
+                    "INSERT INTO interface_results (host_id, run_id, host, interface, description, template, "
+                    "status, missing, unexpected, to_remove, checked_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    [(host_id, run_id, host_result.host, intf.name, intf.description, intf.template, intf.status,
+                      json.dumps(intf.missing), json.dumps(intf.unexpected), json.dumps(intf.to_remove), checked_at)
+                     for intf in host_result.interfaces])
+                self._db.executemany(UPDATE_STATE, [
+                    (host_result.host, intf.name, intf.template, intf.status, checked_at, checked_at)
+                    for intf in host_result.interfaces])
+        self._pending = []
+
+    def run(self, run_id=None):
+        """A run as dict, the latest one without run_id, or None"""
+        if run_id is None:
+            row = self._db.execute("SELECT * FROM runs ORDER BY id DESC LIMIT 1").fetchone()
+        else:
+            row = self._db.execute("SELECT * FROM runs WHERE id = ?", (run_id,)).fetchone()
+        if row is None:
+            return None
+        run = dict(zip(('id', 'started_at', 'finished_at', 'source', 'config_dir', 'templates'), row))
+        run['templates'] = json.loads(run['templates']) if run['templates'] else {}
+        return run
+
+    def runs(self, limit=20):
+        return [dict(zip(('id', 'started_at', 'finished_at', 'source', 'hosts'), row)) for row in self._db.execute(
+            "SELECT r.id, r.started_at, r.finished_at, r.source, "
+            "(SELECT COUNT(*) FROM host_results h WHERE h.run_id = r.id) "
+            "FROM runs r ORDER BY r.id DESC LIMIT ?", (limit,))]
+
+    def host_results(self, run_id, by_host=False):
+        """HostResults of a run in the order they were stored, or sorted by host name"""
+        rows = self._db.execute(
+            "SELECT h.id, h.host, h.failed, h.error, i.interface, i.description, i.template, i.status, "
+            "i.missing, i.unexpected, i.to_remove "
+            "FROM host_results h LEFT JOIN interface_results i ON i.host_id = h.id "
+            "WHERE h.run_id = ? ORDER BY {}h.id, i.id".format("h.host, " if by_host else ""), (run_id,))
+        for _, host_rows in groupby(rows, key=lambda row: row[0]):
+            host_rows = list(host_rows)
+            _, host, failed, error = host_rows[0][:4]
+            interfaces = [InterfaceResult(row[4], row[5], row[6], row[7], json.loads(row[8]), json.loads(row[9]),
+                                          json.loads(row[10]))
+                          for row in host_rows if row[4] is not None]
+            yield HostResult(host, bool(failed), error, interfaces)
+
+    def interface_rows(self, run_id):
+        """{(host, interface): (status, template, description, missing, unexpected, to_remove)} of a run
+
+        The command lists stay JSON text, they are only decoded for the
+        interfaces that end up in a report.
+        """
+        return {(row[0], row[1]): row[2:] for row in self._db.execute(
+            "SELECT host, interface, status, template, description, missing, unexpected, to_remove "
+            "FROM interface_results WHERE run_id = ?", (run_id,))}
+
+    def checked_hosts(self, run_id):
+        """{host: failed} of a run"""
+        return {host: bool(failed) for host, failed in self._db.execute(
+            "SELECT host, failed FROM host_results WHERE run_id = ?", (run_id,))}
+
+    def previous_run(self, run_id):
+        """Id of the latest finished run before run_id, or None"""
+        row = self._db.execute("SELECT MAX(id) FROM runs WHERE id < ? AND finished_at IS NOT NULL",
+                               (run_id,)).fetchone()
+        return row[0]
+
+    def non_compliant_since(self, days, now=None):
+        """Ports non-compliant in every result of the last days, with the time they first failed"""
+        cutoff = (now or time.time()) - days * 24 * 3600
+        return [dict(zip(('host', 'interface', 'template', 'since', 'last_checked'), row))
+                for row in self._db.execute(STATUS_SINCE, {'status': NON_COMPLIANT, 'cutoff': cutoff})]
+
+    def prune(self, days, now=None):
+        """Delete the runs started more than days ago, returns the number of deleted runs
+
+        The state of ports that are in none of the remaining results, e.g.
+        of removed hosts and interfaces, is deleted with them.
+        """
+        cutoff = (now or time.time()) - days * 24 * 3600
+        with self._lock, self._db:
+            deleted = self._db.execute("DELETE FROM runs WHERE started_at < ?", (cutoff,)).rowcount
+            if deleted:
+                self._db.execute(PRUNE_STATE)
+            return deleted
+
+
+def write_report(store, run_id, filename):
+    """Render the HTML report of a stored run"""
+    run = store.run(run_id)
+    generated_at = datetime.datetime.fromtimestamp(run['started_at'])
+    with HtmlReportWriter(filename, run['templates'], run['config_dir'], generated_at) as writer:
+        for host_result in store.host_results(run_id):
+            writer.add_host(host_result)
+    return filename
+
+
+def merge_runs(store, shard_stores, on_result=None):
+    """Copy the latest run of every shard store into one new run of store
+
+    The shards must have been checked with the same templates. The hosts
+    are merged in name order, on_result is called with every copied
+    HostResult. A host found in more than one shard keeps the result of the
+    first shard store. Returns the id of the merged run and the duplicate
+    host names.
+    """
+    runs = [shard_store.run() for shard_store in shard_stores]
+    for shard_store, run in zip(shard_stores, runs):
+        if run is None:
+            raise ValueError("{} has no runs".format(shard_store.path))
+    if any(run['templates'] != runs[0]['templates'] for run in runs[1:]):
+        raise ValueError("the shards were checked with different templates")
+
+    sources = sorted({SHARD_LABEL.sub('', run['source'] or '').strip() for run in runs})
+    run_id = store.start_run(runs[0]['templates'], runs[0]['config_dir'],
+                             source="{} (merged from {} shards)".format(", ".join(sources), len(runs)),
+                             started_at=min(run['started_at'] for run in runs))
+    # (host, shard position, started_at, HostResult) of every shard, sorted by host
+    shard_results = [((host_result.host, position, run['started_at'], host_result)
+                      for host_result in shard_store.host_results(run['id'], by_host=True))
+                     for position, (shard_store, run) in enumerate(zip(shard_stores, runs))]
+    previous = None
+    duplicates = []
+    for host, _, checked_at, host_result in merge_sorted(*shard_results, key=lambda entry: entry[:2]):
+        if host == previous:
+            duplicates.append(host)
+            continue
+        previous = host
+        store.add_host(run_id, host_result, checked_at=checked_at)
+        if on_result is not None:
+            on_result(host_result)
+    store.finish_run(run_id, max(run['finished_at'] or run['started_at'] for run in runs))
+    return run_id, duplicates
+
+
+def _timestamp(value):
+    return datetime.datetime.fromtimestamp(value).strftime('%Y-%m-%d %H:%M:%S') if value else "-"
+
+
+def main(argv=None, prog=None):
+    parser = argparse.ArgumentParser(prog=prog, description="Query the compliance result store")
+    parser.add_argument("--store", default="compliance_results.db", help="Result store (default: compliance_results.db)")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("runs", help="List the latest runs")
+    non_compliant = commands.add_parser("non-compliant", help="Ports that have been non-compliant for some days")
+    non_compliant.add_argument("--days", type=float, default=7, help="Minimum number of days (default: 7)")
+    report = commands.add_parser("report", help="Render the HTML report of a run")
+    report.add_argument("--run", type=int, help="Run id (default: latest run)")
+    report.add_argument("-o", "--output", help="Report file (default: compliance_report_<run start>.html)")
+    delta = commands.add_parser("delta", help="Render the changes between two runs")
+    delta.add_argument("--baseline", type=int, help="Run to compare against (default: the run before --run)")
+    delta.add_argument("--run", type=int, help="Run id (default: latest run)")
+    delta.add_argument("-o", "--output", help="Report file (default: compliance_delta_<run start>.html)")
+    export = commands.add_parser("export", help="Write one record per interface of a run as JSON Lines or CSV")
+    export.add_argument("--run", type=int, help="Run id (default: latest run)")
+    export.add_argument("-o", "--output", default="-", help="Export file, '-' for stdout (default: -)")
+    export.add_argument("--format", choices=('jsonl', 'csv'), help="Format (default: csv for *.csv and *.csv.gz, otherwise jsonl)")
+    export.add_argument("--gzip", action="store_true", help="Compress with gzip (default for *.gz)")
+    merge = commands.add_parser("merge", help="Combine the latest runs of the shard stores of a --shard run into one run")
+    merge.add_argument("shards", nargs="+", help="Result stores of the shards")
+    merge.add_argument("-o", "--output", help="Report file (default: compliance_report_<run start>.html)")
+    merge.add_argument("-t", "--templates", help="Template directory for the missing configs (default: the templates stored with the shard runs)")
+    merge.add_argument("--metrics", nargs="+", default=[], metavar="JSONL", help="host_metrics files of the shards, written as one file and Prometheus textfile")
+    merge.add_argument("--no-interface-ranges", action="store_true", help="Write one block per interface in the missing configs")
+    merge.add_argument("--max-interface-ranges", type=int, help="Maximum number of ranges per 'interface range' command (default: 5)")
+    args = parser.parse_args(argv)
+
+    if args.command == "merge":
+        merge_shards(parser, args)
+        return
+
+    with ResultStore(args.store) as store:
+        if args.command == "runs":
+            for run in store.runs():
+                print("{:>6}  {}  {}  {:>6} hosts  {}".format(run['id'], _timestamp(run['started_at']),
+                                                            _timestamp(run['finished_at']), run['hosts'],
+                                                            run['source'] or ""))
+        elif args.command == "non-compliant":
+            for row in store.non_compliant_since(args.days):
+                print("{} {} ({}) since {}".format(row['host'], row['interface'], row['template'],
+                                                   _timestamp(row['since'])))
+        elif args.command == "delta":
+            run = store.run(args.run)
+            baseline_run_id = args.baseline or (store.previous_run(run['id']) if run else None)
+            if run is None or baseline_run_id is None or store.run(baseline_run_id) is None:
+                parser.error("no such run")
+            # Imported here, delta_report is only needed for this command
+            from delta_report import delta_between_runs, delta_summary, write_delta_report
+            delta, current_rows, baseline_rows, baseline_run, current_run = delta_between_runs(
+                store, baseline_run_id, run['id'])
+            filename = args.output or "compliance_delta_{}.html".format(
+                datetime.datetime.fromtimestamp(run['started_at']).strftime('%Y%m%d_%H%M%S'))
+            print("\n".join(delta_summary(delta)))
+            print("Delta report saved to: {}".format(
+                write_delta_report(filename, delta, current_rows, baseline_rows, baseline_run, current_run)))
+        elif args.command == "export":
+            run = store.run(args.run)
+            if run is None:
+                parser.error("no such run")
+            # Imported here, result_export is only needed for this command
+            from result_export import ResultExporter
+            with ResultExporter(args.output, args.format, args.gzip, run['id']) as exporter:
+                for host_result in store.host_results(run['id']):
+                    exporter.add_host(host_result)
+            if args.output != '-':
+                print("{} interface records exported to: {}".format(exporter.records, args.output))
+        else:
+            run = store.run(args.run)
+            if run is None:
+                parser.error("no such run")
+            filename = args.output or "compliance_report_{}.html".format(
+                datetime.datetime.fromtimestamp(run['started_at']).strftime('%Y%m%d_%H%M%S'))
+            print("Report saved to: {}".format(write_report(store, run['id'], filename)))
+
+
+def merge_shards(parser, args):
+    """The merge command: one report, one missing_configs set and one set of statistics"""
+    # Imported here, only the merge needs the missing config generation and the metrics
+    from interface_compliance_check import (MAX_INTERFACE_RANGES, MISSING_CONFIG_DIR, generate_missing_config_files,
+                                            line_count_summary, write_metrics)
+    from metrics import MetricsCollector
+    from template_cache import TemplateCache
+    from template_matcher import TemplateResolver, compile_templates
+
+    max_ranges = args.max_interface_ranges or MAX_INTERFACE_RANGES
+    shard_stores = []
+    try:
+        for path in args.shards:
+            shard_stores.append(ResultStore(path).open())
+        runs = [shard_store.run() for shard_store in shard_stores]
+        if None in runs:
+            parser.error("{} has no runs".format(args.shards[runs.index(None)]))
+        shards = [shard_of_source(run['source']) for run in runs]
+        if None in shards:
+            print("Warning: the latest run of {} was not a --shard run".format(args.shards[shards.index(None)]))
+        else:
+            missing, counts = missing_shards(shards)
+            if len(counts) > 1:
+                print("Warning: the shards were cut for different shard counts: {}".format(counts))
+            elif missing:
+                print("Warning: shards {} of {} are missing, the merged run is incomplete".format(
+                    ", ".join(str(index) for index in missing), counts[0]))
+
+        if args.templates:
+            _, templates, errors = TemplateCache().templates(args.templates)
+            for error in errors:
+                print(error)
+        else:
+            templates = compile_templates(runs[0]['templates'])
+        resolver = TemplateResolver(templates)
+
+        hosts = 0
+        failed_hosts = []
+        statuses = Counter()
+        line_counts = {}
+
+        def add_host(host_result):
+            nonlocal hosts
+            hosts += 1
+            if host_result.failed:
+                failed_hosts.append(host_result.host)
+            statuses.update(intf.status for intf in host_result.interfaces)
+            generate_missing_config_files({host_result.host: host_result}, resolver, not args.no_interface_ranges,
+                                          max_ranges, line_counts)
+
+        with ResultStore(args.store) as store:
+            try:
+                run_id, duplicates = merge_runs(store, shard_stores, on_result=add_host)
+            except ValueError as e:
+                parser.error(str(e))
+            run = store.run(run_id)
+            filename = args.output or "compliance_report_{}.html".format(
+                datetime.datetime.fromtimestamp(run['started_at']).strftime('%Y%m%d_%H%M%S'))
+            report_file = write_report(store, run_id, filename)
+    finally:
+        for shard_store in shard_stores:
+            shard_store.close()
+
+    if duplicates:
+        print("Warning: {} hosts were checked by more than one shard, kept the first result: {}".format(
+            len(duplicates), ", ".join(sorted(duplicates))))
+    print("Merged {} shards: {} hosts, {} failed, {} interfaces ({})".format(
+        len(shard_stores), hosts, len(failed_hosts), sum(statuses.values()),
+        ", ".join("{} {}".format(count, status) for status, count in sorted(statuses.items()))))
+    if failed_hosts:
+        print("\nThe Task failed on the following Hosts:")
+        print('--------------------------------------------')
+        for host in failed_hosts:
+            print(host)
+
+    if args.metrics:
+        metrics = MetricsCollector("check")
+        metrics.started = run['started_at']
+        for filename in args.metrics:
+            metrics.load_jsonl(filename)
+        print()
+        print("\n".join(metrics.summary()))
+        metrics_file, prometheus_file = write_metrics(metrics, ".")
+        print("Phase timing per host saved to: {} and {}".format(metrics_file, prometheus_file))
+
+    print("\nDetailed report saved to: {} (run {} in {})".format(report_file, run_id, args.store))
+    print("Missing configuration files are stored in: {}".format(MISSING_CONFIG_DIR))
+    if not args.no_interface_ranges:
+        print("\n".join(line_count_summary(line_counts)))
+
+
+if __name__ == "__main__":
+    main()
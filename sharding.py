@@ -0,0 +1,95 @@
+"""Deterministic partitioning of the inventory over several check nodes
+
+Every node runs interface_compliance_check.py with --shard i/N on the same
+inventory and computes the same partition without talking to the others.
+A host goes to the shard that ranks highest for it (rendezvous hashing on
+the host name), unless that shard is already full: shards are capped at
+(1 + SHARD_SLACK) times the average load, where the load is the number of
+hosts or, with weights, their run time of a previous run. Adding a shard
+only moves the hosts that rank the new shard highest.
+
+The shards write separate result stores, result_store.py merge combines
+them into one run.
+"""
+import hashlib
+import json
+import re
+
+SHARD_SLACK = 0.05
+
+# Appended to the source of a stored run, see shard_label()
+SHARD_LABEL = re.compile(r'\(shard (\d+)/(\d+)\)$')
+
+
+def parse_shard(value):
+    """'i/N' with 1 <= i <= N as (i, N), for argparse"""
+    match = re.fullmatch(r'\s*(\d+)\s*/\s*(\d+)\s*', value)
+    if not match or not 1 <= int(match.group(1)) <= int(match.group(2)):
+        raise ValueError("expected i/N with 1 <= i <= N, got {!r}".format(value))
+    return int(match.group(1)), int(match.group(2))
+
+
+def shard_label(shard):
+    return "(shard {}/{})".format(*shard)
+
+
+def shard_of_source(source):
+    """(i, N) of a run whose source ends with shard_label(), otherwise None"""
+    match = SHARD_LABEL.search(source or "")
+    return (int(match.group(1)), int(match.group(2))) if match else None
+
+
+def _rank(host, shard):
+    digest = hashlib.sha256("{}/{}".format(host, shard).encode('utf-8')).digest()
+    return int.from_bytes(digest[:8], 'big')
+
+
+def assign_shards(hosts, count, weights=None, slack=SHARD_SLACK):
+    """{host: shard number 1..count}
+
+    weights maps host names to their run time, hosts without a weight count
+    with the average of the known ones. The heaviest hosts are placed first,
+    ties in name order, so the result only depends on the arguments.
+    """
+    hosts = sorted(set(hosts))
+    weights = weights or {}
+    known = [weights[host] for host in hosts if weights.get(host, 0) > 0]
+    default = sum(known) / len(known) if known else 1.0
+    host_weights = {host: weights[host] if weights.get(host, 0) > 0 else default for host in hosts}
+    capacity = (1 + slack) * sum(host_weights.values()) / count
+
+    loads = [0.0] * (count + 1)
+    assignment = {}
+    for host in sorted(hosts, key=lambda h: -host_weights[h]):
+        weight = host_weights[host]
+        preferred = sorted(range(1, count + 1), key=lambda shard: _rank(host, shard), reverse=True)
+        shard = next((s for s in preferred if loads[s] + weight <= capacity),
+                     min(preferred, key=lambda s: loads[s]))
+        assignment[host] = shard
+        loads[shard] += weight
+    return assignment
+
+
+def shard_hosts(hosts, shard, weights=None):
+    """The hosts of shard (i, N)"""
+    index, count = shard
+    return {host for host, assigned in assign_shards(hosts, count, weights).items() if assigned == index}
+
+
+def load_weights(filename):
+    """{host: seconds} from a host_metrics JSON Lines file, the sum of the phases of every host"""
+    weights = {}
+    with open(filename, 'r') as f:
+        for line in f:
+            if line.strip():
+                record = json.loads(line)
+                weights[record['host']] = sum(record.get('phases', {}).values())
+    return weights
+
+
+def missing_shards(shards):
+    """Shard numbers not in a list of (i, N), and the counts N if they differ"""
+    counts = sorted({count for _, count in shards})
+    if len(counts) != 1:
+        return [], counts
+    return sorted(set(range(1, counts[0] + 1)) - {index for index, _ in shards}), counts
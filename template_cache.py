@@ -0,0 +1,186 @@
+import json
+import os
+
+from template_matcher import TemplateMatcher
+
+# Bumped whenever the format of the cached templates changes
+TEMPLATE_CACHE_VERSION = 1
+
+
+def parse_template_file(file_path):
+    """Parse one interface template file
+
+    Lines starting with '#' are comments, lines starting with '+' are
+    additionally allowed commands, every other non-empty line is required.
+    Raises ValueError for a '+' or '-' line without a command.
+    """
+    required = []
+    additional_allowed = []
+    with open(file_path, 'r') as file:
+        for number, line in enumerate(file, 1):
+            line = line.strip()
+            if line.startswith('#'):
+                continue  # Ignoriere Kommentarzeilen
+            elif line.startswith('+'):
+                if not line[1:].strip():
+                    raise ValueError("Zeile {}: '+' ohne Befehl".format(number))
+                additional_allowed.append(line[1:].strip())
+            elif line:
+                if line.startswith('-') and not line[1:].strip():
+                    raise ValueError("Zeile {}: '-' ohne Befehl".format(number))
+                required.append(line)
+
+    return {
+        "required": required,
+        "additional_allowed": additional_allowed
+    }
+
+
+def list_template_files(directory_path):
+    """Returns ([(filename, path)] of the .txt templates, errors)"""
+    try:
+        filenames = os.listdir(directory_path)
+    except FileNotFoundError:
+        return [], [f"Das Verzeichnis {directory_path} wurde nicht gefunden."]
+    except PermissionError:
+        return [], [f"Keine Berechtigung, auf das Verzeichnis {directory_path} zuzugreifen."]
+    return [(filename, os.path.join(directory_path, filename))
+            for filename in filenames if filename.endswith('.txt')], []
+
+
+def file_error(filename, error):
+    """Error message for a template file that could not be read or parsed"""
+    if isinstance(error, ValueError) and not isinstance(error, UnicodeDecodeError):
+        return f"Fehler in der Datei {filename}: {error}"
+    return f"Fehler beim Lesen der Datei {filename}: {error}"
+
+
+def lint_template(filename, template):
+    """Problems of a parsed template, returns (errors, warnings)
+
+    Template commands match config lines by prefix and the first required
+    command in template order wins, so a required command that starts with
+    an earlier one can never be satisfied, and a required command that
+    starts with a command to remove is removed whenever it is configured.
+    """
+    errors = []
+    warnings = []
+    standard = [cmd for cmd in template['required'] if not cmd.startswith('-')]
+    remove = [cmd[1:].strip() for cmd in template['required'] if cmd.startswith('-')]
+
+    if not standard:
+        warnings.append(f"{filename}: keine Pflichtbefehle, jedes Interface ist konform")
+    for commands, kind in ((standard, "Pflichtbefehl"), (remove, "zu entfernender Befehl"),
+                           (template['additional_allowed'], "erlaubter Befehl")):
+        for cmd in sorted({cmd for cmd in commands if commands.count(cmd) > 1}):
+            warnings.append(f"{filename}: {kind} '{cmd}' ist mehrfach angegeben")
+    for cmd in sorted(set(standard) & set(template['additional_allowed'])):
+        warnings.append(f"{filename}: '+{cmd}' ist bereits Pflichtbefehl")
+
+    for index, cmd in enumerate(standard):
+        earlier = next((prefix for prefix in standard[:index] if prefix != cmd and cmd.startswith(prefix)), None)
+        if earlier is not None:
+            errors.append(f"{filename}: Pflichtbefehl '{cmd}' wird nie erfüllt, '{earlier}' davor passt schon")
+        removed = next((prefix for prefix in remove if cmd.startswith(prefix)), None)
+        if removed is not None:
+            errors.append(f"{filename}: Pflichtbefehl '{cmd}' wird durch '-{removed}' entfernt")
+    return errors, warnings
+
+
+def lint_templates(directory_path):
+    """Parse every template of a directory and check it, returns (number of templates, errors, warnings)"""
+    template_files, errors = list_template_files(directory_path)
+    warnings = []
+    for filename, file_path in sorted(template_files):
+        try:
+            template = parse_template_file(file_path)
+            TemplateMatcher(template['required'], template['additional_allowed'], name=filename)
+        except (OSError, ValueError) as e:
+            errors.append(file_error(filename, e))
+            continue
+        file_errors, file_warnings = lint_template(filename, template)
+        errors += file_errors
+        warnings += file_warnings
+    return len(template_files), errors, warnings
+
+
+class TemplateCache:
+    """Parsed and compiled interface templates, cached per template file
+
+    Entries are keyed by the absolute path of a template and validated
+    against its mtime and size, so only new or changed templates are parsed
+    and compiled again. A file that cannot be read or parsed is reported in
+    the errors and left out, the other templates are still used. Without a
+    path nothing is written and every template is compiled.
+    """
+
+    def __init__(self, path=None):
+        self.path = path
+        self.entries = {}
+        self.compiled = 0
+        self.reused = 0
+        self._dirty = False
+
+    def load(self):
+        """Load the cache file, a missing or broken file starts an empty cache"""
+        if self.path is None:
+            return self
+        try:
+            with open(self.path, 'r') as f:
+                data = json.load(f)
+            self.entries = data.get('templates', {}) if data.get('version') == TEMPLATE_CACHE_VERSION else {}
+        except (OSError, ValueError, AttributeError):
+            self.entries = {}
+        return self
+
+    def templates(self, directory_path):
+        """Returns ({filename: parsed template}, {filename: TemplateMatcher}, errors)"""
+        parsed = {}
+        compiled = {}
+        template_files, errors = list_template_files(directory_path)
+
+        for filename, file_path in template_files:
+            key = os.path.abspath(file_path)
+            try:
+                stat = os.stat(file_path)
+                entry = self.entries.get(key)
+                if entry and entry['mtime'] == stat.st_mtime_ns and entry['size'] == stat.st_size:
+                    matcher = TemplateMatcher.from_dict(entry['matcher'])
+                    matcher.name = filename
+                    self.reused += 1
+                else:
+                    template = parse_template_file(file_path)
+                    matcher = TemplateMatcher(template['required'], template['additional_allowed'], name=filename)
+                    self.entries[key] = {'mtime': stat.st_mtime_ns, 'size': stat.st_size,
+                                         'matcher': matcher.to_dict()}
+                    self._dirty = True
+                    self.compiled += 1
+            except (OSError, ValueError) as e:
+                if self.entries.pop(key, None) is not None:
+                    self._dirty = True
+                errors.append(file_error(filename, e))
+                continue
+            parsed[filename] = {"required": matcher.required, "additional_allowed": matcher.additional_allowed}
+            compiled[filename] = matcher
+
+        # Templates deleted from this directory
+        directory = os.path.abspath(directory_path)
+        for key in [key for key in self.entries if os.path.dirname(key) == directory and
+                    os.path.basename(key) not in parsed]:
+            del self.entries[key]
+            self._dirty = True
+
+        return parsed, compiled, errors
+
+    def save(self):
+        """Write the cache file atomically if a template was compiled or removed"""
+        if self.path is None or not self._dirty:
+            return
+        directory = os.path.dirname(self.path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump({'version': TEMPLATE_CACHE_VERSION, 'templates': self.entries}, f)
+        os.replace(tmp_path, self.path)
+        self._dirty = False
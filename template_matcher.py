@@ -0,0 +1,305 @@
+import re
+import threading
+from collections import OrderedDict
+
+# Serialises the lazy compile of matchers restored with from_dict(), they
+# are shared by the Nornir threads. Module level, so matchers stay picklable.
+_COMPILE_LOCK = threading.Lock()
+
+
+class TemplateMatcher:
+    """Interface template compiled for single-pass compliance checks
+
+    A config line matches a template command if it starts with it. The
+    required and additional allowed commands are combined into one regex
+    with one alternative per required command, so a single match() tells
+    which required command (the first one in template order, as in the old
+    nested loops) or whether an allowed command matched. Lines that are
+    exactly a template command, the common case for compliant ports, are
+    answered from a precomputed dict without touching the regex. A matcher
+    restored with from_dict() compiles its regexes on the first line that
+    needs them.
+    """
+
+    __slots__ = ('name', 'required', 'additional_allowed', 'standard_commands', 'remove_commands',
+                 '_pattern', '_allowed_group', '_remove_pattern', '_exact', '_sources')
+
+    def __init__(self, required, additional_allowed=None, name=None):
+        self.name = name
+        self.required = list(required)
+        self.additional_allowed = list(additional_allowed or [])
+
+        # Commands starting with '-' have to be removed from the interface
+        self.standard_commands = [cmd for cmd in self.required if not cmd.startswith('-')]
+        self.remove_commands = [cmd[1:].strip() for cmd in self.required if cmd.startswith('-')]
+
+        alternatives = ["({})".format(re.escape(cmd)) for cmd in self.standard_commands]
+        if self.additional_allowed:
+            alternatives.append("({})".format("|".join(re.escape(cmd) for cmd in self.additional_allowed)))
+        self._allowed_group = len(self.standard_commands) + 1 if self.additional_allowed else None
+        self._sources = (
+            "|".join(alternatives) if alternatives else None,
+            "|".join("({})".format(re.escape(cmd)) for cmd in self.remove_commands) if self.remove_commands else None,
+        )
+        self._compile()
+
+        self._exact = {}
+        for cmd in self.standard_commands + self.additional_allowed + self.remove_commands:
+            self._exact[cmd] = self._classify(cmd)
+
+    def _compile(self):
+        with _COMPILE_LOCK:
+            sources = self._sources
+            if sources is None:
+                return
+            pattern, remove_pattern = sources
+            self._pattern = re.compile(pattern) if pattern is not None else None
+            self._remove_pattern = re.compile(remove_pattern) if remove_pattern is not None else None
+            # Cleared last, a thread that sees None finds both patterns set
+            self._sources = None
+
+    def to_dict(self):
+        """Compiled form for the template cache, restored by from_dict()"""
+        sources = self._sources
+        sources = sources or (
+            self._pattern.pattern if self._pattern is not None else None,
+            self._remove_pattern.pattern if self._remove_pattern is not None else None,
+        )
+        return {
+            'name': self.name,
+            'required': self.required,
+            'additional_allowed': self.additional_allowed,
+            'pattern': sources[0],
+            'remove_pattern': sources[1],
+            'allowed_group': self._allowed_group,
+            'exact': [[cmd] + list(classified) for cmd, classified in self._exact.items()],
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        matcher = cls.__new__(cls)
+        matcher.name = data['name']
+        matcher.required = data['required']
+        matcher.additional_allowed = data['additional_allowed']
+        matcher.standard_commands = [cmd for cmd in matcher.required if not cmd.startswith('-')]
+        matcher.remove_commands = [cmd[1:].strip() for cmd in matcher.required if cmd.startswith('-')]
+        matcher._allowed_group = data['allowed_group']
+        matcher._pattern = None
+        matcher._remove_pattern = None
+        matcher._sources = (data['pattern'], data['remove_pattern'])
+        matcher._exact = {cmd: (required_index, allowed, remove_index)
+                          for cmd, required_index, allowed, remove_index in data['exact']}
+        return matcher
+
+    def _classify(self, line):
+        """Returns (index of matched required command or None, matched allowed, index of command to remove or None)"""
+        if self._sources is not None:
+            self._compile()
+        required_index = None
+        allowed = False
+        if self._pattern is not None:
+            match = self._pattern.match(line)
+            if match:
+                if match.lastindex == self._allowed_group:
+                    allowed = True
+                else:
+                    required_index = match.lastindex - 1
+
+        remove_index = None
+        if self._remove_pattern is not None:
+            match = self._remove_pattern.match(line)
+            if match:
+                remove_index = match.lastindex - 1
+
+        return required_index, allowed, remove_index
+
+    def evaluate(self, config_lines):
+        """Check interface config lines against the template
+
+        Returns (missing, unexpected, to_remove), missing in template order.
+        """
+        found = set()
+        unexpected = []
+        to_remove = []
+        exact = self._exact
+
+        for line in config_lines:
+            line = line.strip()
+            if not line or line.startswith('interface'):
+                continue
+
+            classified = exact.get(line)
+            if classified is None:
+                classified = self._classify(line)
+            required_index, allowed, remove_index = classified
+
+            if required_index is not None:
+                found.add(required_index)
+            if remove_index is not None:
+                to_remove.append(self.remove_commands[remove_index])
+            if required_index is None and not allowed and remove_index is None:
+                unexpected.append(line)
+
+        missing = []
+        seen = set()
+        found_commands = {self.standard_commands[index] for index in found}
+        for cmd in self.standard_commands:
+            if cmd not in found_commands and cmd not in seen:
+                seen.add(cmd)
+                missing.append(cmd)
+
+        return missing, unexpected, to_remove
+
+
+def compile_templates(parsed_templates):
+    """Compile the parsed template files into {template name: TemplateMatcher}"""
+    return {
+        name: TemplateMatcher(content['required'], content['additional_allowed'], name=name)
+        for name, content in parsed_templates.items()
+    }
+
+
+class EvaluationCache:
+    """LRU cache of TemplateMatcher.evaluate() results
+
+    Access ports with the same template mostly have identical bodies, so
+    the results are keyed by (template name, interface lines) and every
+    distinct body is evaluated once. The lines come stripped and without
+    empty lines from the config parser, the dict hashes them once per
+    lookup. Their order is part of the key, evaluate() reports unexpected
+    and removed commands in config order. A pickled cache, e.g. in a
+    worker process, starts empty.
+    """
+
+    def __init__(self, max_entries=100000):
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __getstate__(self):
+        return {'max_entries': self.max_entries}
+
+    def __setstate__(self, state):
+        self.__init__(state['max_entries'])
+
+    def __len__(self):
+        return len(self._entries)
+
+    def evaluate(self, matcher, config_lines):
+        """Returns ((missing, unexpected, to_remove), True if the result was reused)"""
+        key = (matcher.name, tuple(config_lines))
+
+        with self._lock:
+            result = self._entries.get(key)
+            if result is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+        if result is not None:
+            # Copies, the lists end up in InterfaceResults
+            return tuple(list(part) for part in result), True
+
+        result = matcher.evaluate(config_lines)
+        with self._lock:
+            self.misses += 1
+            self._entries[key] = tuple(tuple(part) for part in result)
+            if len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return result, False
+
+
+class TemplateResolver:
+    """Resolves interface descriptions to templates in one pass
+
+    The template names (without .txt) are compiled into an Aho-Corasick
+    automaton, so a description is scanned once no matter how many
+    templates exist. A description equal to a template name wins, otherwise
+    the longest template name contained in the description, ties are broken
+    alphabetically. Results are memoized per description.
+
+    evaluation_cache is an optional EvaluationCache for the interface
+    checks. It belongs to the resolver, so resolving with new templates
+    also starts with a new cache.
+    """
+
+    def __init__(self, templates, memo_size=65536, evaluation_cache=None):
+        self.templates = templates
+        self.memo_size = memo_size
+        self.evaluation_cache = evaluation_cache
+        self._memo = {}
+        self._names = sorted(templates)
+        self._bases = [name.rsplit('.', 1)[0] for name in self._names]
+        self._build_automaton()
+
+    def _build_automaton(self):
+        goto = [{}]
+        fail = [0]
+        output = [[]]
+        for index, base in enumerate(self._bases):
+            state = 0
+            for char in base:
+                if char not in goto[state]:
+                    goto.append({})
+                    fail.append(0)
+                    output.append([])
+                    goto[state][char] = len(goto) - 1
+                state = goto[state][char]
+            output[state].append(index)
+
+        # Breadth-first: failure links point to the longest proper suffix
+        # that is also a prefix of some template name, depth 1 fails to the root
+        queue = list(goto[0].values())
+        for state in queue:
+            for char, next_state in goto[state].items():
+                queue.append(next_state)
+                fallback = fail[state]
+                while fallback and char not in goto[fallback]:
+                    fallback = fail[fallback]
+                fail[next_state] = goto[fallback].get(char, 0)
+                output[next_state] = output[next_state] + output[fail[next_state]]
+
+        self._goto = goto
+        self._fail = fail
+        self._output = output
+        # Empty template names ("".txt) match every description
+        self._empty = [index for index, base in enumerate(self._bases) if not base]
+
+    def resolve_name(self, description):
+        """Name of the template for a description, or None"""
+        if not description:
+            return None
+        try:
+            return self._memo[description]
+        except KeyError:
+            pass
+
+        name = None
+        if description + '.txt' in self.templates:
+            name = description + '.txt'
+        else:
+            best = None
+            goto, fail, output = self._goto, self._fail, self._output
+            state = 0
+            for char in description:
+                while state and char not in goto[state]:
+                    state = fail[state]
+                state = goto[state].get(char, 0)
+                for index in output[state]:
+                    if best is None or len(self._bases[index]) > len(self._bases[best]) or \
+                            (len(self._bases[index]) == len(self._bases[best]) and index < best):
+                        best = index
+            if best is None and self._empty:
+                best = self._empty[0]
+            if best is not None:
+                name = self._names[best]
+
+        if len(self._memo) >= self.memo_size:
+            self._memo.clear()
+        self._memo[description] = name
+        return name
+
+    def resolve(self, description):
+        """Template for a description, or None"""
+        name = self.resolve_name(description)
+        return self.templates[name] if name is not None else None
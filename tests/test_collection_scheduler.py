@@ -0,0 +1,468 @@
+"""Caps and AIMD back-off of the collection scheduler
+
+The unit tests hold slots from threads and check the concurrency seen
+inside the slots. The live tests run check_switch_compliance through
+Nornir against fake SSH devices (benchmarks/fake_ssh_server.py) and count
+the sessions on the server side.
+
+    python -m pytest tests
+"""
+import importlib.util
+import os
+import random
+import re
+import tempfile
+import threading
+import time
+import unittest
+from collections import Counter
+
+from collection_scheduler import AdaptiveLimiter, CollectionScheduler
+
+TEMPLATE_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "interface_templates")
+
+
+class FakeGroup:
+    def __init__(self, name):
+        self.name = name
+
+
+class FakeHost:
+    """The parts of a Nornir host the scheduler looks at"""
+
+    def __init__(self, name, site=None, proxy=None, groups=()):
+        self.name = name
+        self.data = {'site': site, 'socks_proxy': proxy}
+        self.groups = [FakeGroup(group) for group in groups]
+
+    def get(self, key, default=None):
+        return self.data.get(key) or default
+
+
+def wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.005)
+    return True
+
+
+class SlotRun:
+    """Runs every host through scheduler.slot() in its own thread and holds the slots until release()"""
+
+    def __init__(self, scheduler, hosts):
+        self.scheduler = scheduler
+        self.active = Counter()
+        self.peak = Counter()
+        self._lock = threading.Lock()
+        self._release = threading.Event()
+        self._threads = [threading.Thread(target=self._run, args=(host,)) for host in hosts]
+
+    def _count(self, keys, delta):
+        with self._lock:
+            for key in keys:
+                self.active[key] += delta
+                self.peak[key] = max(self.peak[key], self.active[key])
+
+    def _run(self, host):
+        keys = ('global', 'site:' + self.scheduler.group_key(host), 'proxy:' + self.scheduler.proxy_key(host))
+        with self.scheduler.slot(host) as connected:
+            connected(0.0)
+            self._count(keys, 1)
+            self._release.wait(5)
+            self._count(keys, -1)
+
+    def start(self):
+        for thread in self._threads:
+            thread.start()
+        return self
+
+    def saturated(self, active_global):
+        """Wait until active_global slots are held, then give other threads time to overshoot"""
+        reached = wait_for(lambda: self.active['global'] >= active_global)
+        time.sleep(0.05)
+        return reached
+
+    def release(self):
+        self._release.set()
+        for thread in self._threads:
+            thread.join(5)
+        return not any(thread.is_alive() for thread in self._threads)
+
+
+class AdaptiveLimiterTest(unittest.TestCase):
+
+    def test_fixed_limit_without_target_latency(self):
+        limiter = AdaptiveLimiter("fixed", 4)
+        self.assertEqual(limiter.limit, 4)
+        limiter.feedback(10.0, False)
+        self.assertEqual(limiter.limit, 4)
+
+    def test_adaptive_limit_starts_at_half(self):
+        self.assertEqual(AdaptiveLimiter("a", 8, target_latency=1.0).limit, 4)
+        self.assertEqual(AdaptiveLimiter("a", 1, target_latency=1.0).limit, 1)
+
+    def test_additive_increase_after_limit_fast_connects(self):
+        limiter = AdaptiveLimiter("a", 8, target_latency=1.0)
+        for _ in range(3):
+            limiter.feedback(0.1, True)
+        self.assertEqual(limiter.limit, 4)
+        limiter.feedback(0.1, True)
+        self.assertEqual(limiter.limit, 5)
+        for _ in range(5):
+            limiter.feedback(0.1, True)
+        self.assertEqual(limiter.limit, 6)
+
+    def test_increase_stops_at_max_limit(self):
+        limiter = AdaptiveLimiter("a", 2, target_latency=1.0)
+        for _ in range(20):
+            limiter.feedback(0.1, True)
+        self.assertEqual(limiter.limit, 2)
+
+    def test_multiplicative_decrease_on_failure_and_slow_connect(self):
+        limiter = AdaptiveLimiter("a", 16, target_latency=1.0)
+        self.assertEqual(limiter.limit, 8)
+        limiter.feedback(0.1, False)
+        self.assertEqual(limiter.limit, 4)
+        limiter.feedback(2.0, True)
+        self.assertEqual(limiter.limit, 2)
+        limiter.feedback(2.0, True)
+        limiter.feedback(2.0, True)
+        self.assertEqual(limiter.limit, 1)
+
+    def test_decrease_resets_the_increase_count(self):
+        limiter = AdaptiveLimiter("a", 16, target_latency=1.0)
+        for _ in range(7):
+            limiter.feedback(0.1, True)
+        limiter.feedback(0.1, False)
+        self.assertEqual(limiter.limit, 4)
+        for _ in range(3):
+            limiter.feedback(0.1, True)
+        self.assertEqual(limiter.limit, 4)
+        limiter.feedback(0.1, True)
+        self.assertEqual(limiter.limit, 5)
+
+    def test_acquire_waits_until_a_slot_is_released(self):
+        limiter = AdaptiveLimiter("a", 2)
+        limiter.acquire()
+        limiter.acquire()
+        acquired = threading.Event()
+
+        def third():
+            limiter.acquire()
+            acquired.set()
+
+        thread = threading.Thread(target=third)
+        thread.start()
+        self.assertFalse(acquired.wait(0.1))
+        limiter.release()
+        self.assertTrue(acquired.wait(5))
+        thread.join(5)
+        self.assertEqual(limiter.active, 2)
+        self.assertEqual(limiter.peak, 2)
+
+    def test_raised_limit_wakes_waiting_threads(self):
+        limiter = AdaptiveLimiter("a", 4, target_latency=1.0)
+        limiter.acquire()
+        limiter.acquire()
+        acquired = threading.Event()
+        thread = threading.Thread(target=lambda: (limiter.acquire(), acquired.set()))
+        thread.start()
+        self.assertFalse(acquired.wait(0.1))
+        limiter.feedback(0.1, True)
+        limiter.feedback(0.1, True)
+        self.assertEqual(limiter.limit, 3)
+        self.assertTrue(acquired.wait(5))
+        thread.join(5)
+
+
+class CollectionSchedulerTest(unittest.TestCase):
+
+    def test_site_is_the_site_entry_or_the_first_group(self):
+        scheduler = CollectionScheduler(4)
+        self.assertEqual(scheduler.group_key(FakeHost("a", site="vienna", groups=["ios"])), "vienna")
+        self.assertEqual(scheduler.group_key(FakeHost("b", groups=["graz", "ios"])), "graz")
+        self.assertEqual(scheduler.group_key(FakeHost("c")), "ungrouped")
+
+    def test_proxy_is_the_socks_proxy_entry_or_the_default(self):
+        scheduler = CollectionScheduler(4, default_proxy="127.0.0.1:1084")
+        self.assertEqual(scheduler.proxy_key(FakeHost("a", proxy="jump1:1080")), "jump1:1080")
+        self.assertEqual(scheduler.proxy_key(FakeHost("b")), "127.0.0.1:1084")
+
+    def test_per_site_cap(self):
+        scheduler = CollectionScheduler(10, per_group_limit=2)
+        hosts = [FakeHost("a{}".format(i), site="A") for i in range(6)] + \
+                [FakeHost("b{}".format(i), site="B") for i in range(6)]
+        run = SlotRun(scheduler, hosts).start()
+        self.assertTrue(run.saturated(4))
+        self.assertEqual(run.active['site:A'], 2)
+        self.assertEqual(run.active['site:B'], 2)
+        self.assertTrue(run.release())
+        self.assertEqual(run.peak['site:A'], 2)
+        self.assertEqual(run.peak['site:B'], 2)
+        self.assertEqual(scheduler.connects, 12)
+
+    def test_per_proxy_cap(self):
+        scheduler = CollectionScheduler(10, per_proxy_limit=3)
+        hosts = [FakeHost("h{}".format(i), site="S{}".format(i), proxy="p{}".format(i % 2)) for i in range(12)]
+        run = SlotRun(scheduler, hosts).start()
+        self.assertTrue(run.saturated(6))
+        self.assertEqual(run.active['proxy:p0'], 3)
+        self.assertEqual(run.active['proxy:p1'], 3)
+        self.assertTrue(run.release())
+        self.assertEqual(run.peak['proxy:p0'], 3)
+        self.assertEqual(run.peak['proxy:p1'], 3)
+
+    def test_global_cap(self):
+        scheduler = CollectionScheduler(4)
+        hosts = [FakeHost("h{}".format(i), site="S{}".format(i), proxy="p{}".format(i)) for i in range(12)]
+        run = SlotRun(scheduler, hosts).start()
+        self.assertTrue(run.saturated(4))
+        self.assertEqual(run.active['global'], 4)
+        self.assertTrue(run.release())
+        self.assertEqual(run.peak['global'], 4)
+        self.assertEqual(scheduler.global_limiter.peak, 4)
+
+    def test_tightest_of_the_caps_wins(self):
+        scheduler = CollectionScheduler(3, per_proxy_limit=2, per_group_limit=2)
+        hosts = [FakeHost("h{}".format(i), site="AB"[i % 2], proxy="p{}".format(i // 2 % 2)) for i in range(12)]
+        run = SlotRun(scheduler, hosts).start()
+        self.assertTrue(run.saturated(3))
+        self.assertTrue(run.release())
+        self.assertEqual(run.peak['global'], 3)
+        for key, peak in run.peak.items():
+            if key != 'global':
+                self.assertLessEqual(peak, 2, key)
+
+    def test_failed_connect_halves_every_limiter_of_the_host(self):
+        scheduler = CollectionScheduler(8, per_proxy_limit=8, per_group_limit=8, target_latency=1.0)
+        host = FakeHost("h", site="A", proxy="p")
+        with self.assertRaises(OSError):
+            with scheduler.slot(host):
+                raise OSError("connect failed")
+        self.assertEqual((scheduler.connects, scheduler.failures), (1, 1))
+        self.assertEqual(scheduler.global_limiter.limit, 2)
+        self.assertEqual(scheduler.group_limiters["A"].limit, 2)
+        self.assertEqual(scheduler.proxy_limiters["p"].limit, 2)
+        self.assertEqual(scheduler.global_limiter.active, 0)
+
+    def test_error_after_connect_is_not_a_connect_failure(self):
+        scheduler = CollectionScheduler(8, target_latency=1.0)
+        with self.assertRaises(ValueError):
+            with scheduler.slot(FakeHost("h", site="A")) as connected:
+                connected(0.1)
+                raise ValueError("command failed")
+        self.assertEqual((scheduler.connects, scheduler.failures), (1, 0))
+        self.assertEqual(scheduler.global_limiter.limit, 4)
+
+    def test_slow_connects_back_off_and_fast_ones_recover(self):
+        scheduler = CollectionScheduler(8, target_latency=0.5)
+        host = FakeHost("h", site="A")
+        for _ in range(3):
+            with scheduler.slot(host) as connected:
+                connected(2.0)
+        self.assertEqual(scheduler.global_limiter.limit, 1)
+        for _ in range(3):
+            with scheduler.slot(host) as connected:
+                connected(0.1)
+        self.assertEqual(scheduler.global_limiter.limit, 3)
+        self.assertEqual(scheduler.failures, 0)
+
+
+LIVE = all(importlib.util.find_spec(name) for name in ("paramiko", "nornir", "nornir_netmiko"))
+
+
+def write_inventory(filename, devices, data=None):
+    """Nornir hosts.yaml for FakeDevices, data maps host names to {key: value} host data"""
+    with open(filename, 'w') as f:
+        for device in devices:
+            f.write("{}:\n  hostname: 127.0.0.1\n  port: {}\n  platform: cisco_ios\n  username: admin\n"
+                    "  password: admin\n".format(device.name, device.port))
+            host_data = (data or {}).get(device.name)
+            if host_data:
+                f.write("  data:\n" + "".join("    {}: {}\n".format(*item) for item in host_data.items()))
+
+
+def run_check(hosts_file, template_resolver, **kwargs):
+    """{host: HostResult} of check_switch_compliance over the hosts of a hosts.yaml"""
+    from nornir import InitNornir
+    from interface_compliance_check import check_switch_compliance, collect_host_results
+
+    nr = InitNornir(runner={"plugin": "threaded", "options": {"num_workers": 16}},
+                    inventory={"plugin": "SimpleInventory", "options": {"host_file": hosts_file}},
+                    logging={"enabled": False})
+    results = collect_host_results(nr.run(task=check_switch_compliance, template_resolver=template_resolver,
+                                          **kwargs))
+    nr.close_connections()
+    return results
+
+
+@unittest.skipUnless(LIVE, "needs paramiko, nornir and nornir_netmiko")
+class FakeSSHServerTest(unittest.TestCase):
+    """check_switch_compliance with a scheduler against fake SSH devices, sessions counted on the server side"""
+
+    # Every session waits this long before the SSH handshake, so a session
+    # is closed on the server before the next one in its slot is counted
+    LATENCY = 0.2
+
+    def setUp(self):
+        from benchmarks.fake_ssh_server import FakeDevice, SessionStats
+        from benchmarks.fleet_generator import generate_switch_config
+        from template_cache import TemplateCache
+        from template_matcher import TemplateResolver
+
+        parsed, templates, _ = TemplateCache().templates(TEMPLATE_DIR)
+        self.resolver = TemplateResolver(templates)
+        self.stats = {'global': SessionStats(), 'site:A': SessionStats(), 'site:B': SessionStats(),
+                      'proxy:p0': SessionStats(), 'proxy:p1': SessionStats()}
+        self.devices = []
+        self.tmp = tempfile.TemporaryDirectory()
+        data = {}
+        for index in range(8):
+            name = "sw{:02d}".format(index)
+            site, proxy = "AB"[index % 2], "p{}".format(index // 2 % 2)
+            config = generate_switch_config(name, random.Random(index), parsed, 48)
+            device = FakeDevice(name, config, latency=self.LATENCY,
+                                stats=[self.stats['global'], self.stats['site:' + site],
+                                       self.stats['proxy:' + proxy]]).start()
+            self.devices.append(device)
+            data[name] = {'site': site, 'socks_proxy': proxy}
+        self.hosts_file = os.path.join(self.tmp.name, "hosts.yaml")
+        write_inventory(self.hosts_file, self.devices, data)
+
+    def tearDown(self):
+        for device in self.devices:
+            device.stop()
+        self.tmp.cleanup()
+
+    def run_check(self, scheduler):
+        return run_check(self.hosts_file, self.resolver, scheduler=scheduler)
+
+    def test_caps_hold_on_the_server(self):
+        results = self.run_check(CollectionScheduler(3, per_proxy_limit=2, per_group_limit=2))
+        self.assertEqual(sorted(host for host, result in results.items() if not result.failed),
+                         [device.name for device in self.devices])
+        self.assertEqual(self.stats['global'].logins, 8)
+        self.assertLessEqual(self.stats['global'].peak, 3)
+        for key in ('site:A', 'site:B', 'proxy:p0', 'proxy:p1'):
+            self.assertLessEqual(self.stats[key].peak, 2, key)
+
+    def test_slow_devices_back_off_to_one_session(self):
+        scheduler = CollectionScheduler(4, target_latency=self.LATENCY / 4)
+        results = self.run_check(scheduler)
+        self.assertFalse(any(result.failed for result in results.values()))
+        self.assertEqual((scheduler.connects, scheduler.failures), (8, 0))
+        self.assertEqual(scheduler.global_limiter.limit, 1)
+        self.assertLessEqual(self.stats['global'].peak, 2)
+
+
+
+if LIVE:
+    from benchmarks.fake_ssh_server import FakeDevice
+
+    class NoDescriptionsDevice(FakeDevice):
+        """Answers "show interfaces description" with an empty output"""
+
+        def _descriptions(self):
+            return ''
+
+
+@unittest.skipUnless(LIVE, "needs paramiko, nornir and nornir_netmiko")
+class FakeDeviceFetchTest(unittest.TestCase):
+    """Every fetch strategy against fake devices gives the offline result
+
+    The large devices have configs of over 1500 lines. The interfaces
+    strategy sends one command per interface and runs against small ones.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        from template_cache import TemplateCache
+        from template_matcher import TemplateResolver
+
+        cls.parsed, templates, _ = TemplateCache().templates(TEMPLATE_DIR)
+        cls.resolver = TemplateResolver(templates)
+        cls.devices = []
+        cls.expected = {}
+        cls.tmp = tempfile.TemporaryDirectory()
+        cls.large = cls.start_fleet("large", ["sw{:02d}".format(index) for index in range(3)], 240)
+        cls.small = cls.start_fleet("small", ["sw1{:d}".format(index) for index in range(2)], 48)
+        cls.no_descriptions = cls.start_fleet("no_descriptions", ["sw20"], 48, NoDescriptionsDevice)
+        cls.mixed = cls.start_fleet("mixed", ["sw30"], 48, port_types=[
+            "GigabitEthernet", "FiveGigabitEthernet", "TwoGigabitEthernet", "TenGigabitEthernet",
+            "TwentyFiveGigE", "Port-channel"])
+
+    @classmethod
+    def start_fleet(cls, label, names, ports, device_class=None, port_types=None):
+        """Start a FakeDevice per name, returns the hosts.yaml of the fleet
+
+        With port_types the GigabitEthernet ports are renamed to these
+        types in turn.
+        """
+        from benchmarks.fake_ssh_server import FakeDevice
+        from benchmarks.fleet_generator import generate_switch_config
+
+        device_class = device_class or FakeDevice
+        from interface_compliance_check import evaluate_switch_config
+
+        devices = []
+        for name in names:
+            config = generate_switch_config(name, random.Random(name), cls.parsed, ports, drift_rate=0.2)
+            if port_types:
+                config = re.sub(r'(?m)^interface GigabitEthernet(\d+/\d+/(\d+))$', lambda match: "interface {}{}".format(
+                    port_types[int(match.group(2)) % len(port_types)], match.group(1)), config)
+            devices.append(device_class(name, config).start())
+            cls.expected[name] = evaluate_switch_config(name, config, cls.resolver).to_dict()
+        cls.devices += devices
+        hosts_file = os.path.join(cls.tmp.name, label + ".yaml")
+        write_inventory(hosts_file, devices)
+        return hosts_file
+
+    @classmethod
+    def tearDownClass(cls):
+        for device in cls.devices:
+            device.stop()
+        cls.tmp.cleanup()
+
+    def assert_offline_results(self, results):
+        self.assertTrue(results)
+        for host, result in results.items():
+            self.assertEqual(result.to_dict(), self.expected[host], host)
+
+    def test_configs_are_large(self):
+        for device in self.devices[:3]:
+            self.assertGreater(len(device.config.splitlines()), 1500)
+
+    def test_full(self):
+        self.assert_offline_results(run_check(self.large, self.resolver, fetch_strategy='full'))
+
+    def test_stream(self):
+        self.assert_offline_results(run_check(self.large, self.resolver, stream=True))
+
+    def test_section(self):
+        self.assert_offline_results(run_check(self.large, self.resolver, fetch_strategy='section'))
+
+    def test_interfaces(self):
+        fetch_log = {}
+        results = run_check(self.small, self.resolver, fetch_strategy='interfaces', fetch_log=fetch_log)
+        self.assert_offline_results(results)
+        self.assertEqual({entry['strategy'] for entry in fetch_log.values()}, {'interfaces'})
+
+    def test_interfaces_of_every_port_type(self):
+        results = run_check(self.mixed, self.resolver, fetch_strategy='interfaces')
+        self.assert_offline_results(results)
+        self.assertEqual(len({re.match(r'\D+', intf.name).group() for intf in results['sw30'].interfaces}), 6)
+
+    def test_interfaces_without_description_table_falls_back_to_full(self):
+        for stream in (False, True):
+            fetch_log = {}
+            results = run_check(self.no_descriptions, self.resolver, fetch_strategy='interfaces',
+                                fetch_log=fetch_log, stream=stream)
+            self.assert_offline_results(results)
+            self.assertEqual(fetch_log['sw20']['strategy'], 'full')
+            self.assertGreater(fetch_log['sw20']['bytes'], 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,72 @@
+"""Scheduling of the service mode"""
+import importlib.util
+import os
+import tempfile
+import unittest
+from concurrent.futures import Future
+
+TEMPLATE_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "interface_templates")
+
+HOSTS = "".join("sw{:02d}:\n  hostname: 127.0.0.1\n  port: {}\n  platform: cisco_ios\n".format(index, 30000 + index)
+                for index in range(3))
+
+
+@unittest.skipUnless(importlib.util.find_spec("nornir"), "needs nornir")
+class ComplianceDaemonTest(unittest.TestCase):
+
+    def setUp(self):
+        from nornir import InitNornir
+        from collection_scheduler import CollectionScheduler
+        from compliance_daemon import ComplianceDaemon
+        from template_cache import TemplateCache
+
+        self.tmp = tempfile.TemporaryDirectory()
+        hosts_file = os.path.join(self.tmp.name, "hosts.yaml")
+        with open(hosts_file, 'w') as f:
+            f.write(HOSTS)
+        self.nr = InitNornir(inventory={"plugin": "SimpleInventory", "options": {"host_file": hosts_file}},
+                             logging={"enabled": False})
+        self.daemon = ComplianceDaemon(self.nr, TEMPLATE_DIR, TemplateCache(), CollectionScheduler(2), interval=60)
+
+    def tearDown(self):
+        self.daemon._executor.shutdown()
+        self.tmp.cleanup()
+
+    def test_single_host_nornir(self):
+        from nornir.plugins.runners import SerialRunner
+        from compliance_daemon import single_host_nornir
+
+        host_nr = single_host_nornir(self.nr, "sw01")
+        self.assertEqual(list(host_nr.inventory.hosts), ["sw01"])
+        self.assertIs(host_nr.inventory.hosts["sw01"], self.nr.inventory.hosts["sw01"])
+        self.assertIs(host_nr.config, self.nr.config)
+        self.assertIs(host_nr.data, self.nr.data)
+        self.assertIsInstance(host_nr.runner, SerialRunner)
+        self.assertEqual(sorted(self.daemon._host_nr), ["sw00", "sw01", "sw02"])
+
+    def requeue(self, host, due, error=None):
+        future = Future()
+        if error is None:
+            future.set_result(None)
+        else:
+            future.set_exception(error)
+        self.daemon._queue = []
+        self.daemon._requeue(host, due, future)
+        return self.daemon._queue
+
+    def test_checked_host_is_rescheduled(self):
+        ((following, host),) = self.requeue("sw01", 1000.0)
+        self.assertEqual(host, "sw01")
+        self.assertEqual(self.daemon.state.host("sw01")['next_check_at'], following)
+
+    def test_crashed_check_is_rescheduled_and_recorded(self):
+        ((following, host),) = self.requeue("sw02", 1000.0, RuntimeError("boom"))
+        self.assertEqual(host, "sw02")
+        data = self.daemon.state.host("sw02")
+        self.assertEqual(data['status'], "failed")
+        self.assertIn("boom", data['error'])
+        self.assertEqual(data['next_check_at'], following)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,125 @@
+"""Interface blocks and the lazy block tree of config_tree"""
+import unittest
+
+from compliance_results import COMPLIANT, NON_COMPLIANT
+from config_tree import ConfigNode, compile_interface_pattern, iter_interface_blocks, iter_interface_nodes
+from interface_compliance_check import evaluate_switch_config, parse_interfaces
+from template_matcher import TemplateMatcher, TemplateResolver
+
+CONFIG = """\
+hostname sw01
+!
+interface Vlan10
+ ip address 10.0.0.1 255.255.255.0
+!
+interface GigabitEthernet1/0/1
+ description ACCESS port
+ switchport mode access
+ service-policy type control subscriber DOT1X
+  event session-started match-all
+   10 authenticate using dot1x
+  event authentication-failure
+   10 terminate dot1x
+ spanning-tree portfast
+!
+interface TenGigabitEthernet1/1/1
+ description UPLINK
+ switchport mode trunk
+!
+line vty 0 4
+ login local
+"""
+
+
+class IterInterfaceBlocksTest(unittest.TestCase):
+
+    def test_nested_lines_are_kept_in_config_order(self):
+        blocks = list(iter_interface_blocks(CONFIG.splitlines()))
+        self.assertEqual([name for name, _, _ in blocks], ["GigabitEthernet1/0/1", "TenGigabitEthernet1/1/1"])
+        name, description, commands = blocks[0]
+        self.assertEqual(description, "ACCESS port")
+        self.assertEqual(commands, [
+            "switchport mode access",
+            "service-policy type control subscriber DOT1X",
+            "event session-started match-all",
+            "10 authenticate using dot1x",
+            "event authentication-failure",
+            "10 terminate dot1x",
+            "spanning-tree portfast",
+        ])
+
+    def test_parse_interfaces_keeps_nested_lines(self):
+        interfaces = parse_interfaces(CONFIG)
+        self.assertIn("10 terminate dot1x", interfaces["GigabitEthernet1/0/1"]['config'])
+        self.assertEqual(interfaces["TenGigabitEthernet1/1/1"]['config'], ["switchport mode trunk"])
+
+    def test_only_a_direct_description_line_is_the_description(self):
+        config = "interface Gi1/0/2\n switchport\n  description nested\n"
+        self.assertEqual(list(iter_interface_blocks(config.splitlines(), compile_interface_pattern(r'Gi'))),
+                         [("Gi1/0/2", None, ["switchport", "description nested"])])
+
+    def test_blocks_are_yielded_while_the_lines_are_read(self):
+        read = []
+
+        def lines():
+            for line in CONFIG.splitlines():
+                read.append(line)
+                yield line
+
+        blocks = iter_interface_blocks(lines())
+        self.assertEqual(next(blocks)[0], "GigabitEthernet1/0/1")
+        self.assertEqual(read[-1], "interface TenGigabitEthernet1/1/1")
+
+    def test_interface_pattern_selects_the_blocks(self):
+        pattern = compile_interface_pattern(r'^TenGig')
+        self.assertEqual([name for name, _, _ in iter_interface_blocks(CONFIG.splitlines(), pattern)],
+                         ["TenGigabitEthernet1/1/1"])
+
+
+class ConfigNodeTest(unittest.TestCase):
+
+    def test_children_are_built_on_first_access(self):
+        (_, node), _ = iter_interface_nodes(CONFIG.splitlines())
+        self.assertIsInstance(node, ConfigNode)
+        self.assertEqual(node.text, "interface GigabitEthernet1/0/1")
+        self.assertIsNone(node._children)
+        self.assertEqual([child.text for child in node.children], [
+            "description ACCESS port",
+            "switchport mode access",
+            "service-policy type control subscriber DOT1X",
+            "spanning-tree portfast",
+        ])
+        self.assertIs(node.children, node.children)
+
+    def test_nested_children(self):
+        (_, node), _ = iter_interface_nodes(CONFIG.splitlines())
+        policy = node.children[2]
+        self.assertEqual([child.text for child in policy.children],
+                         ["event session-started match-all", "event authentication-failure"])
+        self.assertEqual([child.text for child in policy.children[1].children], ["10 terminate dot1x"])
+        self.assertEqual(policy.children[1].children[0].children, [])
+        self.assertEqual(policy.children[0].indent, 2)
+
+
+class NestedCommandComplianceTest(unittest.TestCase):
+
+    def setUp(self):
+        access = TemplateMatcher(["switchport mode access", "service-policy type control subscriber",
+                                  "spanning-tree portfast"],
+                                 ["event session-started", "10 authenticate"], name="ACCESS.txt")
+        self.resolver = TemplateResolver({"ACCESS.txt": access})
+
+    def test_unexpected_nested_command_is_reported(self):
+        result = evaluate_switch_config("sw01", CONFIG, self.resolver)
+        intf = result.interfaces[0]
+        self.assertEqual(intf.status, NON_COMPLIANT)
+        self.assertEqual(intf.unexpected, ["event authentication-failure", "10 terminate dot1x"])
+        self.assertEqual(intf.missing, [])
+
+    def test_allowed_nested_commands_are_compliant(self):
+        config = CONFIG.replace("  event authentication-failure\n   10 terminate dot1x\n", "")
+        self.assertEqual(evaluate_switch_config("sw01", config, self.resolver).interfaces[0].status, COMPLIANT)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,88 @@
+"""Changes between two runs"""
+import os
+import tempfile
+import unittest
+
+from compliance_results import COMPLIANT, NON_COMPLIANT, SKIPPED, HostResult, InterfaceResult
+from delta_report import compute_delta, delta_between_runs, delta_summary, write_delta_report
+from result_store import ResultStore
+
+
+def row(status, template="ACCESS.txt"):
+    return (status, template, "desc", "[]", "[]", "[]")
+
+
+class ComputeDeltaTest(unittest.TestCase):
+
+    def test_categories(self):
+        baseline = {
+            ("sw01", "Gi1/0/1"): row(NON_COMPLIANT),
+            ("sw01", "Gi1/0/2"): row(COMPLIANT),
+            ("sw01", "Gi1/0/3"): row(NON_COMPLIANT),
+            ("sw01", "Gi1/0/4"): row(COMPLIANT, "ACCESS.txt"),
+            ("sw01", "Gi1/0/5"): row(COMPLIANT),
+        }
+        current = {
+            ("sw01", "Gi1/0/1"): row(COMPLIANT),
+            ("sw01", "Gi1/0/2"): row(NON_COMPLIANT),
+            ("sw01", "Gi1/0/3"): row(NON_COMPLIANT),
+            ("sw01", "Gi1/0/4"): row(COMPLIANT, "AP.txt"),
+            ("sw01", "Gi1/0/5"): row(SKIPPED, None),
+            ("sw01", "Gi1/0/6"): row(NON_COMPLIANT),
+        }
+        delta = compute_delta(baseline, current, {"sw01": False})
+        self.assertEqual(delta['newly_non_compliant'], [("sw01", "Gi1/0/2"), ("sw01", "Gi1/0/6")])
+        self.assertEqual(delta['newly_fixed'], [("sw01", "Gi1/0/1")])
+        self.assertEqual(delta['newly_skipped'], [("sw01", "Gi1/0/5")])
+        self.assertEqual(delta['template_changed'], [("sw01", "Gi1/0/4")])
+        self.assertEqual(delta['failed_hosts'], [])
+
+    def test_failed_and_unchecked_hosts_are_not_fixed(self):
+        baseline = {("sw01", "Gi1/0/1"): row(NON_COMPLIANT), ("sw02", "Gi1/0/1"): row(NON_COMPLIANT),
+                    ("sw03", "Gi1/0/1"): row(NON_COMPLIANT)}
+        current = {("sw01", "Gi1/0/1"): row(COMPLIANT)}
+        delta = compute_delta(baseline, current, {"sw01": False, "sw02": True})
+        self.assertEqual(delta['newly_fixed'], [("sw01", "Gi1/0/1")])
+        self.assertEqual(delta['failed_hosts'], ["sw02"])
+
+    def test_removed_interface_is_not_fixed(self):
+        delta = compute_delta({("sw01", "Gi1/0/1"): row(NON_COMPLIANT)}, {}, {"sw01": False})
+        self.assertEqual(delta['newly_fixed'], [])
+
+    def test_template_changes(self):
+        delta = compute_delta({}, {}, {}, {"a.txt": {"required": ["x"]}, "b.txt": {"required": ["y"]}},
+                              {"b.txt": {"required": ["z"]}, "c.txt": {"required": []}})
+        self.assertEqual(delta['templates_added'], ["c.txt"])
+        self.assertEqual(delta['templates_removed'], ["a.txt"])
+        self.assertEqual(delta['templates_changed'], ["b.txt"])
+
+    def test_identical_runs(self):
+        rows = {("sw01", "Gi1/0/1"): row(NON_COMPLIANT), ("sw01", "Gi1/0/2"): row(SKIPPED, None)}
+        delta = compute_delta(rows, dict(rows), {"sw01": False})
+        self.assertEqual(delta_summary(delta)[:4], ["Newly non-compliant interfaces: 0", "Newly fixed interfaces: 0",
+                                                    "Newly skipped interfaces: 0",
+                                                    "Interfaces with a different template: 0"])
+
+
+class DeltaBetweenRunsTest(unittest.TestCase):
+
+    def test_stored_runs(self):
+        with tempfile.TemporaryDirectory() as tmp, ResultStore(os.path.join(tmp, "results.db")) as store:
+            runs = []
+            for status in (NON_COMPLIANT, COMPLIANT):
+                run_id = store.start_run({"ACCESS.txt": {"required": []}}, None)
+                store.add_host(run_id, HostResult("sw01", False, None, [
+                    InterfaceResult("Gi1/0/1", "ACCESS", "ACCESS.txt", status, [], [], [])]))
+                store.finish_run(run_id)
+                runs.append(run_id)
+            delta, current, baseline, baseline_run, current_run = delta_between_runs(store, *runs)
+            self.assertEqual(delta['newly_fixed'], [("sw01", "Gi1/0/1")])
+            self.assertEqual((baseline_run['id'], current_run['id']), tuple(runs))
+            filename = write_delta_report(os.path.join(tmp, "delta.html"), delta, current, baseline,
+                                          baseline_run, current_run)
+            with open(filename) as f:
+                self.assertIn("Gi1/0/1", f.read())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,68 @@
+"""Parsing of "show interfaces description" for the interfaces fetch strategy"""
+import unittest
+
+from config_tree import INTERFACE_PATTERN, PORT_TYPES
+from interface_compliance_check import expand_interface_name, parse_interface_descriptions, unknown_interface_type
+
+DESCRIPTIONS = """\
+Interface                      Status         Protocol Description
+Vl1                            admin down     down
+Gi1/0/1                        up             up       ACCESS port
+Gi1/0/2                        down           down
+Te1/1/1                        up             up       UPLINK core
+Po1                            up             up       UPLINK
+"""
+
+
+class ParseInterfaceDescriptionsTest(unittest.TestCase):
+
+    def test_descriptions_by_full_name(self):
+        self.assertEqual(parse_interface_descriptions(DESCRIPTIONS), {
+            'Vlan1': None,
+            'GigabitEthernet1/0/1': 'ACCESS port',
+            'GigabitEthernet1/0/2': None,
+            'TenGigabitEthernet1/1/1': 'UPLINK core',
+            'Port-channel1': 'UPLINK',
+        })
+
+    def test_no_table_is_none(self):
+        self.assertIsNone(parse_interface_descriptions(""))
+        self.assertIsNone(parse_interface_descriptions("\n\n"))
+        self.assertIsNone(parse_interface_descriptions(
+            "                    ^\n% Invalid input detected at '^' marker."))
+        self.assertIsNone(parse_interface_descriptions("Gi1/0/1    up    up    ACCESS port\n"))
+        self.assertIsNone(parse_interface_descriptions(DESCRIPTIONS.splitlines()[0] + "\n\n"))
+
+
+class ExpandInterfaceNameTest(unittest.TestCase):
+
+    def test_abbreviations(self):
+        self.assertEqual(expand_interface_name("Gi1/0/1"), "GigabitEthernet1/0/1")
+        self.assertEqual(expand_interface_name("Twe1/0/1"), "TwentyFiveGigE1/0/1")
+        self.assertEqual(expand_interface_name("Tw1/0/1"), "TwoGigabitEthernet1/0/1")
+        self.assertEqual(expand_interface_name("Po10"), "Port-channel10")
+        self.assertEqual(expand_interface_name("Fi1/0/1"), "FiveGigabitEthernet1/0/1")
+        self.assertEqual(expand_interface_name("Hu1/0/49"), "HundredGigE1/0/49")
+
+    def test_every_short_port_name_expands_to_a_checked_port(self):
+        for name, short in PORT_TYPES:
+            self.assertTrue(INTERFACE_PATTERN.match(name + "1/0/1"), name)
+            self.assertTrue(INTERFACE_PATTERN.match(expand_interface_name(short + "1/0/1")), short)
+
+    def test_other_interfaces_are_not_checked(self):
+        for name in ("Vl10", "Lo0", "Tu1", "Vlan10", "Loopback0"):
+            self.assertFalse(INTERFACE_PATTERN.match(expand_interface_name(name)), name)
+            self.assertIsNone(unknown_interface_type(name))
+
+    def test_unknown_short_names(self):
+        self.assertEqual(unknown_interface_type("Xy1/0/1"), "Xy")
+        self.assertEqual(expand_interface_name("Xy1/0/1"), "Xy1/0/1")
+        self.assertIsNone(unknown_interface_type("Gi1/0/1"))
+        self.assertIsNone(unknown_interface_type("TwentyFiveGigE1/0/1"))
+
+    def test_full_names_are_kept(self):
+        self.assertEqual(expand_interface_name("GigabitEthernet1/0/1"), "GigabitEthernet1/0/1")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,96 @@
+"""interface range arguments of the missing config files"""
+import random
+import unittest
+
+from compliance_results import NON_COMPLIANT, InterfaceResult
+from interface_compliance_check import (MAX_INTERFACE_RANGES, expand_interface_ranges, format_interface_ranges,
+                                        pushed_interfaces, render_remediation)
+
+
+def expand_all(arguments):
+    return [name for argument in arguments for name in expand_interface_ranges(argument)]
+
+
+def interface(name, description=None):
+    return InterfaceResult(name, description, "ACCESS.txt", NON_COMPLIANT, [], [], [])
+
+
+class FormatInterfaceRangesTest(unittest.TestCase):
+
+    def test_consecutive_ports_become_one_range(self):
+        names = ["GigabitEthernet1/0/{}".format(port) for port in (1, 2, 3, 5, 7, 8)]
+        self.assertEqual(format_interface_ranges(names),
+                         ["GigabitEthernet1/0/1 - 3 , GigabitEthernet1/0/5 , GigabitEthernet1/0/7 - 8"])
+
+    def test_prefix_change_starts_a_new_range(self):
+        names = ["Gi1/0/48", "Gi2/0/1", "Gi2/0/2", "Te1/1/1", "Te1/1/2"]
+        self.assertEqual(format_interface_ranges(names), ["Gi1/0/48 , Gi2/0/1 - 2 , Te1/1/1 - 2"])
+
+    def test_at_most_max_ranges_per_argument(self):
+        names = ["Gi1/0/{}".format(port) for port in range(1, 24, 2)]
+        arguments = format_interface_ranges(names)
+        self.assertEqual(MAX_INTERFACE_RANGES, 5)
+        self.assertEqual([len(argument.split(",")) for argument in arguments], [5, 5, 2])
+        self.assertEqual(arguments[1], "Gi1/0/11 , Gi1/0/13 , Gi1/0/15 , Gi1/0/17 , Gi1/0/19")
+        self.assertEqual([len(argument.split(",")) for argument in format_interface_ranges(names, 3)],
+                         [3, 3, 3, 3])
+
+    def test_exactly_max_ranges_is_one_argument(self):
+        names = ["Gi1/0/{}".format(port) for port in (1, 3, 5, 7, 9)]
+        self.assertEqual(len(format_interface_ranges(names)), 1)
+        self.assertEqual(len(format_interface_ranges(names + ["Gi1/0/11"])), 2)
+
+    def test_names_without_a_number(self):
+        self.assertEqual(format_interface_ranges(["mgmt", "Gi1/0/1", "Gi1/0/2"]), ["mgmt , Gi1/0/1 - 2"])
+        self.assertEqual(format_interface_ranges([]), [])
+
+    def test_round_trip(self):
+        rng = random.Random(18)
+        prefixes = ["GigabitEthernet1/0/", "GigabitEthernet2/0/", "TenGigabitEthernet1/1/", "Port-channel"]
+        for _ in range(500):
+            names = ["{}{}".format(rng.choice(prefixes), rng.randint(1, 48)) for _ in range(rng.randint(1, 30))]
+            max_ranges = rng.randint(1, 8)
+            arguments = format_interface_ranges(names, max_ranges)
+            self.assertEqual(expand_all(arguments), names, (names, max_ranges))
+            self.assertTrue(all(len(argument.split(",")) <= max_ranges for argument in arguments))
+
+
+class RenderRemediationTest(unittest.TestCase):
+
+    def test_same_lines_are_grouped(self):
+        blocks = [(interface("Gi1/0/1", "PC 1"), [" switchport mode access"]),
+                  (interface("Gi1/0/2", "PC 2"), [" switchport mode access"]),
+                  (interface("Gi1/0/3", "AP 1"), [" spanning-tree portfast"])]
+        self.assertEqual(render_remediation(blocks, interface_ranges=True), [
+            "interface range Gi1/0/1 - 2",
+            " switchport mode access",
+            "!",
+            "interface Gi1/0/3",
+            " description AP 1",
+            " spanning-tree portfast",
+            "!",
+        ])
+
+    def test_cap_splits_the_group(self):
+        blocks = [(interface("Gi1/0/{}".format(port)), [" shutdown"]) for port in range(1, 14, 2)]
+        lines = render_remediation(blocks, interface_ranges=True, max_ranges=5)
+        self.assertEqual([line for line in lines if line.startswith("interface")], [
+            "interface range Gi1/0/1 , Gi1/0/3 , Gi1/0/5 , Gi1/0/7 , Gi1/0/9",
+            "interface range Gi1/0/11 , Gi1/0/13",
+        ])
+        self.assertEqual(pushed_interfaces(lines), [intf.name for intf, _ in blocks])
+
+    def test_pushed_interfaces_match_the_blocks(self):
+        rng = random.Random(19)
+        for _ in range(100):
+            ports = sorted(rng.sample(range(1, 49), rng.randint(1, 20)))
+            blocks = [(interface("Gi1/0/{}".format(port)), [rng.choice([" shutdown", " cdp enable"])])
+                      for port in ports]
+            expected = sorted(intf.name for intf, _ in blocks)
+            for interface_ranges in (False, True):
+                lines = render_remediation(blocks, interface_ranges)
+                self.assertEqual(sorted(pushed_interfaces(lines)), expected)
+
+
+if __name__ == "__main__":
+    unittest.main()
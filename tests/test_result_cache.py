@@ -0,0 +1,80 @@
+"""Hit and miss counting of the result cache and the hashes of streamed configs"""
+import os
+import tempfile
+import threading
+import unittest
+
+from result_cache import LineHasher, ResultCache, config_hash
+
+CONFIG = "hostname sw01\n!\ninterface GigabitEthernet1/0/1\n description ACCESS\n switchport mode access\n!\nend\n"
+
+
+class ResultCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.cache = ResultCache(os.path.join(self.tmp.name, "cache.json"), "fingerprint")
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_lookup_counts_hits_and_misses(self):
+        digest = config_hash(CONFIG)
+        self.assertIsNone(self.cache.lookup("sw01", digest))
+        self.cache.store("sw01", digest, {'host': "sw01"})
+        self.assertEqual(self.cache.lookup("sw01", digest), {'host': "sw01"})
+        self.assertIsNone(self.cache.lookup("sw01", config_hash(CONFIG + "vlan 10\n")))
+        self.assertEqual((self.cache.hits, self.cache.misses), (1, 2))
+
+    def test_store_without_lookup_counts_a_miss(self):
+        self.cache.store("sw01", config_hash(CONFIG), {}, miss=True)
+        self.cache.store("sw02", config_hash(CONFIG), {})
+        self.assertEqual((self.cache.hits, self.cache.misses), (0, 1))
+
+    def test_misses_from_many_threads(self):
+        def store(index):
+            for number in range(500):
+                self.cache.store("sw{}-{}".format(index, number), "digest", {}, miss=True)
+
+        threads = [threading.Thread(target=store, args=(index,)) for index in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(self.cache.misses, 4000)
+        self.assertEqual(len(self.cache.entries), 4000)
+
+    def test_saved_entries_are_reused(self):
+        digest = config_hash(CONFIG)
+        self.cache.store("sw01", digest, {'host': "sw01"}, miss=True)
+        self.cache.save()
+        cache = ResultCache(self.cache.path, "fingerprint").load()
+        self.assertEqual(cache.lookup("sw01", digest), {'host': "sw01"})
+        self.assertIsNone(ResultCache(self.cache.path, "other templates").load().lookup("sw01", digest))
+
+
+class LineHasherTest(unittest.TestCase):
+
+    def hash_lines(self, lines):
+        hasher = LineHasher(iter(lines))
+        self.assertEqual(list(hasher), lines)
+        return hasher
+
+    def test_streamed_lines_hash_like_the_config(self):
+        expected = config_hash(CONFIG)
+        self.assertEqual(self.hash_lines(CONFIG.splitlines()).hexdigest(), expected)
+        self.assertEqual(self.hash_lines(CONFIG.splitlines(True)).hexdigest(), expected)
+        self.assertEqual(self.hash_lines(CONFIG.replace("\n", "\r\n").splitlines(True)).hexdigest(), expected)
+        self.assertEqual(self.hash_lines(CONFIG.splitlines() + ["", ""]).hexdigest(), expected)
+
+    def test_inner_empty_lines_count(self):
+        config = "hostname sw01\n\ninterface Vlan1\n"
+        self.assertEqual(self.hash_lines(config.splitlines()).hexdigest(), config_hash(config))
+        self.assertNotEqual(config_hash(config), config_hash(config.replace("\n\n", "\n")))
+
+    def test_bytes(self):
+        self.assertEqual(self.hash_lines(CONFIG.splitlines()).bytes, len(CONFIG.encode('utf-8')))
+
+
+if __name__ == "__main__":
+    unittest.main()
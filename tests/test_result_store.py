@@ -0,0 +1,65 @@
+"""Pruning of the result store"""
+import os
+import tempfile
+import unittest
+
+from compliance_results import COMPLIANT, NON_COMPLIANT, HostResult, InterfaceResult
+from result_store import ResultStore
+
+DAY = 24 * 3600
+NOW = 1000 * DAY
+
+
+def host_result(host, *interfaces):
+    return HostResult(host, False, None, [
+        InterfaceResult(name, "ACCESS", "ACCESS.txt", status, ["switchport"] if status == NON_COMPLIANT else [], [], [])
+        for name, status in interfaces])
+
+
+class PruneTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.store = ResultStore(os.path.join(self.tmp.name, "results.db")).open()
+
+    def tearDown(self):
+        self.store.close()
+        self.tmp.cleanup()
+
+    def add_run(self, at, *host_results):
+        run_id = self.store.start_run({}, None, started_at=at)
+        for result in host_results:
+            self.store.add_host(run_id, result, checked_at=at)
+        self.store.finish_run(run_id, finished_at=at)
+        return run_id
+
+    def state(self):
+        return sorted(self.store._db.execute("SELECT host, interface, status FROM interface_state"))
+
+    def test_state_of_ports_only_in_pruned_runs_is_deleted(self):
+        # sw02 and Gi1/0/2 of sw01 are only in the old run
+        self.add_run(NOW - 100 * DAY, host_result("sw01", ("Gi1/0/1", NON_COMPLIANT), ("Gi1/0/2", NON_COMPLIANT)),
+                     host_result("sw02", ("Gi1/0/1", NON_COMPLIANT)))
+        self.add_run(NOW - DAY, host_result("sw01", ("Gi1/0/1", NON_COMPLIANT)))
+        self.assertEqual(len(self.state()), 3)
+
+        self.assertEqual(self.store.prune(90, now=NOW), 1)
+        self.assertEqual(self.state(), [("sw01", "Gi1/0/1", NON_COMPLIANT)])
+        self.assertEqual(self.store._db.execute("SELECT COUNT(*) FROM interface_results").fetchone()[0], 1)
+
+    def test_status_since_survives_pruning(self):
+        self.add_run(NOW - 100 * DAY, host_result("sw01", ("Gi1/0/1", NON_COMPLIANT)))
+        self.add_run(NOW - DAY, host_result("sw01", ("Gi1/0/1", NON_COMPLIANT)))
+        self.store.prune(90, now=NOW)
+        since = self.store.non_compliant_since(30, now=NOW)
+        self.assertEqual([(row['host'], row['interface'], row['since']) for row in since],
+                         [("sw01", "Gi1/0/1", NOW - 100 * DAY)])
+
+    def test_nothing_to_prune(self):
+        self.add_run(NOW - DAY, host_result("sw01", ("Gi1/0/1", COMPLIANT)))
+        self.assertEqual(self.store.prune(90, now=NOW), 0)
+        self.assertEqual(self.state(), [("sw01", "Gi1/0/1", COMPLIANT)])
+
+
+if __name__ == "__main__":
+    unittest.main()
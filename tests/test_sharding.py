@@ -0,0 +1,98 @@
+"""Bounded-load rendezvous partitioning of sharding.py"""
+import json
+import os
+import random
+import tempfile
+import unittest
+from collections import Counter
+
+from sharding import (SHARD_SLACK, assign_shards, load_weights, missing_shards, parse_shard, shard_hosts,
+                      shard_label, shard_of_source)
+
+HOSTS = ["sw{:04d}".format(index) for index in range(1000)]
+
+
+def weighted_loads(assignment, weights):
+    loads = Counter()
+    for host, shard in assignment.items():
+        loads[shard] += weights[host]
+    return loads
+
+
+class AssignShardsTest(unittest.TestCase):
+
+    def test_every_host_once(self):
+        assignment = assign_shards(HOSTS + HOSTS[:10], 4)
+        self.assertEqual(sorted(assignment), HOSTS)
+        self.assertEqual(set(assignment.values()), {1, 2, 3, 4})
+        self.assertEqual(set().union(*(shard_hosts(HOSTS, (index, 4)) for index in range(1, 5))), set(HOSTS))
+
+    def test_independent_of_the_host_order(self):
+        shuffled = list(HOSTS)
+        random.Random(24).shuffle(shuffled)
+        self.assertEqual(assign_shards(shuffled, 7), assign_shards(HOSTS, 7))
+
+    def test_single_shard(self):
+        self.assertEqual(set(assign_shards(HOSTS, 1).values()), {1})
+
+    def test_capacity_slack(self):
+        for count in (2, 3, 7, 16):
+            loads = Counter(assign_shards(HOSTS, count).values())
+            capacity = (1 + SHARD_SLACK) * len(HOSTS) / count
+            self.assertLessEqual(max(loads.values()), capacity + 1, count)
+
+    def test_weighted_capacity_slack(self):
+        rng = random.Random(24)
+        weights = {host: rng.uniform(1, 60) for host in HOSTS}
+        for count in (2, 5, 12):
+            loads = weighted_loads(assign_shards(HOSTS, count, weights), weights)
+            capacity = (1 + SHARD_SLACK) * sum(weights.values()) / count
+            self.assertLessEqual(max(loads.values()), capacity + max(weights.values()), count)
+
+    def test_hosts_without_weight_count_as_the_average(self):
+        weights = {host: 10.0 for host in HOSTS[:500]}
+        loads = Counter(assign_shards(HOSTS, 4, weights).values())
+        self.assertLessEqual(max(loads.values()), (1 + SHARD_SLACK) * len(HOSTS) / 4 + 1)
+
+    def test_adding_a_shard_moves_hosts_only_to_it(self):
+        before, after = assign_shards(HOSTS, 4), assign_shards(HOSTS, 5)
+        moved = [host for host in HOSTS if before[host] != after[host]]
+        self.assertLessEqual(len(moved), 1.1 * len(HOSTS) / 5)
+        self.assertLessEqual(sum(after[host] != 5 for host in moved), len(HOSTS) // 100)
+
+    def test_adding_a_host_moves_few_hosts(self):
+        before = assign_shards(HOSTS, 4)
+        after = assign_shards(HOSTS + ["sw9999"], 4)
+        self.assertLessEqual(sum(before[host] != after[host] for host in HOSTS), len(HOSTS) // 100)
+
+
+class ShardHelpersTest(unittest.TestCase):
+
+    def test_parse_shard(self):
+        self.assertEqual(parse_shard("2/4"), (2, 4))
+        self.assertEqual(parse_shard(" 1 / 1 "), (1, 1))
+        for value in ("0/4", "5/4", "2", "a/b", "2/4/6"):
+            with self.assertRaises(ValueError):
+                parse_shard(value)
+
+    def test_label_round_trip(self):
+        self.assertEqual(shard_of_source("inventory " + shard_label((3, 8))), (3, 8))
+        self.assertIsNone(shard_of_source("inventory"))
+        self.assertIsNone(shard_of_source(None))
+
+    def test_missing_shards(self):
+        self.assertEqual(missing_shards([(1, 4), (3, 4)]), ([2, 4], [4]))
+        self.assertEqual(missing_shards([(1, 2), (2, 2)]), ([], [2]))
+        self.assertEqual(missing_shards([(1, 2), (2, 3)]), ([], [2, 3]))
+
+    def test_load_weights(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            filename = os.path.join(tmp, "host_metrics.jsonl")
+            with open(filename, 'w') as f:
+                f.write(json.dumps({'host': "sw01", 'phases': {'connect': 1.5, 'fetch': 2.0}}) + "\n\n")
+                f.write(json.dumps({'host': "sw02"}) + "\n")
+            self.assertEqual(load_weights(filename), {"sw01": 3.5, "sw02": 0})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,166 @@
+"""The compiled TemplateMatcher against the nested startswith loops it replaced, and the TemplateResolver"""
+import random
+import unittest
+
+from benchmarks.bench_template_matcher import legacy_check_interface_compliance
+from template_matcher import TemplateMatcher, TemplateResolver
+
+# Commands that are prefixes of each other, so the first match in template order decides
+VOCABULARY = [
+    "switchport",
+    "switchport mode access",
+    "switchport mode trunk",
+    "switchport access vlan 10",
+    "switchport access vlan 100",
+    "spanning-tree portfast",
+    "spanning-tree portfast edge",
+    "spanning-tree bpduguard enable",
+    "ip dhcp snooping trust",
+    "ip arp inspection trust",
+    "cdp enable",
+    "shutdown",
+    "storm-control broadcast level 1.00",
+    "service-policy input QOS(IN)",
+    "authentication port-control auto",
+]
+
+
+def legacy(lines, required, allowed):
+    missing, unexpected, to_remove = legacy_check_interface_compliance("\n".join(lines), required, allowed)
+    return sorted(missing), unexpected, to_remove
+
+
+def compiled(lines, required, allowed):
+    missing, unexpected, to_remove = TemplateMatcher(required, allowed).evaluate(lines)
+    return sorted(missing), unexpected, to_remove
+
+
+class TemplateMatcherTest(unittest.TestCase):
+
+    def test_first_required_command_in_template_order_wins(self):
+        matcher = TemplateMatcher(["switchport", "switchport mode access"])
+        # "switchport mode access" also starts with "switchport", so it is never found
+        self.assertEqual(matcher.evaluate([" switchport mode access"]), (["switchport mode access"], [], []))
+        matcher = TemplateMatcher(["switchport mode access", "switchport"])
+        self.assertEqual(matcher.evaluate([" switchport mode access", " switchport"]), ([], [], []))
+
+    def test_prefix_match(self):
+        matcher = TemplateMatcher(["switchport access vlan"], ["spanning-tree"])
+        self.assertEqual(matcher.evaluate(["switchport access vlan 10", "spanning-tree portfast edge"]),
+                         ([], [], []))
+
+    def test_allowed_only_when_no_required_command_matches(self):
+        matcher = TemplateMatcher(["switchport mode access"], ["switchport"])
+        self.assertEqual(matcher.evaluate(["switchport mode access", "switchport nonegotiate"]), ([], [], []))
+
+    def test_commands_to_remove(self):
+        matcher = TemplateMatcher(["switchport mode access", "-cdp enable", "-shutdown"])
+        self.assertEqual(matcher.evaluate(["switchport mode access", "cdp enable", "shutdown", "cdp enable"]),
+                         ([], [], ["cdp enable", "shutdown", "cdp enable"]))
+
+    def test_remove_and_required_both_count(self):
+        matcher = TemplateMatcher(["spanning-tree portfast", "-spanning-tree portfast edge"])
+        self.assertEqual(matcher.evaluate(["spanning-tree portfast edge"]), ([], [], ["spanning-tree portfast edge"]))
+
+    def test_missing_in_template_order(self):
+        matcher = TemplateMatcher(["switchport mode access", "cdp enable", "shutdown", "cdp enable"])
+        self.assertEqual(matcher.evaluate([]), (["switchport mode access", "cdp enable", "shutdown"], [], []))
+
+    def test_interface_and_empty_lines_are_ignored(self):
+        matcher = TemplateMatcher(["shutdown"])
+        self.assertEqual(matcher.evaluate(["interface GigabitEthernet1/0/1", "", "  ", " shutdown"]), ([], [], []))
+
+    def test_regex_characters_are_literal(self):
+        matcher = TemplateMatcher(["service-policy input QOS(IN)"], ["storm-control broadcast level 1.00"])
+        self.assertEqual(matcher.evaluate(["service-policy input QOS(IN)", "storm-control broadcast level 1x00"]),
+                         ([], ["storm-control broadcast level 1x00"], []))
+
+    def test_same_result_as_the_nested_loops(self):
+        rng = random.Random(4)
+        for _ in range(2000):
+            required = rng.sample(VOCABULARY, rng.randint(0, 6))
+            required = [("-" + cmd if rng.random() < 0.2 else cmd) for cmd in required]
+            allowed = rng.sample(VOCABULARY, rng.randint(0, 3))
+            lines = [" " + rng.choice(VOCABULARY) + rng.choice(["", "", " extra"]) for _ in range(rng.randint(0, 10))]
+            self.assertEqual(compiled(lines, required, allowed), legacy(lines, required, allowed),
+                             (required, allowed, lines))
+
+    def test_restored_matcher_gives_the_same_results(self):
+        rng = random.Random(5)
+        for _ in range(200):
+            required = rng.sample(VOCABULARY, 5) + ["-" + rng.choice(VOCABULARY)]
+            allowed = rng.sample(VOCABULARY, 2)
+            matcher = TemplateMatcher(required, allowed, name="t.txt")
+            restored = TemplateMatcher.from_dict(matcher.to_dict())
+            lines = [rng.choice(VOCABULARY) + rng.choice(["", " 2"]) for _ in range(8)]
+            self.assertEqual(restored.evaluate(lines), matcher.evaluate(lines))
+            self.assertEqual(restored.to_dict(), matcher.to_dict())
+
+
+def resolve_by_scanning(names, description):
+    """Reference: exact name, else the longest name contained in the description, ties alphabetically"""
+    if not description:
+        return None
+    if description + ".txt" in names:
+        return description + ".txt"
+    contained = [name for name in names if name[:-len(".txt")] in description]
+    return min(contained, key=lambda name: (-len(name), name)) if contained else None
+
+
+class TemplateResolverTest(unittest.TestCase):
+
+    def resolver(self, *names):
+        return TemplateResolver({name: TemplateMatcher([], name=name) for name in names})
+
+    def test_exact_name_wins(self):
+        resolver = self.resolver("AP.txt", "AP-uplink.txt", "uplink.txt")
+        self.assertEqual(resolver.resolve_name("AP"), "AP.txt")
+        self.assertEqual(resolver.resolve_name("uplink"), "uplink.txt")
+
+    def test_longest_contained_name_wins(self):
+        resolver = self.resolver("AP.txt", "AP-uplink.txt", "uplink.txt")
+        self.assertEqual(resolver.resolve_name("to AP-uplink 3"), "AP-uplink.txt")
+        self.assertEqual(resolver.resolve_name("APs of floor 2"), "AP.txt")
+
+    def test_ties_are_broken_alphabetically(self):
+        resolver = self.resolver("wlan.txt", "voip.txt", "core.txt")
+        self.assertEqual(resolver.resolve_name("wlan and voip"), "voip.txt")
+        self.assertEqual(resolver.resolve_name("voip wlan"), "voip.txt")
+
+    def test_no_match(self):
+        resolver = self.resolver("AP.txt")
+        self.assertIsNone(resolver.resolve_name("printer"))
+        self.assertIsNone(resolver.resolve_name(None))
+        self.assertIsNone(resolver.resolve_name(""))
+        self.assertIsNone(resolver.resolve("printer"))
+
+    def test_resolve_returns_the_matcher(self):
+        resolver = self.resolver("AP.txt")
+        self.assertIs(resolver.resolve("AP 1"), resolver.templates["AP.txt"])
+
+    def test_overlapping_names(self):
+        resolver = self.resolver("aab.txt", "ab.txt", "b.txt", "abc.txt")
+        for description in ("aabc", "xab", "aab", "zb", "abcab"):
+            self.assertEqual(resolver.resolve_name(description),
+                             resolve_by_scanning(resolver.templates, description), description)
+
+    def test_same_result_as_scanning_every_name(self):
+        rng = random.Random(5)
+        alphabet = "abc-"
+        for _ in range(200):
+            names = {"".join(rng.choice(alphabet) for _ in range(rng.randint(1, 4))) + ".txt" for _ in range(6)}
+            resolver = self.resolver(*names)
+            for _ in range(20):
+                description = "".join(rng.choice(alphabet) for _ in range(rng.randint(0, 10)))
+                self.assertEqual(resolver.resolve_name(description), resolve_by_scanning(names, description),
+                                 (sorted(names), description))
+
+    def test_memo_is_bounded(self):
+        resolver = TemplateResolver({"AP.txt": TemplateMatcher([], name="AP.txt")}, memo_size=4)
+        for index in range(10):
+            self.assertEqual(resolver.resolve_name("AP {}".format(index)), "AP.txt")
+        self.assertLessEqual(len(resolver._memo), 4)
+
+
+if __name__ == "__main__":
+    unittest.main()